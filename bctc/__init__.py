@@ -0,0 +1,100 @@
+"""Thư viện phân tích Báo cáo Tài chính (BĐKT, KQKD, LCTT) dùng chung cho app Streamlit và batch job.
+
+Không import Streamlit ở bất kỳ module nào trong gói này. Phần gọi Gemini nằm ở
+``bctc.ai`` và không được import sẵn để job batch không cần ``google-genai``; tương tự,
+xuất báo cáo .docx (``bctc.report``) cần ``docxtpl``.
+"""
+from .answers import AnswerCache
+from .batch import analyze_portfolio
+from .context import build_chat_context, build_compact_context, estimate_tokens, format_col_name
+from .engine import (
+    build_statement_indexes,
+    compute_financial_ratios,
+    period_changes,
+    filter_zero_rows,
+    get_value,
+    process_cash_flow,
+    process_financial_data,
+    safe_div,
+)
+from .formatting import (
+    format_table,
+    format_vn_currency,
+    format_vn_delta_currency,
+    format_vn_delta_ratio,
+    format_vn_percentage,
+)
+from .incremental import IncrementalAnalysis, apply_edits
+from .index import CASH_FLOW_ALIASES, LINE_ITEM_ALIASES, LineItemIndex, normalize_label
+from .ingest import (
+    CASH_FLOW_KEYWORD,
+    MIN_PERIODS,
+    SPLIT_KEYWORD,
+    YEARS,
+    InsufficientPeriodsError,
+    ParsedStatements,
+    parse_statements,
+    parse_workbook,
+    period_columns,
+    period_names,
+)
+from .narrative import offline_analysis
+from .retrieval import BM25Index, LineItemRetriever
+from .pipeline import ENGINE_VERSION, AnalysisResult, analyze_statements, analyze_workbook
+from .cache import ResultCache, analyze_bytes_cached
+from .sheets import EntitySheets, SheetInfo, analyze_entities, compare_entities, discover_entities
+from .telemetry import Recorder, span
+
+__all__ = [
+    "CASH_FLOW_ALIASES",
+    "CASH_FLOW_KEYWORD",
+    "ENGINE_VERSION",
+    "LINE_ITEM_ALIASES",
+    "MIN_PERIODS",
+    "SPLIT_KEYWORD",
+    "YEARS",
+    "AnalysisResult",
+    "AnswerCache",
+    "BM25Index",
+    "EntitySheets",
+    "IncrementalAnalysis",
+    "InsufficientPeriodsError",
+    "LineItemIndex",
+    "LineItemRetriever",
+    "ParsedStatements",
+    "Recorder",
+    "ResultCache",
+    "SheetInfo",
+    "analyze_bytes_cached",
+    "analyze_entities",
+    "analyze_portfolio",
+    "analyze_statements",
+    "analyze_workbook",
+    "apply_edits",
+    "build_chat_context",
+    "build_compact_context",
+    "build_statement_indexes",
+    "compare_entities",
+    "compute_financial_ratios",
+    "discover_entities",
+    "estimate_tokens",
+    "filter_zero_rows",
+    "format_col_name",
+    "format_table",
+    "format_vn_currency",
+    "format_vn_delta_currency",
+    "format_vn_delta_ratio",
+    "format_vn_percentage",
+    "get_value",
+    "normalize_label",
+    "offline_analysis",
+    "parse_statements",
+    "parse_workbook",
+    "period_changes",
+    "period_columns",
+    "period_names",
+    "process_cash_flow",
+    "process_financial_data",
+    "safe_div",
+    "span",
+]
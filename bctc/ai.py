@@ -0,0 +1,403 @@
+"""Gọi Gemini API: nhận xét tổng quan (single-shot) và Chatbot có lịch sử.
+
+Các hàm stream_* trả về generator các đoạn văn bản (dùng với st.write_stream) để
+người dùng thấy chữ ngay khi token đầu tiên về. Lỗi giữa chừng không làm mất phần
+đã nhận: thông báo lỗi được nối thêm vào cuối như một đoạn cuối cùng.
+Các hàm get_* giữ nguyên giao diện cũ (trả về toàn bộ chuỗi).
+
+Client Gemini được tạo một lần cho mỗi API key và dùng chung trong cả process
+(mọi session Streamlit, batch job): kết nối HTTP được giữ lại (keep-alive) nên các
+lượt chat sau không phải bắt tay TCP/TLS lại. Số request đồng thời tới Gemini bị
+giới hạn bởi một semaphore chung.
+
+Câu trả lời hoàn chỉnh (không lỗi) được lưu vào AnswerCache (bctc.answers): câu hỏi
+lặp lại trên cùng dữ liệu trả về ngay mà không gọi Gemini.
+
+Nhận xét theo từng phần (bctc.sections) được gửi song song bằng asyncio
+(analyze_sections_async): thời gian chờ xấp xỉ phần chậm nhất thay vì tổng các phần.
+Phần nào lỗi API được thay bằng nhận xét tự động theo quy tắc (bctc.narrative).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+from google import genai
+from google.genai import types
+from google.genai.errors import APIError
+
+from .answers import answer_key, get_answer_cache
+from .context import estimate_tokens
+from .history import ConversationMemory
+from .narrative import describe_sections
+from .retrieval import LineItemRetriever
+from .sections import build_sections
+from .telemetry import span
+
+MODEL_NAME = 'gemini-2.5-flash'
+
+# --- Cấu hình kết nối (đọc từ biến môi trường) ---
+TIMEOUT_S = float(os.environ.get('BCTC_GEMINI_TIMEOUT_S', 120))
+KEEPALIVE_S = float(os.environ.get('BCTC_GEMINI_KEEPALIVE_S', 60))
+MAX_CONCURRENCY = int(os.environ.get('BCTC_GEMINI_MAX_CONCURRENCY', 8))
+# Nhận xét theo phần: số phần gửi đồng thời, số lần thử lại khi lỗi tạm thời (429/5xx)
+SECTION_CONCURRENCY = int(os.environ.get('BCTC_SECTION_CONCURRENCY', 4))
+SECTION_RETRIES = int(os.environ.get('BCTC_SECTION_RETRIES', 3))
+RETRY_BACKOFF_S = float(os.environ.get('BCTC_RETRY_BACKOFF_S', 1.0))
+# Ghi đè endpoint, vd. mock server trong benchmarks/mock_gemini_server.py
+BASE_URL = os.environ.get('BCTC_GEMINI_BASE_URL') or None
+
+_clients = {}
+_clients_lock = threading.Lock()
+_request_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+SLOT_POLL_S = 0.1  # Nhận xét theo phần: chu kỳ kiểm tra task đã bị hủy khi đang chờ _request_slots
+
+
+def new_client(api_key, base_url=BASE_URL, timeout_s=TIMEOUT_S):
+    """Tạo genai.Client mới với timeout và connection pool keep-alive (cả client đồng bộ lẫn client.aio)."""
+    limits = httpx.Limits(
+        max_connections=MAX_CONCURRENCY,
+        max_keepalive_connections=MAX_CONCURRENCY,
+        keepalive_expiry=KEEPALIVE_S,
+    )
+    http_options = types.HttpOptions(
+        base_url=base_url,
+        timeout=int(timeout_s * 1000),  # mili giây
+        client_args={'limits': limits},
+        async_client_args={'limits': limits},
+    )
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+def get_client(api_key, base_url=BASE_URL):
+    """Client dùng chung cho cả process, tạo một lần cho mỗi (API key, endpoint)."""
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = new_client(api_key, base_url=base_url)
+        return client
+
+
+# Tương thích cao nhất: System Instruction được truyền bằng cách ghép vào User Prompt
+
+def build_analysis_prompt(data_for_ai):
+    """Prompt cho nhận xét tổng quan (System Instruction ghép vào User Prompt)."""
+    # [CẬP NHẬT] System Instruction (Bổ sung đơn vị tính là triệu đồng)
+    system_instruction_text = (
+        "Bạn là một chuyên gia phân tích tài chính chuyên nghiệp. Chú ý: Tất cả các số liệu tiền tệ trong dữ liệu được cung cấp đều có đơn vị tính là **triệu đồng**. Hãy luôn đề cập đến đơn vị này khi trả lời các câu hỏi về số liệu tài chính cụ thể. "
+        "Dựa trên dữ liệu đã cung cấp, hãy đưa ra một nhận xét khách quan, ngắn gọn (khoảng 3-4 đoạn) về tình hình tài chính của doanh nghiệp. "
+        "Đánh giá tập trung vào tốc độ tăng trưởng, thay đổi cơ cấu tài sản, **tỷ trọng chi phí/doanh thu thuần**, **hiệu quả hoạt động (Vòng quay Tồn kho, Phải thu, Vốn lưu động)**, **cấu trúc vốn (Hệ số tự tài trợ và Hệ số nợ/VCSH)**, và **khả năng sinh lời (ROS, ROA, ROE)** qua các năm/kỳ."
+    )
+
+    return f"""
+        {system_instruction_text}
+
+        Dữ liệu thô và chỉ số:<br>
+        {data_for_ai}
+        """
+
+
+def build_chat_request(prompt, chat_history_st, context_data, memory=None):
+    """Lịch sử chat Streamlit + System Instruction + câu hỏi mới -> (`contents` cho Gemini, số đo prompt).
+
+    Chỉ `memory.max_turns` lượt gần nhất được gửi nguyên văn; các lượt cũ hơn được gộp vào
+    bản tóm tắt của `memory` (ConversationMemory, giữ qua các lượt). `memory=None` dùng một
+    ConversationMemory mới với cấu hình mặc định.
+
+    `context_data` là chuỗi bối cảnh dựng sẵn, hoặc một LineItemRetriever: khi đó chỉ các dòng
+    liên quan tới câu hỏi (cùng dòng tổng cộng và bảng hệ số tài chính) được gửi đi.
+    """
+    if memory is None:
+        memory = ConversationMemory()
+    if isinstance(context_data, LineItemRetriever):
+        with span('chat_retrieval') as s:
+            context_data = context_data.context_for(prompt)
+            s.attrs['chars'] = len(context_data)
+
+    # 1. Định nghĩa System Instruction
+    # [CẬP NHẬT] System Instruction (Bổ sung đơn vị tính là triệu đồng)
+    system_instruction_text = (
+        "Bạn là một trợ lý phân tích tài chính thông minh (Financial Analyst Assistant). "
+        "Chú ý: Tất cả các số liệu tiền tệ trong dữ liệu được cung cấp đều có đơn vị tính là **triệu đồng**. Hãy luôn đề cập đến đơn vị này khi trả lời các câu hỏi về số liệu tài chính cụ thể (ví dụ: 'Tổng tài sản là 31.286 triệu đồng'). "
+        "Bạn phải trả lời các câu hỏi của người dùng dựa trên dữ liệu tài chính đã xử lý sau. "
+        "Dữ liệu này bao gồm tốc độ tăng trưởng, so sánh tuyệt đối/tương đối, tỷ trọng cơ cấu, tỷ trọng chi phí/doanh thu thuần, và **các chỉ số tài chính chủ chốt (Thanh toán, Hoạt động, Cấu trúc Vốn, Sinh lời)** qua các kỳ Báo cáo tài chính. "
+        "Nếu người dùng hỏi một câu không liên quan đến dữ liệu tài chính hoặc phân tích, hãy lịch sự từ chối trả lời. "
+        "Dữ liệu tài chính đã xử lý (dạng bảng CSV gọn, phân cách bằng dấu ';', ý nghĩa mã cột ghi ở đầu dữ liệu): \n\n" + context_data
+    )
+
+    # 2. Lịch sử (bỏ lời chào và câu hỏi đang gửi nếu UI đã thêm vào): N lượt cuối nguyên văn, phần còn lại tóm tắt
+    history = list(chat_history_st[1:])
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == prompt:
+        history = history[:-1]
+    recent = memory.window(history)
+
+    # Chuyển đổi lịch sử Streamlit sang định dạng Gemini
+    gemini_history = []
+    for msg in recent:
+        role = "user" if msg["role"] == "user" else "model"
+        gemini_history.append({"role": role, "parts": [{"text": msg["content"]}]})
+
+    # 3. Ghép System Instruction, tóm tắt hội thoại cũ và Prompt mới nhất vào Content cuối cùng
+    summary = memory.summary
+    summary_block = f"Tóm tắt các lượt hỏi đáp trước đó:\n{summary}\n\n        ---\n" if summary else ""
+    final_prompt = f"""
+        {system_instruction_text}
+
+        ---
+        {summary_block}
+        Câu hỏi của người dùng: {prompt}
+        """
+
+    gemini_history.append({"role": "user", "parts": [{"text": final_prompt}]})
+
+    metrics = {
+        'context_tokens': estimate_tokens(system_instruction_text),
+        'summary_tokens': estimate_tokens(summary),
+        'history_tokens': sum(estimate_tokens(msg["content"]) for msg in recent),
+        'question_tokens': estimate_tokens(prompt),
+        'history_messages': len(recent),
+        'summarized_messages': memory.folded,
+    }
+    # Khóa cache câu trả lời: bối cảnh thực gửi đi (sau truy xuất) + câu hỏi + model
+    metrics['answer_key'] = answer_key('chat', context_data, prompt, MODEL_NAME)
+    metrics['total_tokens'] = sum(estimate_tokens(part["text"]) for item in gemini_history for part in item["parts"])
+    return gemini_history, metrics
+
+
+def build_chat_contents(prompt, chat_history_st, context_data, memory=None):
+    """Chỉ phần `contents` của build_chat_request."""
+    return build_chat_request(prompt, chat_history_st, context_data, memory)[0]
+
+
+def _stream_text(api_key, contents, client=None, on_complete=None):
+    """Gọi generate_content_stream và yield từng đoạn văn bản; lỗi -> yield thông báo lỗi (giữ phần đã nhận).
+
+    `client=None` dùng client chung của process (get_client). `on_complete(văn bản)` chỉ được
+    gọi khi câu trả lời về đủ, không lỗi.
+    """
+    received = False
+    chunks = []
+    if not _request_slots.acquire(timeout=TIMEOUT_S):
+        yield "Lỗi gọi Gemini API: Hệ thống đang có quá nhiều yêu cầu đồng thời, vui lòng thử lại sau."
+        return
+    try:
+        with span('gemini_stream', model=MODEL_NAME) as s:
+            start = time.perf_counter()
+            client = client or get_client(api_key)
+            for chunk in client.models.generate_content_stream(model=MODEL_NAME, contents=contents):
+                if chunk.text:
+                    if not received:
+                        s.attrs['first_token_ms'] = round((time.perf_counter() - start) * 1000, 1)
+                    received = True
+                    chunks.append(chunk.text)
+                    yield chunk.text
+            s.attrs['chars'] = sum(len(chunk) for chunk in chunks)
+        if received and on_complete is not None:
+            on_complete("".join(chunks))
+    except APIError as e:
+        yield _partial_prefix(received) + f"Lỗi gọi Gemini API: Vui lòng kiểm tra Khóa API hoặc giới hạn sử dụng. Chi tiết lỗi: {e}"
+    except KeyError:
+        yield _partial_prefix(received) + "Lỗi: Không tìm thấy Khóa API 'GEMINI_API_KEY'."
+    except Exception as e:
+        yield _partial_prefix(received) + f"Đã xảy ra lỗi không xác định: {e}"
+    finally:
+        _request_slots.release()
+
+
+def _cached_text(api_key, contents, client, cache, key):
+    """Câu trả lời từ `cache` nếu có; nếu không thì stream từ Gemini và lưu lại khi hoàn tất."""
+    answer = cache.get(key)
+    if answer is not None:
+        return iter([answer])
+    return _stream_text(api_key, contents, client, on_complete=lambda text: cache.put(key, text))
+
+
+def _partial_prefix(received):
+    # Tách thông báo lỗi khỏi phần trả lời đã nhận được trước đó
+    return "\n\n---\n\n⚠️ Câu trả lời bị gián đoạn. " if received else ""
+
+
+# --- Hàm gọi API Gemini cho Phân tích Báo cáo (Single-shot analysis) ---
+def stream_ai_analysis(data_for_ai, api_key, client=None, cache=None):
+    """Gửi dữ liệu phân tích đến Gemini API và stream nhận xét theo từng đoạn.
+
+    `cache=None` dùng AnswerCache chung của process (get_answer_cache).
+    """
+    cache = cache or get_answer_cache()
+    key = answer_key('analysis', data_for_ai, '', MODEL_NAME)
+    return _cached_text(api_key, build_analysis_prompt(data_for_ai), client, cache, key)
+
+
+def get_ai_analysis(data_for_ai, api_key, cache=None):
+    """Gửi dữ liệu phân tích đến Gemini API và nhận nhận xét."""
+    return "".join(stream_ai_analysis(data_for_ai, api_key, cache=cache))
+
+
+# --- Hàm gọi API Gemini cho CHAT tương tác (có quản lý lịch sử) ---
+def stream_chat_contents(contents, api_key, client=None, cache=None, cache_key=None):
+    """Stream câu trả lời cho `contents` đã dựng sẵn (build_chat_request).
+
+    Có `cache` và `cache_key` (metrics['answer_key'] của build_chat_request) thì dùng cache câu trả lời.
+    """
+    if cache is None or cache_key is None:
+        return _stream_text(api_key, contents, client)
+    return _cached_text(api_key, contents, client, cache, cache_key)
+
+
+def stream_chat_response(prompt, chat_history_st, context_data, api_key, client=None, memory=None, cache=None):
+    """Như get_chat_response nhưng trả về generator các đoạn văn bản (cho st.write_stream)."""
+    try:
+        contents, metrics = build_chat_request(prompt, chat_history_st, context_data, memory)
+    except Exception as e:
+        return iter([f"Đã xảy ra lỗi không xác định: {e}"])
+    return stream_chat_contents(contents, api_key, client, cache or get_answer_cache(), metrics['answer_key'])
+
+
+def get_chat_response(prompt, chat_history_st, context_data, api_key, memory=None, cache=None):
+    return "".join(stream_chat_response(prompt, chat_history_st, context_data, api_key, memory=memory, cache=cache))
+
+
+# --- Nhận xét theo từng phần, gửi song song (asyncio) ---
+def build_section_prompt(section):
+    """Prompt nhận xét riêng cho một phần (bctc.sections.Section)."""
+    system_instruction_text = (
+        "Bạn là một chuyên gia phân tích tài chính chuyên nghiệp. Chú ý: Tất cả các số liệu tiền tệ trong dữ liệu được cung cấp đều có đơn vị tính là **triệu đồng**. Hãy luôn đề cập đến đơn vị này khi trả lời các câu hỏi về số liệu tài chính cụ thể. "
+        f"Dựa trên dữ liệu đã cung cấp, hãy viết một đoạn nhận xét khách quan, ngắn gọn (1-2 đoạn) về **{section.title}** của doanh nghiệp, "
+        f"tập trung vào {section.focus} qua các năm/kỳ. Không nhắc lại tiêu đề phần."
+    )
+
+    return f"""
+        {system_instruction_text}
+
+        Dữ liệu (dạng bảng CSV gọn, phân cách bằng dấu ';'):
+        {section.data}
+        """
+
+
+def _is_retryable(error):
+    # Hết hạn mức (429) hoặc lỗi phía máy chủ (5xx); lỗi khóa API/yêu cầu sai (4xx khác) không thử lại
+    return error.code == 429 or error.code >= 500
+
+
+async def _generate_with_retry(client, contents, retries=SECTION_RETRIES, backoff_s=RETRY_BACKOFF_S):
+    """generate_content bất đồng bộ, thử lại với backoff lũy thừa (+ jitter) khi APIError tạm thời."""
+    for attempt in range(retries + 1):
+        try:
+            response = await client.aio.models.generate_content(model=MODEL_NAME, contents=contents)
+            return response.text or ""
+        except APIError as e:
+            if attempt == retries or not _is_retryable(e):
+                raise
+            await asyncio.sleep(backoff_s * 2 ** attempt * (1 + random.random() / 2))
+
+
+def _with_fallback(fallback, error_text):
+    """Nhận xét tự động (nếu có) kèm ghi chú lỗi, thay cho chỉ thông báo lỗi."""
+    if not fallback:
+        return error_text
+    return f"{fallback}\n\n_(Nhận xét tự động theo quy tắc do không gọi được Gemini. {error_text})_"
+
+
+async def _acquire_request_slot():
+    """Chờ một chỗ trong _request_slots (giới hạn chung của process, như _stream_text) mà không chặn event loop.
+
+    Luồng chờ kiểm tra lại sau mỗi SLOT_POLL_S: nếu task bị hủy (vd. asyncio.run dừng giữa
+    chừng) thì luồng thôi chờ, và chỗ đã lấy được trước hay sau lúc hủy đều được trả lại.
+    """
+    lock = threading.Lock()
+    state = {'abandoned': False, 'acquired': False}
+
+    def acquire():
+        deadline = time.monotonic() + TIMEOUT_S
+        while not state['abandoned']:
+            if _request_slots.acquire(timeout=min(SLOT_POLL_S, max(deadline - time.monotonic(), 0))):
+                with lock:
+                    state['acquired'] = not state['abandoned']
+                if not state['acquired']:
+                    _request_slots.release()
+                return state['acquired']
+            if time.monotonic() >= deadline:
+                return False
+        return False
+
+    try:
+        return await asyncio.to_thread(acquire)
+    except asyncio.CancelledError:
+        with lock:
+            state['abandoned'] = True
+            if state['acquired']:
+                _request_slots.release()
+        raise
+
+
+async def _analyze_section(section, client, semaphore, cache, fallback=None):
+    key = answer_key('section', section.data, section.key, MODEL_NAME)
+    answer = cache.get(key)
+    if answer is not None:
+        return section, answer
+    async with semaphore:
+        if not await _acquire_request_slot():
+            error_text = "Lỗi gọi Gemini API: Hệ thống đang có quá nhiều yêu cầu đồng thời, vui lòng thử lại sau."
+            return section, _with_fallback(fallback, error_text)
+        try:
+            with span('gemini_section', model=MODEL_NAME, section=section.key):
+                answer = await _generate_with_retry(client, build_section_prompt(section))
+        except APIError as e:
+            error_text = f"Lỗi gọi Gemini API: Vui lòng kiểm tra Khóa API hoặc giới hạn sử dụng. Chi tiết lỗi: {e}"
+            return section, _with_fallback(fallback, error_text)
+        except Exception as e:
+            return section, _with_fallback(fallback, f"Đã xảy ra lỗi không xác định: {e}")
+        finally:
+            _request_slots.release()
+    cache.put(key, answer)
+    return section, answer
+
+
+async def analyze_sections_async(sections, api_key, client=None, max_concurrency=SECTION_CONCURRENCY, cache=None,
+                                 on_section=None, fallbacks=None):
+    """Gửi các phần song song (tối đa `max_concurrency` request cùng lúc, trong giới hạn chung
+    MAX_CONCURRENCY của process); trả về [(Section, nhận xét)] theo thứ tự `sections`.
+
+    `on_section(section, nhận xét)` được gọi ngay khi từng phần hoàn tất (theo thứ tự hoàn tất).
+    Lỗi của một phần chỉ thay nhận xét phần đó bằng `fallbacks[khóa phần]` (nếu có, vd. từ
+    narrative.describe_sections) kèm thông báo lỗi. `client=None` tạo client mới
+    cho lần chạy này và đóng khi xong (pool kết nối bất đồng bộ gắn với event loop đang chạy).
+    """
+    cache = cache or get_answer_cache()
+    fallbacks = fallbacks or {}
+    own_client = client is None
+    client = client or new_client(api_key)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    answers = {}
+    try:
+        tasks = [asyncio.ensure_future(_analyze_section(section, client, semaphore, cache, fallbacks.get(section.key))) for section in sections]
+        for finished in asyncio.as_completed(tasks):
+            section, answer = await finished
+            answers[section.key] = answer
+            if on_section is not None:
+                on_section(section, answer)
+    finally:
+        if own_client:
+            await client.aio.aclose()
+    return [(section, answers[section.key]) for section in sections]
+
+
+def assemble_sections(section_answers):
+    """[(Section, nhận xét)] -> bản nhận xét Markdown, mỗi phần một tiêu đề."""
+    return '\n\n'.join(f"#### {section.title}\n{answer.strip()}" for section, answer in section_answers)
+
+
+def get_sectioned_analysis(result, api_key, max_concurrency=SECTION_CONCURRENCY, cache=None, on_section=None):
+    """Nhận xét đầy đủ của một AnalysisResult, các phần được sinh song song (gọi từ code đồng bộ).
+
+    Phần nào Gemini lỗi dùng nhận xét tự động theo quy tắc (bctc.narrative).
+    """
+    sections = build_sections(result)
+    section_answers = asyncio.run(analyze_sections_async(
+        sections, api_key, max_concurrency=max_concurrency, cache=cache, on_section=on_section,
+        fallbacks=describe_sections(result),
+    ))
+    return assemble_sections(section_answers)
@@ -0,0 +1,130 @@
+"""Cache câu trả lời Gemini trên đĩa, dùng chung giữa các lần rerun, session và process.
+
+Khóa cache là SHA-256 của loại yêu cầu ('chat' hoặc 'analysis'), tên model, bối cảnh
+dữ liệu gửi đi và câu hỏi đã chuẩn hóa (chữ thường, gộp khoảng trắng, bỏ dấu câu
+cuối). Lịch sử hội thoại không nằm trong khóa: cùng một câu hỏi trên cùng dữ liệu
+trả về cùng một câu trả lời. Mỗi mục là một file JSON; thứ tự LRU dựa trên mtime
+(được "touch" mỗi lần đọc) như ResultCache, mục quá ``ttl_s`` giây bị bỏ qua và xóa.
+
+Chỉ dùng thư viện chuẩn (không cần google-genai, pandas).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from pathlib import Path
+
+DEFAULT_ANSWER_DIR = os.environ.get(
+    'BCTC_ANSWER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'bctc-answers')
+)
+# 0 = tắt cache câu trả lời
+DEFAULT_TTL_S = float(os.environ.get('BCTC_ANSWER_CACHE_TTL_H', '24')) * 3600
+DEFAULT_MAX_ENTRIES = int(os.environ.get('BCTC_ANSWER_CACHE_MAX_ENTRIES', 2000))
+
+_SPACES_RE = re.compile(r'\s+')
+_TRAILING_PUNCT_RE = re.compile(r'[\s?.!…:;,]+$')
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def normalize_question(question):
+    """'  ROE thay đổi  thế nào?? ' -> 'roe thay đổi thế nào' (giữ dấu tiếng Việt)."""
+    text = unicodedata.normalize('NFC', str(question)).casefold()
+    return _TRAILING_PUNCT_RE.sub('', _SPACES_RE.sub(' ', text).strip())
+
+
+def answer_key(kind, context, question, model):
+    """SHA-256 của (loại yêu cầu, model, bối cảnh dữ liệu, câu hỏi đã chuẩn hóa)."""
+    digest = hashlib.sha256(f"{kind}|{model}|".encode())
+    digest.update(str(context).encode())
+    digest.update(f"|{normalize_question(question)}".encode())
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """Kho câu trả lời trên đĩa, có hạn dùng (TTL) và giới hạn số mục (LRU)."""
+
+    def __init__(self, directory=DEFAULT_ANSWER_DIR, ttl_s=DEFAULT_TTL_S, max_entries=DEFAULT_MAX_ENTRIES):
+        self.directory = Path(directory)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.enabled = ttl_s > 0
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / f'{key}.json'
+
+    def get(self, key):
+        """Câu trả lời đã lưu, hoặc None nếu chưa có, đã hết hạn hoặc file bị hỏng."""
+        path = self._path(key)
+        if not self.enabled or not path.exists():
+            return None
+        try:
+            entry = json.loads(path.read_text(encoding='utf-8'))
+            expired = time.time() - entry['created'] > self.ttl_s
+        except (OSError, ValueError, KeyError):
+            expired = True
+        if expired:
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path)  # Đánh dấu vừa dùng (LRU)
+        except FileNotFoundError:
+            pass
+        return entry['answer']
+
+    def put(self, key, answer):
+        """Ghi câu trả lời (ghi file tạm rồi đổi tên để process khác không đọc dở)."""
+        if not self.enabled or not answer:
+            return
+        tmp = self.directory / f'.tmp-{key}-{uuid.uuid4().hex}'
+        entry = {'answer': answer, 'created': time.time()}
+        try:
+            tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp, self._path(key))
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def entries(self):
+        """[(mtime truy cập, đường dẫn)] của các mục hoàn chỉnh."""
+        items = []
+        for path in self.directory.glob('*.json'):
+            try:
+                items.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue  # Đang bị process khác xóa
+        return items
+
+    def evict(self):
+        """Xóa các mục không được dùng trong ttl_s giây, rồi các mục ít dùng nhất vượt max_entries."""
+        items = sorted(self.entries())
+        cutoff = time.time() - self.ttl_s
+        fresh = []
+        for mtime, path in items:
+            if mtime < cutoff:
+                path.unlink(missing_ok=True)
+            else:
+                fresh.append(path)
+        for path in fresh[:max(0, len(fresh) - self.max_entries)]:
+            path.unlink(missing_ok=True)
+
+    def clear(self):
+        for _, path in self.entries():
+            path.unlink(missing_ok=True)
+
+
+def get_answer_cache(directory=DEFAULT_ANSWER_DIR):
+    """AnswerCache dùng chung cho cả process, tạo một lần cho mỗi thư mục."""
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = AnswerCache(directory)
+        return cache
@@ -0,0 +1,151 @@
+"""Chế độ danh mục (portfolio): phân tích cả thư mục / file zip BCTC song song.
+
+Ví dụ:
+    python -m bctc.batch du_lieu/ -o ket_qua/ --format parquet --workers 8
+
+Kết quả gồm:
+    - ratios.<parquet|csv>: bảng chỉ số hợp nhất dạng dài
+      (company, source_file, period, ratio, ratio_type, value)
+    - report.csv: trạng thái từng file (ok/error), số kỳ, cảnh báo, lỗi chi tiết
+"""
+import argparse
+import io
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from .engine import CASH_RATIO_DEFINITIONS, RATIO_DEFINITIONS
+from .ingest import period_names
+from .pipeline import analyze_workbook
+
+WORKBOOK_SUFFIXES = ('.xlsx', '.xls')
+RATIO_COLUMNS = ['company', 'source_file', 'period', 'ratio', 'ratio_type', 'value']
+REPORT_COLUMNS = ['source_file', 'status', 'periods', 'warnings', 'error']
+RATIO_TYPES = {name: ratio_type for _, name, ratio_type in RATIO_DEFINITIONS + CASH_RATIO_DEFINITIONS}
+
+
+def _is_workbook(name):
+    base = os.path.basename(name)
+    return base.lower().endswith(WORKBOOK_SUFFIXES) and not base.startswith(('~$', '.'))
+
+
+def iter_workbooks(source):
+    """Liệt kê (tên file, nguồn) từ một thư mục (đệ quy) hoặc một file .zip.
+
+    Với thư mục, nguồn là đường dẫn; với zip, nguồn là (đường dẫn zip, tên file bên trong).
+    Chỉ tên được liệt kê ở đây, worker tự đọc nội dung (open_source) nên process chính
+    không phải giữ và gửi bytes của cả zip sang các worker.
+    """
+    source = Path(source)
+    if source.is_dir():
+        for path in sorted(source.rglob('*')):
+            if path.is_file() and _is_workbook(path.name):
+                yield str(path.relative_to(source)), str(path)
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            names = [info.filename for info in archive.infolist() if not info.is_dir() and _is_workbook(info.filename)]
+        for name in names:
+            yield name, (str(source), name)
+    else:
+        raise ValueError(f"'{source}' không phải thư mục hoặc file .zip.")
+
+
+def open_source(source):
+    """Nguồn từ iter_workbooks -> thứ analyze_workbook đọc được (file trong zip được đọc ngay tại worker)."""
+    if isinstance(source, tuple):
+        zip_path, name = source
+        with zipfile.ZipFile(zip_path) as archive:
+            return io.BytesIO(archive.read(name))
+    return source
+
+
+def ratios_long_format(analysis, company, source_file):
+    """Chuyển Chỉ số Tài chính và Hệ số dòng tiền (nếu có LCTT) sang dạng dài (company x period x ratio)."""
+    df = pd.concat([analysis.df_financial_ratios_processed, analysis.df_cash_ratios_processed], ignore_index=True)
+    years = period_names(len(analysis.period_labels))
+    df_long = df.melt(id_vars='Chỉ tiêu', value_vars=years, var_name='period', value_name='value')
+    df_long['period'] = df_long['period'].map(dict(zip(years, analysis.period_labels)))
+    df_long = df_long.rename(columns={'Chỉ tiêu': 'ratio'})
+    df_long['ratio_type'] = df_long['ratio'].map(RATIO_TYPES)
+    df_long['company'] = company
+    df_long['source_file'] = source_file
+    return df_long[RATIO_COLUMNS]
+
+
+def analyze_job(job):
+    """Worker: phân tích một file, không bao giờ ném lỗi ra ngoài (lỗi ghi vào report)."""
+    name, source = job
+    try:
+        analysis = analyze_workbook(open_source(source), with_context=False)
+    except Exception as e:
+        return None, {'source_file': name, 'status': 'error', 'periods': 0, 'warnings': '',
+                      'error': f"{type(e).__name__}: {e}"}
+
+    warnings = " | ".join(message for level, message in analysis.notes if level != 'info')
+    company = Path(name).stem
+    return ratios_long_format(analysis, company, name), {
+        'source_file': name, 'status': 'ok', 'periods': len(analysis.period_labels),
+        'warnings': warnings, 'error': '',
+    }
+
+
+def analyze_portfolio(source, workers=None):
+    """Phân tích toàn bộ file trong `source` trên process pool.
+
+    Trả về (df_ratios, df_report). `workers=1` chạy tuần tự trong process hiện tại.
+    """
+    jobs = list(iter_workbooks(source))
+    if not jobs:
+        return pd.DataFrame(columns=RATIO_COLUMNS), pd.DataFrame(columns=REPORT_COLUMNS)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [analyze_job(job) for job in jobs]
+    else:
+        # Nhiều file nhỏ: gom theo chunk để giảm chi phí gửi/nhận giữa các process
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(analyze_job, jobs, chunksize=chunksize))
+
+    frames = [df for df, _ in results if df is not None]
+    df_ratios = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=RATIO_COLUMNS)
+    df_report = pd.DataFrame([report for _, report in results], columns=REPORT_COLUMNS)
+    return df_ratios, df_report
+
+
+def write_table(df, path):
+    """Ghi DataFrame ra Parquet (cần pyarrow) hoặc CSV theo đuôi file."""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        df.to_parquet(path, index=False)
+    else:
+        # utf-8-sig để Excel mở đúng tiếng Việt
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Phân tích hàng loạt file BCTC (.xlsx) trong thư mục hoặc file zip.")
+    parser.add_argument('source', help="Thư mục hoặc file .zip chứa các file Excel BCTC")
+    parser.add_argument('-o', '--output', default='bctc_batch_output', help="Thư mục ghi kết quả")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet', help="Định dạng bảng chỉ số hợp nhất")
+    parser.add_argument('--workers', type=int, default=None, help="Số process (mặc định: số CPU)")
+    args = parser.parse_args(argv)
+
+    df_ratios, df_report = analyze_portfolio(args.source, workers=args.workers)
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    write_table(df_ratios, output / f'ratios.{args.format}')
+    write_table(df_report, output / 'report.csv')
+
+    n_errors = int((df_report['status'] == 'error').sum())
+    print(f"Đã xử lý {len(df_report)} file ({n_errors} lỗi). Kết quả: {output}")
+    return 1 if n_errors and n_errors == len(df_report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""Cache kết quả phân tích trên đĩa, dùng chung giữa các lần rerun, session và process.
+
+Khóa cache là SHA-256 của nội dung file Excel + ENGINE_VERSION + tùy chọn phân
+tích. Mỗi mục là một thư mục gồm các bảng Parquet và ``meta.json`` (nhãn kỳ,
+thông báo, context Chatbot). Thứ tự LRU dựa trên mtime của ``meta.json`` (được
+"touch" mỗi lần đọc) nên nhiều process dùng chung thư mục mà không cần khóa.
+Khi tổng dung lượng vượt ``max_bytes``, các mục ít được dùng nhất bị xóa.
+
+Cần pyarrow; nếu không có, cache tự tắt và mọi lệnh get/put trở thành no-op.
+"""
+import hashlib
+import io
+import importlib.util
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+from .context import DEFAULT_TOKEN_BUDGET
+from .ingest import ParsedStatements, period_columns
+from .pipeline import ENGINE_VERSION, AnalysisResult, analyze_workbook
+from .telemetry import span
+
+DEFAULT_CACHE_DIR = os.environ.get('BCTC_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'bctc'))
+DEFAULT_MAX_BYTES = int(float(os.environ.get('BCTC_CACHE_MAX_MB', '512')) * 1024 * 1024)
+
+RESULT_FRAMES = [
+    'df_bs_processed', 'df_is_processed', 'df_ratios_processed', 'df_financial_ratios_processed',
+    'df_cf_processed', 'df_cash_ratios_processed',
+]
+PARSED_FRAMES = ['df_bs', 'df_is', 'df_cf']
+
+
+def content_key(file_bytes, **options):
+    """SHA-256 của nội dung file + phiên bản engine + tùy chọn (max_periods, with_context...)."""
+    digest = hashlib.sha256(file_bytes)
+    digest.update(f"|engine={ENGINE_VERSION}".encode())
+    for name in sorted(options):
+        digest.update(f"|{name}={options[name]!r}".encode())
+    return digest.hexdigest()
+
+
+def _numeric_statement(df):
+    """Bảng BĐKT/KQKD/LCTT với cột kỳ ép kiểu số (như bước đầu của process_financial_data) để ghi Parquet."""
+    df = df.copy()
+    if 'Chỉ tiêu' in df.columns:
+        df['Chỉ tiêu'] = df['Chỉ tiêu'].astype(str)
+    for col in period_columns(df):
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+class ResultCache:
+    """Kho AnalysisResult trên đĩa, giới hạn dung lượng, loại bỏ theo LRU."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.enabled = importlib.util.find_spec('pyarrow') is not None
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key):
+        return self.directory / key
+
+    def get(self, key):
+        """AnalysisResult đã lưu, hoặc None nếu chưa có (hoặc mục bị hỏng)."""
+        entry = self._entry(key)
+        meta_path = entry / 'meta.json'
+        if not self.enabled or not meta_path.exists():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            frames = {name: pd.read_parquet(entry / f'{name}.parquet') for name in RESULT_FRAMES + PARSED_FRAMES}
+        except Exception:
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        os.utime(meta_path)  # Đánh dấu vừa dùng (LRU)
+
+        parsed = ParsedStatements(
+            df_bs=frames['df_bs'],
+            df_is=frames['df_is'],
+            period_cols=meta['period_cols'],
+            notes=[tuple(note) for note in meta['parsed_notes']],
+            df_cf=frames['df_cf'],
+        )
+        return AnalysisResult(
+            **{name: frames[name] for name in RESULT_FRAMES},
+            period_labels=meta['period_labels'],
+            chat_context=meta['chat_context'],
+            notes=[tuple(note) for note in meta['notes']],
+            parsed=parsed,
+            row_kinds=meta['row_kinds'],
+            timings=meta.get('timings', []),
+        )
+
+    def put(self, key, result):
+        """Ghi kết quả (ghi vào thư mục tạm rồi đổi tên để process khác không đọc dở)."""
+        if not self.enabled or self._entry(key).exists():
+            return
+        tmp = self.directory / f'.tmp-{key}-{uuid.uuid4().hex}'
+        tmp.mkdir()
+        try:
+            for name in RESULT_FRAMES:
+                getattr(result, name).to_parquet(tmp / f'{name}.parquet')
+            for name in PARSED_FRAMES:
+                _numeric_statement(getattr(result.parsed, name)).to_parquet(tmp / f'{name}.parquet')
+            meta = {
+                'engine_version': ENGINE_VERSION,
+                'period_cols': [str(col) for col in result.parsed.period_cols],
+                'period_labels': list(result.period_labels),
+                'chat_context': result.chat_context,
+                'notes': [list(note) for note in result.notes],
+                'parsed_notes': [list(note) for note in result.parsed.notes],
+                'row_kinds': result.row_kinds,
+                'timings': result.timings,
+                'created': time.time(),
+            }
+            (tmp / 'meta.json').write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+            os.rename(tmp, self._entry(key))
+        except OSError:
+            # Process khác vừa ghi cùng khóa
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict()
+
+    def entries(self):
+        """[(mtime truy cập, dung lượng, đường dẫn)] của các mục hoàn chỉnh."""
+        items = []
+        for entry in self.directory.iterdir():
+            meta_path = entry / 'meta.json'
+            if entry.name.startswith('.') or not meta_path.exists():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                items.append((meta_path.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                continue  # Đang bị process khác xóa
+        return items
+
+    def evict(self):
+        """Xóa các mục ít dùng nhất cho tới khi tổng dung lượng <= max_bytes."""
+        items = sorted(self.entries())
+        total = sum(size for _, size, _ in items)
+        for _, size, entry in items:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, entry in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def analyze_bytes_cached(file_bytes, cache=None, max_periods=None, with_context=True, token_budget=None, sheets=None):
+    """analyze_workbook trên nội dung file, dùng ResultCache nếu có.
+
+    `sheets` (bctc.sheets.EntitySheets) chọn đơn vị trong workbook nhiều sheet; mỗi đơn vị
+    là một mục cache riêng. Trả về (AnalysisResult, cache_hit).
+    """
+    if cache is None:
+        cache = ResultCache()
+    if token_budget is None:
+        token_budget = DEFAULT_TOKEN_BUDGET
+    options = {'max_periods': max_periods, 'with_context': with_context, 'token_budget': token_budget}
+    if sheets is not None:
+        # Chỉ thêm khi chọn sheet để khóa của file một sheet giữ nguyên như trước
+        options['sheets'] = sheets.cache_key()
+    key = content_key(file_bytes, **options)
+    with span('result_cache_get') as s:
+        result = cache.get(key)
+        s.attrs['hit'] = result is not None
+    if result is not None:
+        return result, True
+
+    result = analyze_workbook(
+        io.BytesIO(file_bytes), max_periods=max_periods, with_context=with_context, token_budget=token_budget,
+        sheets=sheets,
+    )
+    with span('result_cache_put'):
+        cache.put(key, result)
+    return result, False
@@ -0,0 +1,223 @@
+"""Chuẩn bị nhãn kỳ báo cáo và bối cảnh (context) cho Chatbot.
+
+build_chat_context dựng bản Markdown đầy đủ mọi bảng; build_compact_context dựng bản
+CSV gọn, xếp dòng theo mức trọng yếu và không vượt ngân sách token (dùng cho Chatbot).
+"""
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from .formatting import ROW_MAJOR, ROW_TOTAL, classify_rows, format_table
+from .ingest import period_columns, period_names
+
+
+# -----------------------------------------------------
+# CHUẨN HÓA TÊN CỘT ĐỂ HIỂN THỊ (DD/MM/YYYY hoặc YYYY)
+# -----------------------------------------------------
+def format_col_name(col_name):
+    col_name = str(col_name)
+    if ' ' in col_name:
+        col_name = col_name.split(' ')[0]
+    try:
+        parts = col_name.split('-')
+        if len(parts) == 3:
+            return f"{parts[2]}/{parts[1]}/{parts[0]}"
+    except Exception:
+        pass
+    return col_name
+
+
+def build_chat_context(df_bs_processed, df_is_processed, df_ratios_processed, df_financial_ratios_processed, period_labels,
+                       df_cf_processed=None, df_cash_ratios_processed=None):
+    """Ghép các bảng đã xử lý thành chuỗi Markdown làm bối cảnh cho AI.
+
+    Số liệu được định dạng VN giống bảng hiển thị ('1.234.567', '12,3%') để AI trích dẫn đúng như người dùng thấy.
+    (disable_numparse: không để tabulate đọc lại "270.500" thành số 270.5.)
+    """
+    # Ánh xạ tên cột nội bộ ('Năm 1', ..., 'Năm N') sang tên kỳ báo cáo thực tế.
+    rename_map_years = dict(zip(period_names(len(period_labels)), period_labels))
+
+    # 1. Chuẩn bị Bảng CĐKT Context (luôn có nếu đã chạy đến đây)
+    df_bs_context = format_table(df_bs_processed, 'bs').rename(columns=rename_map_years)
+    bs_context_md = df_bs_context.to_markdown(index=False, disable_numparse=True)
+
+    # 2. Chuẩn bị KQKD Context
+    if not df_is_processed.empty:
+        df_is_context = format_table(df_is_processed, 'is').rename(columns=rename_map_years)
+        is_context_md = df_is_context.to_markdown(index=False, disable_numparse=True)
+    else:
+        is_context_md = "Không tìm thấy dữ liệu Báo cáo Kết quả hoạt động kinh doanh."
+
+    # 3. Chuẩn bị Tỷ trọng Chi phí Context
+    if not df_ratios_processed.empty:
+        df_ratios_context = format_table(df_ratios_processed, 'cost_ratios').rename(columns=rename_map_years)
+        ratios_context_md = df_ratios_context.to_markdown(index=False, disable_numparse=True)
+    else:
+        ratios_context_md = "Không tìm thấy dữ liệu Tỷ trọng Chi phí/Doanh thu thuần."
+
+    # 4. Chuẩn bị Chỉ số Tài chính Context
+    if not df_financial_ratios_processed.empty:
+        df_key_ratios_context = format_table(df_financial_ratios_processed, 'key_ratios').rename(columns=rename_map_years)
+        key_ratios_context_md = df_key_ratios_context.to_markdown(index=False, disable_numparse=True)
+    else:
+        key_ratios_context_md = "Không tìm thấy dữ liệu Chỉ tiêu Tài chính Chủ chốt."
+
+    # 5. LCTT và Hệ số dòng tiền (chỉ khi được truyền vào)
+    cash_flow_md = ""
+    for kind, title, df, empty_text in [
+        ('cf', "BÁO CÁO LƯU CHUYỂN TIỀN TỆ (Cash Flow Analysis)", df_cf_processed, "Không tìm thấy dữ liệu Báo cáo Lưu chuyển tiền tệ."),
+        ('cash_ratios', "CÁC HỆ SỐ DÒNG TIỀN (Chất lượng dòng tiền, Khả năng trả nợ bằng tiền)", df_cash_ratios_processed, "Không tìm thấy dữ liệu Hệ số dòng tiền."),
+    ]:
+        if df is None:
+            continue
+        md = format_table(df, kind).rename(columns=rename_map_years).to_markdown(index=False, disable_numparse=True) if not df.empty else empty_text
+        cash_flow_md += f"\n**{title}:**\n{md}\n"
+
+    return f"""
+**DỮ LIỆU TÀI CHÍNH ĐÃ XỬ LÝ (Kỳ: {', '.join(period_labels)}):**
+
+**BẢNG CÂN ĐỐI KẾ TOÁN (Balance Sheet Analysis):**
+{bs_context_md}
+
+**BÁO CÁO KẾT QUẢ KINH DOANH (Income Statement Analysis):**
+{is_context_md}
+
+**TỶ TRỌNG CHI PHÍ/DOANH THU THUẦN (%):**
+{ratios_context_md}
+
+**CÁC HỆ SỐ TÀI CHÍNH CHỦ CHỐT (Thanh toán, Hoạt động, Cấu trúc Vốn, Sinh lời):**
+{key_ratios_context_md}
+{cash_flow_md}"""
+
+
+# -----------------------------------------------------
+# BỐI CẢNH GỌN THEO NGÂN SÁCH TOKEN
+# -----------------------------------------------------
+# Ước lượng thô cho tiếng Việt có dấu + số liệu: ~3 ký tự / token (thiên về an toàn)
+CHARS_PER_TOKEN = 3.0
+DEFAULT_TOKEN_BUDGET = int(os.environ.get('BCTC_CHAT_TOKEN_BUDGET', 6000))
+
+# Loại bảng -> [(tiền tố cột so sánh, mã cột)]; cột kỳ 'Năm k' luôn là 'Kk'
+COLUMN_CODES = {
+    'bs': [('Delta', 'D'), ('Growth', 'G'), ('Tỷ trọng', 'TT')],
+    'is': [('S.S Tuyệt đối', 'D'), ('S.S Tương đối', 'G')],
+    'cost_ratios': [('S.S Tương đối', 'D')],
+    'key_ratios': [('S.S Tuyệt đối', 'D')],
+    'cf': [('S.S Tuyệt đối', 'D'), ('S.S Tương đối', 'G')],
+    'cash_ratios': [('S.S Tuyệt đối', 'D')],
+}
+
+CODE_LEGEND = (
+    "Mã cột: Kk = giá trị kỳ k; Dk = chênh lệch tuyệt đối kỳ k so với kỳ k-1 "
+    "(bảng tỷ trọng chi phí: chênh lệch điểm %); Gk = tăng trưởng % kỳ k so với kỳ k-1; "
+    "TTk = tỷ trọng % trên tổng tài sản/nguồn vốn kỳ k. "
+    "Số theo chuẩn VN: '.' phân cách hàng nghìn, ',' thập phân; ô trống = 0 hoặc không có dữ liệu."
+)
+
+
+def estimate_tokens(text):
+    """Số token ước lượng của một chuỗi (không cần tokenizer, không gọi mạng)."""
+    return int(math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def column_code(col, kind):
+    """'Năm 2' -> 'K2', 'Growth (Y3 vs Y2)' -> 'G3', 'Tỷ trọng Năm 1 (%)' -> 'TT1'; None nếu không phải cột số."""
+    col = str(col)
+    match = re.fullmatch(r'Năm (\d+)', col)
+    if match:
+        return f"K{match.group(1)}"
+    for prefix, code in COLUMN_CODES[kind]:
+        if col.startswith(prefix):
+            number = re.search(r'\d+', col)
+            return f"{code}{number.group(0)}" if number else code
+    return None
+
+
+def materiality(df):
+    """Điểm trọng yếu của từng dòng: |giá trị| lớn nhất qua các kỳ / giá trị lớn nhất của bảng,
+    cộng thêm cho dòng mục chính/tổng cộng để khung báo cáo luôn được giữ trước."""
+    values = df[period_columns(df)].apply(pd.to_numeric, errors='coerce').abs().max(axis=1).fillna(0)
+    top = values.max()
+    score = values / top if top > 0 else values * 0
+    kinds = classify_rows(df['Chỉ tiêu'])
+    return score.to_numpy() + np.isin(kinds, [ROW_MAJOR, ROW_TOTAL])
+
+
+def compact_rows(df, kind):
+    """(dòng tiêu đề CSV, [dòng dữ liệu CSV]) với mã cột ngắn và số đã định dạng VN."""
+    codes = {col: column_code(col, kind) for col in df.columns}
+    columns = [col for col in df.columns if codes[col]]
+    formatted = format_table(df, kind)
+    labels = df['Chỉ tiêu'].astype(str).str.strip().str.replace(';', ',', regex=False)
+    lines = labels.str.cat([formatted[col].astype(str) for col in columns], sep=';').tolist()
+    header = ';'.join(['Chỉ tiêu'] + [codes[col] for col in columns])
+    return header, lines
+
+
+def build_compact_context(df_bs_processed, df_is_processed, df_ratios_processed, df_financial_ratios_processed,
+                          period_labels, token_budget=None, df_cf_processed=None, df_cash_ratios_processed=None):
+    """Bối cảnh Chatbot dạng CSV gọn (';' phân cách, mã cột ngắn) không vượt `token_budget` token.
+
+    Bảng tỷ trọng chi phí và các bảng hệ số (ít dòng, thông tin cô đọng) luôn được giữ đủ.
+    Các dòng BĐKT/KQKD/LCTT được xếp theo mức trọng yếu (materiality) và thêm vào cho tới khi
+    hết ngân sách; dòng được chọn vẫn in theo thứ tự gốc của báo cáo. Phần LCTT chỉ có khi
+    `df_cf_processed`/`df_cash_ratios_processed` được truyền vào.
+    """
+    budget = DEFAULT_TOKEN_BUDGET if token_budget is None else token_budget
+    periods = ', '.join(f"K{k} = {label}" for k, label in enumerate(period_labels, start=1))
+    intro = f"**DỮ LIỆU TÀI CHÍNH ĐÃ XỬ LÝ (Kỳ: {periods})**\n{CODE_LEGEND}"
+
+    sections = [
+        ('bs', "BẢNG CÂN ĐỐI KẾ TOÁN", df_bs_processed, "Không có dữ liệu Bảng Cân đối Kế toán."),
+        ('is', "BÁO CÁO KẾT QUẢ KINH DOANH", df_is_processed, "Không tìm thấy dữ liệu Báo cáo Kết quả hoạt động kinh doanh."),
+        ('cost_ratios', "TỶ TRỌNG CHI PHÍ/DOANH THU THUẦN (%)", df_ratios_processed, "Không tìm thấy dữ liệu Tỷ trọng Chi phí/Doanh thu thuần."),
+        ('key_ratios', "CÁC HỆ SỐ TÀI CHÍNH CHỦ CHỐT (Thanh toán, Hoạt động, Cấu trúc Vốn, Sinh lời)", df_financial_ratios_processed, "Không tìm thấy dữ liệu Chỉ tiêu Tài chính Chủ chốt."),
+        ('cf', "BÁO CÁO LƯU CHUYỂN TIỀN TỆ", df_cf_processed, "Không tìm thấy dữ liệu Báo cáo Lưu chuyển tiền tệ."),
+        ('cash_ratios', "CÁC HỆ SỐ DÒNG TIỀN (Chất lượng dòng tiền, Khả năng trả nợ bằng tiền)", df_cash_ratios_processed, "Không tìm thấy dữ liệu Hệ số dòng tiền."),
+    ]
+    sections = [section for section in sections if section[2] is not None]
+
+    # 1. Phần cố định: lời dẫn, tiêu đề bảng, toàn bộ bảng tỷ lệ
+    used = estimate_tokens(intro)
+    rendered = {}
+    candidates = []  # (điểm trọng yếu, tên bảng, vị trí dòng, số token)
+    for kind, title, df, empty_text in sections:
+        if df.empty:
+            rendered[kind] = (title, None, [], empty_text)
+            used += estimate_tokens(title + empty_text)
+            continue
+        header, lines = compact_rows(df, kind)
+        rendered[kind] = (title, header, lines, None)
+        used += estimate_tokens(title + header) + 10
+        if kind in ('cost_ratios', 'key_ratios', 'cash_ratios'):
+            used += sum(estimate_tokens(line) + 1 for line in lines)
+        else:
+            scores = materiality(df)
+            candidates += [(scores[pos], kind, pos, estimate_tokens(line) + 1) for pos, line in enumerate(lines)]
+
+    # 2. Dòng BĐKT/KQKD/LCTT theo thứ tự trọng yếu giảm dần, tới khi hết ngân sách
+    selected = {'bs': set(), 'is': set(), 'cf': set()}
+    for score, kind, pos, tokens in sorted(candidates, key=lambda item: -item[0]):
+        if used + tokens > budget:
+            continue
+        selected[kind].add(pos)
+        used += tokens
+
+    # 3. Ghép lại theo thứ tự gốc
+    parts = [intro]
+    for kind, (title, header, lines, empty_text) in rendered.items():
+        if header is None:
+            parts.append(f"**{title}:**\n{empty_text}")
+            continue
+        if kind in selected:
+            kept = [line for pos, line in enumerate(lines) if pos in selected[kind]]
+            dropped = len(lines) - len(kept)
+            if dropped:
+                title = f"{title} (đã lược bỏ {dropped}/{len(lines)} dòng ít trọng yếu)"
+        else:
+            kept = lines
+        parts.append(f"**{title}:**\n" + '\n'.join([header] + kept))
+    return '\n\n'.join(parts) + '\n'
@@ -0,0 +1,411 @@
+"""Tính toán Tăng trưởng, Tỷ trọng và Chỉ số Tài chính từ BĐKT/KQKD/LCTT (không phụ thuộc Streamlit)."""
+import numpy as np
+import pandas as pd
+
+from .index import CASH_FLOW_ALIASES, LineItemIndex
+from .ingest import YEARS, period_columns
+
+# === [FIX] HÀM HỖ TRỢ TÍNH TOÁN (DI CHUYỂN RA NGOÀI VÀ SỬA LỖI) ===
+
+def get_value(df, keyword, year):
+    """Lấy giá trị số (float) từ DataFrame, xử lý NaN và lỗi."""
+    row = df[df['Chỉ tiêu'].str.contains(keyword, case=False, na=False)]
+    if row.empty:
+        return 0
+
+    # 1. Lấy giá trị đầu tiên, đảm bảo chuyển nó thành số (numeric)
+    value = pd.to_numeric(row[year].iloc[0], errors='coerce')
+
+    # 2. [FIX] Nếu giá trị là NaN, thay bằng 0. Nếu không, giữ nguyên.
+    # (pd.isna() hoạt động chính xác trên numpy.float64)
+    return 0.0 if pd.isna(value) else float(value)
+
+def safe_div(numerator, denominator):
+    """Hàm chia an toàn, xử lý chia cho 0 hoặc NaN."""
+    # Trả về 0 nếu mẫu số là 0 hoặc NaN.
+    if denominator == 0 or pd.isna(denominator) or denominator == np.nan:
+        return 0.0
+
+    result = float(numerator) / float(denominator)
+
+    # Trường hợp chia số âm cho số rất nhỏ, dẫn đến số rất lớn (Inf/-Inf)
+    if np.isinf(result) or np.isneginf(result):
+        return 0.0
+    return result
+
+# === KẾT THÚC HÀM HỖ TRỢ ===
+
+# === [V18] ENGINE CHỈ SỐ VECTOR HÓA (CHỈ TIÊU x KỲ) ===
+
+# Chỉ tiêu cần cho các hệ số: khóa chuẩn (xem bctc.index.LINE_ITEM_ALIASES) -> bảng nguồn
+METRIC_SOURCES = {
+    'TSNH': 'bs',
+    'NO_NGAN_HAN': 'bs',
+    'HTK': 'bs',
+    'GVHB': 'is',
+    'VCSH': 'bs',
+    'NPT': 'bs',
+    'TTS': 'bs',
+    'LNST': 'is',
+    'DT_THUAN': 'is',
+    'PHAI_THU': 'bs',
+}
+
+# Bảng Tỷ trọng Chi phí/DT thuần: tên hiển thị -> khóa chuẩn trong LineItemIndex
+COST_RATIO_ITEMS = {
+    'Giá vốn hàng bán': 'GVHB',
+    'Chi phí lãi vay': 'CP_LAI_VAY',
+    'Chi phí Bán hàng': 'CP_BAN_HANG',
+    'Chi phí Quản lý doanh nghiệp': 'CP_QLDN',
+    'Lợi nhuận sau thuế': 'LNST',
+}
+
+# Thứ tự hiển thị: Thanh toán -> Hoạt động -> Cân nợ -> Sinh lời
+RATIO_DEFINITIONS = [
+    ('current_ratio', 'Hệ số Thanh toán ngắn hạn (Current Ratio)', 'Liquidity'),
+    ('quick_ratio', 'Hệ số Thanh toán nhanh (Quick Ratio)', 'Liquidity'),
+    ('inv_turnover', 'Vòng quay Hàng tồn kho (Lần)', 'Activity'),
+    ('inv_days', 'Thời gian Tồn kho (Ngày)', 'Activity'),
+    ('rcv_turnover', 'Vòng quay các khoản phải thu (Lần)', 'Activity'),
+    ('rcv_days', 'Kỳ phải thu bình quân (Ngày)', 'Activity'),
+    ('wcl_turnover', 'Vòng quay Vốn lưu động (Lần)', 'Activity'),
+    ('equity_ratio', 'Hệ số Tự tài trợ (Equity Ratio)', 'Solvency'),
+    ('d_to_e_ratio', 'Hệ số Nợ trên Vốn chủ sở hữu (Debt-to-Equity Ratio)', 'Solvency'),
+    ('ros_ratio', 'Hệ số Sinh lời Doanh thu (ROS) (%)', 'Profitability'),
+    ('roa_ratio', 'Hệ số Sinh lời Tài sản (ROA) (%)', 'Profitability'),
+    ('roe_ratio', 'Hệ số Sinh lời Vốn chủ sở hữu (ROE) (%)', 'Profitability'),
+]
+
+
+def safe_div_array(numerator, denominator):
+    """Phiên bản mảng của safe_div: mẫu số 0/NaN hoặc kết quả Inf -> 0."""
+    numerator, denominator = np.broadcast_arrays(
+        np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float)
+    )
+    result = np.zeros(numerator.shape, dtype=float)
+    valid = (denominator != 0) & ~np.isnan(denominator)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        result[valid] = numerator[valid] / denominator[valid]
+    result[np.isinf(result)] = 0.0
+    return result
+
+
+def build_statement_indexes(df_bs, df_is, df_cf=None):
+    """Dựng LineItemIndex một lần cho mỗi bảng: {'bs': ..., 'is': ..., 'cf': ...}."""
+    df_cf = pd.DataFrame() if df_cf is None else df_cf
+    return {
+        'bs': LineItemIndex(df_bs['Chỉ tiêu'] if 'Chỉ tiêu' in df_bs.columns else []),
+        'is': LineItemIndex(df_is['Chỉ tiêu'] if 'Chỉ tiêu' in df_is.columns else []),
+        'cf': LineItemIndex(df_cf['Chỉ tiêu'] if 'Chỉ tiêu' in df_cf.columns else [], CASH_FLOW_ALIASES),
+    }
+
+
+def build_metric_matrix(df_bs, df_is, years, indexes, df_cf=None, metric_sources=METRIC_SOURCES):
+    """Ma trận (chỉ tiêu x kỳ): mỗi chỉ tiêu là một lần tra dict trong LineItemIndex."""
+    sources = {'bs': df_bs, 'is': df_is, 'cf': pd.DataFrame() if df_cf is None else df_cf}
+    values = {
+        stmt: df[years].to_numpy(dtype=float) if not df.empty else np.zeros((0, len(years)))
+        for stmt, df in sources.items()
+    }
+    matrix = np.zeros((len(metric_sources), len(years)))
+    for i, (key, stmt) in enumerate(metric_sources.items()):
+        pos = indexes[stmt].position(key) if stmt in indexes else None
+        if pos is not None:
+            matrix[i] = values[stmt][pos]
+    matrix = np.nan_to_num(matrix, nan=0.0)
+    return {key: matrix[i] for i, key in enumerate(metric_sources)}
+
+
+def period_changes(values, delta_name, growth_name=None):
+    """So sánh mọi cặp kỳ liên tiếp (Yk vs Yk-1) của ma trận (dòng x kỳ) bằng phép dịch trục kỳ.
+
+    Trả về dict cột theo thứ tự Delta Y2, Growth Y2, Delta Y3, Growth Y3, ...
+    Growth (%) chia cho 1e-9 khi kỳ trước bằng 0, giống công thức cũ.
+    """
+    previous = values[:, :-1]
+    delta = values[:, 1:] - previous
+    if growth_name:
+        previous = previous.astype(float)
+        growth = delta / np.where(previous == 0, 1e-9, previous) * 100
+
+    columns = {}
+    for k in range(2, values.shape[1] + 1):
+        suffix = f'(Y{k} vs Y{k - 1})'
+        columns[f'{delta_name} {suffix}'] = delta[:, k - 2]
+        if growth_name:
+            columns[f'{growth_name} {suffix}'] = growth[:, k - 2]
+    return columns
+
+
+def previous_period(values):
+    """Giá trị kỳ trước theo trục kỳ (kỳ đầu tiên dùng chính nó)."""
+    return np.concatenate([values[..., :1], values[..., :-1]], axis=-1)
+
+
+def average_balance(values):
+    """Số dư bình quân đầu kỳ/cuối kỳ."""
+    return safe_div_array(values + previous_period(values), 2)
+
+
+# Khóa hệ số -> (chỉ tiêu dùng số cuối kỳ, chỉ tiêu dùng số dư bình quân với kỳ trước).
+# Là đồ thị phụ thuộc chỉ tiêu -> hệ số: sửa chỉ tiêu kỳ k làm đổi hệ số kỳ k, và cả kỳ k+1
+# nếu chỉ tiêu được lấy bình quân (bctc.incremental chỉ tính lại các ô này).
+RATIO_INPUTS = {
+    'current_ratio': (('TSNH', 'NO_NGAN_HAN'), ()),
+    'quick_ratio': (('TSNH', 'HTK', 'NO_NGAN_HAN'), ()),
+    'inv_turnover': (('GVHB',), ('HTK',)),
+    'inv_days': (('GVHB',), ('HTK',)),
+    'rcv_turnover': (('DT_THUAN',), ('PHAI_THU',)),
+    'rcv_days': (('DT_THUAN',), ('PHAI_THU',)),
+    'wcl_turnover': (('DT_THUAN',), ('TSNH', 'NO_NGAN_HAN')),
+    'equity_ratio': (('VCSH', 'TTS'), ()),
+    'd_to_e_ratio': (('NPT', 'VCSH'), ()),
+    'ros_ratio': (('LNST', 'DT_THUAN'), ()),
+    'roa_ratio': (('LNST',), ('TTS',)),
+    'roe_ratio': (('LNST',), ('VCSH',)),
+}
+
+
+def _roe(data):
+    # ROE là NaN khi VCSH bình quân <= 0
+    avg_vcsh = average_balance(data['VCSH'])
+    return np.where(avg_vcsh <= 0, np.nan, safe_div_array(data['LNST'], avg_vcsh) * 100)
+
+
+# Khóa hệ số -> công thức trên ma trận chỉ tiêu (build_metric_matrix), tính cho mọi kỳ một lần
+RATIO_FORMULAS = {
+    # Thanh toán
+    'current_ratio': lambda data: safe_div_array(data['TSNH'], data['NO_NGAN_HAN']),
+    'quick_ratio': lambda data: safe_div_array(data['TSNH'] - data['HTK'], data['NO_NGAN_HAN']),
+    # Hoạt động
+    'inv_turnover': lambda data: safe_div_array(data['GVHB'], average_balance(data['HTK'])),
+    'inv_days': lambda data: safe_div_array(365, RATIO_FORMULAS['inv_turnover'](data)),
+    'rcv_turnover': lambda data: safe_div_array(data['DT_THUAN'], average_balance(data['PHAI_THU'])),
+    'rcv_days': lambda data: safe_div_array(365, RATIO_FORMULAS['rcv_turnover'](data)),
+    'wcl_turnover': lambda data: safe_div_array(data['DT_THUAN'], average_balance(data['TSNH'] - data['NO_NGAN_HAN'])),
+    # Cân nợ (Solvency/Leverage)
+    'equity_ratio': lambda data: safe_div_array(data['VCSH'], data['TTS']),
+    'd_to_e_ratio': lambda data: safe_div_array(data['NPT'], data['VCSH']),
+    # Sinh lời (Profitability)
+    'ros_ratio': lambda data: safe_div_array(data['LNST'], data['DT_THUAN']) * 100,
+    'roa_ratio': lambda data: safe_div_array(data['LNST'], average_balance(data['TTS'])) * 100,
+    'roe_ratio': _roe,
+}
+
+
+def compute_financial_ratios(df_bs, df_is, years, indexes):
+    """Tính toàn bộ Chỉ số Tài chính bằng phép toán mảng, trả về df_final_ratios."""
+    data = build_metric_matrix(df_bs, df_is, years, indexes)
+
+    values = np.vstack([RATIO_FORMULAS[key](data) for key, _, _ in RATIO_DEFINITIONS])
+    df_final_ratios = pd.DataFrame(values, columns=years)
+    df_final_ratios.insert(0, 'Chỉ tiêu', [name for _, name, _ in RATIO_DEFINITIONS])
+
+    # Tính so sánh (np.nan - number = np.nan, điều này là OK vì format_vn_delta_ratio xử lý được)
+    changes = period_changes(values, 'S.S Tuyệt đối')
+    return pd.concat([df_final_ratios, pd.DataFrame(changes, index=df_final_ratios.index)], axis=1)
+
+# === KẾT THÚC [V18] ===
+
+# === BÁO CÁO LƯU CHUYỂN TIỀN TỆ (LCTT) VÀ HỆ SỐ DÒNG TIỀN ===
+
+# Chỉ tiêu cần cho hệ số dòng tiền (xem bctc.index.CASH_FLOW_ALIASES / LINE_ITEM_ALIASES) -> bảng nguồn
+CASH_FLOW_METRIC_SOURCES = {
+    'CFO': 'cf',
+    'CAPEX': 'cf',
+    'LAI_VAY_DA_TRA': 'cf',
+    'LNST': 'is',
+    'DT_THUAN': 'is',
+    'CP_LAI_VAY': 'is',
+    'TTS': 'bs',
+    'NO_NGAN_HAN': 'bs',
+    'NPT': 'bs',
+}
+
+# Dòng thêm vào cuối bảng LCTT khi tìm thấy cả CFO và Tiền chi mua sắm TSCĐ
+FCF_LABEL = 'Dòng tiền tự do (FCF = LCTT thuần từ HĐKD - Chi mua sắm TSCĐ)'
+
+# Thứ tự hiển thị: Chất lượng dòng tiền -> Khả năng trả nợ bằng tiền
+CASH_RATIO_DEFINITIONS = [
+    ('cash_conversion', 'Tỷ lệ chuyển đổi tiền (CFO/LNST) (Lần)', 'Cash Flow'),
+    ('cfo_margin', 'Tỷ suất dòng tiền HĐKD trên Doanh thu thuần (%)', 'Cash Flow'),
+    ('fcf_margin', 'Tỷ suất dòng tiền tự do trên Doanh thu thuần (%)', 'Cash Flow'),
+    ('cash_roa', 'Tỷ suất dòng tiền trên Tài sản (CFO/TTS bình quân) (%)', 'Cash Flow'),
+    ('cfo_to_current_debt', 'Hệ số trả Nợ ngắn hạn bằng tiền (CFO/Nợ ngắn hạn bình quân) (Lần)', 'Cash Coverage'),
+    ('cfo_to_debt', 'Hệ số trả Nợ bằng tiền (CFO/Nợ phải trả bình quân) (Lần)', 'Cash Coverage'),
+    ('cash_interest_coverage', 'Khả năng trả lãi bằng tiền ((CFO + Lãi vay)/Lãi vay) (Lần)', 'Cash Coverage'),
+    ('capex_coverage', 'Hệ số tài trợ đầu tư bằng tiền (CFO/Chi mua sắm TSCĐ) (Lần)', 'Cash Coverage'),
+]
+
+# Khóa hệ số -> (chỉ tiêu dùng số trong kỳ, chỉ tiêu dùng số dư bình quân), như RATIO_INPUTS
+CASH_RATIO_INPUTS = {
+    'cash_conversion': (('CFO', 'LNST'), ()),
+    'cfo_margin': (('CFO', 'DT_THUAN'), ()),
+    'fcf_margin': (('CFO', 'CAPEX', 'DT_THUAN'), ()),
+    'cash_roa': (('CFO',), ('TTS',)),
+    'cfo_to_current_debt': (('CFO',), ('NO_NGAN_HAN',)),
+    'cfo_to_debt': (('CFO',), ('NPT',)),
+    'cash_interest_coverage': (('CFO', 'LAI_VAY_DA_TRA', 'CP_LAI_VAY'), ()),
+    'capex_coverage': (('CFO', 'CAPEX'), ()),
+}
+
+
+def free_cash_flow(data):
+    # Tiền chi mua sắm TSCĐ thường ghi số âm trên LCTT; lấy trị tuyệt đối để không phụ thuộc cách ghi dấu
+    return data['CFO'] - np.abs(data['CAPEX'])
+
+
+def _cash_conversion(data):
+    # Không có ý nghĩa khi LNST <= 0 (lỗ): NaN như ROE
+    return np.where(data['LNST'] <= 0, np.nan, safe_div_array(data['CFO'], data['LNST']))
+
+
+def _cash_interest_coverage(data):
+    # Lãi vay thực trả trên LCTT; kỳ không có thì dùng Chi phí lãi vay trên KQKD
+    interest = np.where(data['LAI_VAY_DA_TRA'] != 0, np.abs(data['LAI_VAY_DA_TRA']), np.abs(data['CP_LAI_VAY']))
+    return safe_div_array(data['CFO'] + interest, interest)
+
+
+# Khóa hệ số -> công thức trên ma trận chỉ tiêu (build_metric_matrix với CASH_FLOW_METRIC_SOURCES)
+CASH_RATIO_FORMULAS = {
+    'cash_conversion': _cash_conversion,
+    'cfo_margin': lambda data: safe_div_array(data['CFO'], data['DT_THUAN']) * 100,
+    'fcf_margin': lambda data: safe_div_array(free_cash_flow(data), data['DT_THUAN']) * 100,
+    'cash_roa': lambda data: safe_div_array(data['CFO'], average_balance(data['TTS'])) * 100,
+    'cfo_to_current_debt': lambda data: safe_div_array(data['CFO'], average_balance(data['NO_NGAN_HAN'])),
+    'cfo_to_debt': lambda data: safe_div_array(data['CFO'], average_balance(data['NPT'])),
+    'cash_interest_coverage': _cash_interest_coverage,
+    'capex_coverage': lambda data: safe_div_array(data['CFO'], np.abs(data['CAPEX'])),
+}
+
+
+def process_cash_flow(df_cash_flow, df_bs, df_is, indexes):
+    """So sánh giữa các kỳ của LCTT và các hệ số dòng tiền (vector hóa như process_financial_data).
+
+    `df_bs`/`df_is` là bảng đã qua process_financial_data (cột kỳ đã là số), `indexes` từ
+    build_statement_indexes(..., df_cf). Trả về (df_cf_processed, df_cash_ratios):
+    df_cf_processed cùng bố cục với KQKD ('S.S Tuyệt đối', 'S.S Tương đối (%)') và có thêm
+    dòng FCF; df_cash_ratios cùng bố cục với Chỉ số Tài chính ('S.S Tuyệt đối'). Cả hai rỗng
+    nếu không có LCTT hoặc không tìm thấy dòng LCTT thuần từ HĐKD.
+    """
+    years = period_columns(df_bs) or period_columns(df_is) or YEARS
+    df_cf = df_cash_flow.copy()
+    df_cash_ratios = pd.DataFrame(columns=['Chỉ tiêu'] + years)
+    if df_cf.empty or 'CFO' not in indexes['cf']:
+        return pd.DataFrame(columns=['Chỉ tiêu'] + years), df_cash_ratios
+
+    for col in years:
+        df_cf[col] = pd.to_numeric(df_cf[col], errors='coerce').fillna(0)
+    data = build_metric_matrix(df_bs, df_is, years, indexes, df_cf=df_cf, metric_sources=CASH_FLOW_METRIC_SOURCES)
+
+    df_cf = df_cf[['Chỉ tiêu'] + years].reset_index(drop=True)
+    if 'CAPEX' in indexes['cf']:
+        df_cf.loc[len(df_cf)] = [FCF_LABEL, *free_cash_flow(data)]
+    cf_changes = period_changes(df_cf[years].to_numpy(dtype=float), 'S.S Tuyệt đối', 'S.S Tương đối (%)')
+    df_cf = pd.concat([df_cf, pd.DataFrame(cf_changes, index=df_cf.index)], axis=1)
+
+    # Không có dòng Tiền chi mua sắm TSCĐ: bỏ các hệ số cần FCF thay vì coi CAPEX = 0
+    definitions = [
+        (key, name) for key, name, _ in CASH_RATIO_DEFINITIONS
+        if 'CAPEX' in indexes['cf'] or 'CAPEX' not in CASH_RATIO_INPUTS[key][0]
+    ]
+    values = np.vstack([CASH_RATIO_FORMULAS[key](data) for key, _ in definitions])
+    df_cash_ratios = pd.DataFrame(values, columns=years)
+    df_cash_ratios.insert(0, 'Chỉ tiêu', [name for _, name in definitions])
+    changes = period_changes(values, 'S.S Tuyệt đối')
+    df_cash_ratios = pd.concat([df_cash_ratios, pd.DataFrame(changes, index=df_cash_ratios.index)], axis=1)
+    return df_cf, df_cash_ratios
+
+# === KẾT THÚC LCTT ===
+
+
+# --- Hàm tính toán chính ---
+def process_financial_data(df_balance_sheet, df_income_statement, indexes=None):
+    """
+    Thực hiện các phép tính Tăng trưởng, So sánh Tuyệt đối, Tỷ trọng Cơ cấu, Tỷ trọng Chi phí/DT thuần và Chỉ số Tài chính.
+    [CẬP NHẬT] Bổ sung Vòng quay Phải thu, Vòng quay VLĐ, ROS, ROA, ROE.
+    [CẬP NHẬT] Sắp xếp lại df_final_ratios: Thanh toán -> Hoạt động -> Cân nợ -> Sinh lời.
+    [CẬP NHẬT] Tra cứu chỉ tiêu qua LineItemIndex (`indexes` từ build_statement_indexes, tự dựng nếu None).
+    [CẬP NHẬT] Hỗ trợ N kỳ ('Năm 1' ... 'Năm N'): so sánh mọi cặp kỳ liên tiếp (Yk vs Yk-1).
+    Trả về tuple (df_bs_processed, df_is_processed, df_ratios_processed, df_final_ratios)
+    """
+
+    df_bs = df_balance_sheet.copy()
+    df_is = df_income_statement.copy()
+    years = period_columns(df_bs) or period_columns(df_is) or YEARS
+    if indexes is None:
+        indexes = build_statement_indexes(df_bs, df_is)
+
+    # Đảm bảo các giá trị là số để tính toán (trước khi dựng ma trận chỉ tiêu)
+    for df in [df_bs, df_is]:
+        if not df.empty:
+            for col in years:
+                if col in df.columns:
+                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+    # -----------------------------------------------------------------
+    # PHẦN 1: XỬ LÝ BẢNG CÂN ĐỐI KẾ TOÁN (BALANCE SHEET - BS)
+    # -----------------------------------------------------------------
+    if not df_bs.empty:
+        bs_values = df_bs[years].to_numpy()
+        new_columns = period_changes(bs_values, 'Delta', 'Growth')
+
+        # Tính Tỷ trọng theo Tổng Tài sản
+        tts_pos = indexes['bs'].position('TTS')
+        tong_tai_san = bs_values[tts_pos].astype(float) if tts_pos is not None else np.full(len(years), 1e-9)
+        shares = bs_values / np.where(tong_tai_san == 0, 1e-9, tong_tai_san) * 100
+        for k, year in enumerate(years):
+            new_columns[f'Tỷ trọng {year} (%)'] = shares[:, k]
+
+        df_bs = pd.concat([df_bs, pd.DataFrame(new_columns, index=df_bs.index)], axis=1)
+
+    # -----------------------------------------------------------------
+    # PHẦN 2 & 3: XỬ LÝ KQKD & TỶ TRỌNG CHI PHÍ / DOANH THU THUẦN
+    # -----------------------------------------------------------------
+    if not df_is.empty:
+        is_changes = period_changes(df_is[years].to_numpy(), 'S.S Tuyệt đối', 'S.S Tương đối (%)')
+        df_is = pd.concat([df_is, pd.DataFrame(is_changes, index=df_is.index)], axis=1)
+
+    # Tính Tỷ trọng Chi phí/DT Thuần (df_ratios)
+    df_ratios = pd.DataFrame(columns=['Chỉ tiêu'] + years)
+    if not df_is.empty:
+        dt_thuan_pos = indexes['is'].position('DT_THUAN')
+
+        if dt_thuan_pos is not None:
+            is_values = df_is[years].to_numpy(dtype=float)
+            divisors = np.where(is_values[dt_thuan_pos] == 0, 1e-9, is_values[dt_thuan_pos])
+
+            found = [(name, indexes['is'].position(key)) for name, key in COST_RATIO_ITEMS.items()]
+            found = [(name, pos) for name, pos in found if pos is not None]
+
+            cost_values = is_values[[pos for _, pos in found]].reshape(len(found), len(years)) / divisors * 100
+            df_ratios = pd.DataFrame(cost_values, columns=years)
+            df_ratios.insert(0, 'Chỉ tiêu', [name for name, _ in found])
+            # So sánh tỷ trọng giữa hai kỳ là hiệu số điểm phần trăm
+            df_ratios = pd.concat(
+                [df_ratios, pd.DataFrame(period_changes(cost_values, 'S.S Tương đối (%)'), index=df_ratios.index)],
+                axis=1,
+            )
+
+    # -----------------------------------------------------------------
+    # PHẦN 4: TÍNH TẤT CẢ CÁC CHỈ SỐ TÀI CHÍNH MỚI/CŨ (VECTOR HÓA)
+    # -----------------------------------------------------------------
+    df_final_ratios = compute_financial_ratios(df_bs, df_is, years, indexes)
+
+    return df_bs, df_is, df_ratios, df_final_ratios
+
+
+# === [V15] LỌC BỎ CÁC DÒNG CÓ TẤT CẢ GIÁ TRỊ NĂM BẰNG 0 ===
+def filter_zero_rows(df):
+    if df.empty:
+        return df
+
+    # Lọc các cột số có trong df
+    cols_to_sum = period_columns(df)
+
+    if not cols_to_sum:
+        return df
+
+    mask = (df[cols_to_sum].abs().sum(axis=1)) != 0
+    return df[mask].copy()
+# === KẾT THÚC [V15] ===
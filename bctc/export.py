@@ -0,0 +1,149 @@
+"""Xuất các bảng đã xử lý (BĐKT, KQKD, tỷ trọng chi phí, hệ số tài chính; LCTT và hệ số dòng tiền
+nếu có) với giá trị số gốc.
+
+- Parquet / Arrow IPC: một bảng dạng dài với lược đồ cố định EXPORT_SCHEMA (không
+  phụ thuộc số kỳ), mỗi dòng là một (bảng, chỉ tiêu, kỳ, loại số liệu) -> giá trị.
+- Excel (.xlsx): mỗi bảng một sheet dạng rộng như trên màn hình (cột kỳ mang nhãn
+  kỳ thực tế) nhưng là số chưa định dạng, kèm sheet 'Thong_tin' ghi lược đồ.
+
+Mỗi hàm export_* trả về bytes để đưa thẳng vào st.download_button. Giá trị của mỗi
+bảng chỉ được chép một lần (DataFrame -> mảng NumPy -> cột Arrow dùng chung bộ nhớ).
+
+Cần ``pyarrow`` (không được import sẵn trong ``bctc``).
+"""
+import io
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from .context import column_code
+
+# Tăng khi đổi tên/kiểu cột của EXPORT_SCHEMA
+EXPORT_SCHEMA_VERSION = 1
+
+# (loại bảng, tên bảng trong AnalysisResult, tên bảng/sheet khi xuất)
+EXPORT_TABLES = [
+    ('bs', 'df_bs_processed', 'balance_sheet'),
+    ('is', 'df_is_processed', 'income_statement'),
+    ('cost_ratios', 'df_ratios_processed', 'cost_ratios'),
+    ('key_ratios', 'df_financial_ratios_processed', 'key_ratios'),
+    ('cf', 'df_cf_processed', 'cash_flow'),
+    ('cash_ratios', 'df_cash_ratios_processed', 'cash_ratios'),
+]
+
+# Mã cột (bctc.context.column_code) -> loại số liệu
+MEASURES = {
+    'K': 'value',        # giá trị kỳ k
+    'D': 'delta',        # chênh lệch tuyệt đối kỳ k so với kỳ k-1 (tỷ trọng chi phí: điểm %)
+    'G': 'growth_pct',   # tăng trưởng % kỳ k so với kỳ k-1
+    'TT': 'share_pct',   # tỷ trọng % trên tổng tài sản/nguồn vốn kỳ k
+}
+
+EXPORT_SCHEMA = pa.schema([
+    pa.field('table', pa.string(), nullable=False),
+    pa.field('row', pa.int32(), nullable=False),           # thứ tự dòng trong bảng đã xử lý
+    pa.field('line_item', pa.string(), nullable=False),    # nhãn 'Chỉ tiêu' gốc
+    pa.field('row_kind', pa.string(), nullable=False),     # 'major', 'total', 'detail', 'normal'
+    pa.field('period_index', pa.int16(), nullable=False),  # k trong 'Năm k' (1 = kỳ cũ nhất)
+    pa.field('period', pa.string(), nullable=False),       # nhãn kỳ, vd. '31/12/2024'
+    pa.field('measure', pa.string(), nullable=False),      # khóa của MEASURES
+    pa.field('value', pa.float64()),                       # null nếu không tính được
+], metadata={'bctc_export_schema_version': str(EXPORT_SCHEMA_VERSION)})
+
+EXCEL_INFO_SHEET = 'Thong_tin'
+_CODE_RE = re.compile(r'([A-Z]+)(\d+)')
+_PERIOD_RE = re.compile(r'Năm (\d+)')
+
+
+def _numeric_columns(df, kind):
+    """[(tên cột, loại số liệu, k)] của các cột số, theo thứ tự cột của bảng."""
+    columns = []
+    for col in df.columns:
+        match = _CODE_RE.fullmatch(column_code(col, kind) or '')
+        if match:
+            columns.append((col, MEASURES[match.group(1)], int(match.group(2))))
+    return columns
+
+
+def to_long_table(result):
+    """pyarrow.Table dạng dài theo EXPORT_SCHEMA cho mọi bảng trong EXPORT_TABLES."""
+    labels = list(result.period_labels)
+    tables = []
+    for kind, name, export_name in EXPORT_TABLES:
+        df = getattr(result, name)
+        if df is None or df.empty:
+            continue
+        columns = _numeric_columns(df, kind)
+        if not columns:
+            continue
+        # Bản sao duy nhất: (dòng x cột số) float64, trải theo dòng
+        values = df[[col for col, _, _ in columns]].apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+        n_rows, n_cols = values.shape
+        measures = np.array([measure for _, measure, _ in columns], dtype=object)
+        periods = np.array([k for _, _, k in columns], dtype='int16')
+        row_kinds = result.row_kinds.get(name) or ['normal'] * n_rows
+        tables.append(pa.Table.from_arrays([
+            pa.array(np.full(n_rows * n_cols, export_name, dtype=object), pa.string()),
+            pa.array(np.repeat(np.arange(n_rows, dtype='int32'), n_cols)),
+            pa.array(np.repeat(df['Chỉ tiêu'].astype(str).to_numpy(dtype=object), n_cols), pa.string()),
+            pa.array(np.repeat(np.asarray(row_kinds, dtype=object), n_cols), pa.string()),
+            pa.array(np.tile(periods, n_rows)),
+            pa.array(np.tile(np.array([labels[k - 1] for k in periods], dtype=object), n_rows), pa.string()),
+            pa.array(np.tile(measures, n_rows), pa.string()),
+            pa.array(values.reshape(-1), from_pandas=True),  # NaN -> null
+        ], schema=EXPORT_SCHEMA))
+    if not tables:
+        return EXPORT_SCHEMA.empty_table()
+    return pa.concat_tables(tables)
+
+
+def export_parquet(result):
+    buffer = io.BytesIO()
+    pq.write_table(to_long_table(result), buffer, compression='zstd')
+    return buffer.getvalue()
+
+
+def export_arrow(result):
+    """Arrow IPC (file .arrow / Feather v2)."""
+    buffer = io.BytesIO()
+    feather.write_feather(to_long_table(result), buffer, compression='zstd')
+    return buffer.getvalue()
+
+
+def export_excel(result):
+    """.xlsx nhiều sheet: mỗi bảng dạng rộng (số gốc, cột kỳ theo nhãn kỳ) và sheet lược đồ."""
+    labels = list(result.period_labels)
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        for kind, name, export_name in EXPORT_TABLES:
+            df = getattr(result, name)
+            if df is None or df.empty:
+                continue
+            columns = ['Chỉ tiêu'] + [col for col, _, _ in _numeric_columns(df, kind)]
+            # 'Năm k' -> nhãn kỳ; header= đổi tên khi ghi, không tạo bản sao DataFrame đã đổi tên
+            header = [_PERIOD_RE.sub(lambda match: labels[int(match.group(1)) - 1], str(col)) for col in columns]
+            df.to_excel(writer, sheet_name=export_name, columns=columns, header=header, index=False)
+        info = pd.DataFrame({
+            'key': ['schema_version', 'periods'] + [field.name for field in EXPORT_SCHEMA],
+            'value': [EXPORT_SCHEMA_VERSION, '; '.join(labels)] + [str(field.type) for field in EXPORT_SCHEMA],
+        })
+        info.to_excel(writer, sheet_name=EXCEL_INFO_SHEET, index=False)
+    return buffer.getvalue()
+
+
+# Định dạng -> (hàm xuất, đuôi file, MIME)
+EXPORT_FORMATS = {
+    'parquet': (export_parquet, 'parquet', 'application/vnd.apache.parquet'),
+    'arrow': (export_arrow, 'arrow', 'application/vnd.apache.arrow.file'),
+    'xlsx': (export_excel, 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def export_result(result, fmt):
+    """(bytes, đuôi file, MIME) của AnalysisResult ở định dạng `fmt` (khóa của EXPORT_FORMATS)."""
+    exporter, extension, mime = EXPORT_FORMATS[fmt]
+    return exporter(result), extension, mime
@@ -0,0 +1,164 @@
+"""Định dạng số theo chuẩn Việt Nam ('.' phân cách hàng nghìn, ',' thập phân) cho cả cột.
+
+Mỗi hàm nhận một mảng (ndarray, Series, list) và trả về mảng chuỗi cùng độ dài,
+hoặc một chuỗi nếu đầu vào là số vô hướng. Kết quả giống hệt các formatter theo
+từng ô trước đây ('1.234.567', '-12.345', '12,3%', '1,25'), nhưng phần kiểm tra
+NaN/0, làm tròn và dấu được làm một lần cho cả cột bằng NumPy, còn đổi dấu phân
+cách chỉ là một lần str.translate cho mỗi giá trị.
+
+Dùng chung cho Styler (style_financial_table), bối cảnh Markdown cho Chatbot và file xuất.
+"""
+import numpy as np
+import pandas as pd
+
+from .ingest import period_columns
+
+# '1,234.5' (định dạng Python) -> '1.234,5'
+_VN_SEPARATORS = str.maketrans(',.', '.,')
+
+
+def _as_float_array(values):
+    series = pd.to_numeric(pd.Series(np.ravel(values)), errors='coerce')
+    return series.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _format_column(values, fmt, decimals, hide_zero):
+    """Khung chung: ô NaN/vô cực (và 0 nếu `hide_zero`) -> '', còn lại -> fmt đã đổi dấu phân cách."""
+    scalar = np.ndim(values) == 0
+    raw = _as_float_array(values)
+    # Làm tròn như round() trên số numpy của bản cũ, rồi mới định dạng
+    arr = np.round(raw, decimals)
+    if decimals == 0:
+        arr = arr + 0.0  # round() trả về int nên bản cũ không bao giờ in '-0'
+    show = np.isfinite(arr)
+    if hide_zero:
+        show &= raw != 0
+    out = np.full(arr.shape, '', dtype=object)
+    out[show] = [format(val, fmt).translate(_VN_SEPARATORS) for val in arr[show].tolist()]
+    return out[0] if scalar else out
+
+
+def format_vn_currency(values):
+    """Tiền tệ (hàng đơn vị): 1234567.4 -> '1.234.567'. Ẩn 0 và NaN."""
+    return _format_column(values, ',.0f', 0, hide_zero=True)
+
+
+def format_vn_percentage(values):
+    """Tỷ lệ 1 chữ số thập phân: 12.34 -> '12,3%'. Ẩn 0 và NaN."""
+    out = _format_column(values, ',.1f', 1, hide_zero=True)
+    if np.ndim(out) == 0:
+        return out + '%' if out else out
+    out[out != ''] += '%'
+    return out
+
+
+def format_vn_delta_currency(values):
+    """Chênh lệch tiền tệ: chỉ dùng '-' khi âm, không '+' khi dương; 0 vẫn hiển thị '0'."""
+    return _format_column(values, ',.0f', 0, hide_zero=False)
+
+
+def format_vn_delta_ratio(values):
+    """Chỉ số/chênh lệch 2 chữ số thập phân, không phân cách hàng nghìn: -1.234 -> '-1,23'. Ẩn 0 và NaN."""
+    return _format_column(values, '.2f', 2, hide_zero=True)
+
+
+# -----------------------------------------------------
+# ĐỊNH DẠNG CẢ BẢNG THEO LOẠI CỘT
+# -----------------------------------------------------
+# Loại bảng -> (formatter cho cột kỳ 'Năm k', [(tiền tố cột so sánh, formatter)])
+TABLE_FORMATS = {
+    'bs': (format_vn_currency, [
+        ('Delta', format_vn_delta_currency),
+        ('Growth', format_vn_percentage),
+        ('Tỷ trọng', format_vn_percentage),
+    ]),
+    'is': (format_vn_currency, [
+        ('S.S Tuyệt đối', format_vn_delta_currency),
+        ('S.S Tương đối', format_vn_percentage),
+    ]),
+    'cost_ratios': (format_vn_percentage, [
+        ('S.S Tương đối', format_vn_delta_ratio),
+    ]),
+    'key_ratios': (format_vn_delta_ratio, [
+        ('S.S Tuyệt đối', format_vn_delta_ratio),
+    ]),
+}
+# LCTT cùng bố cục với KQKD; Hệ số dòng tiền cùng bố cục với Chỉ số Tài chính
+TABLE_FORMATS['cf'] = TABLE_FORMATS['is']
+TABLE_FORMATS['cash_ratios'] = TABLE_FORMATS['key_ratios']
+
+
+def column_formatters(df, kind):
+    """{tên cột: formatter} cho các cột số của một bảng đã xử lý (kind là khóa của TABLE_FORMATS)."""
+    period_formatter, prefixed = TABLE_FORMATS[kind]
+    formatters = {col: period_formatter for col in period_columns(df)}
+    for col in df.columns:
+        for prefix, formatter in prefixed:
+            if col not in formatters and str(col).startswith(prefix):
+                formatters[col] = formatter
+    return formatters
+
+
+def format_table(df, kind):
+    """Bản sao của `df` với các cột số đã được định dạng thành chuỗi VN."""
+    df_formatted = df.copy()
+    for col, formatter in column_formatters(df, kind).items():
+        df_formatted[col] = formatter(df[col])
+    return df_formatted
+
+
+# -----------------------------------------------------
+# PHÂN LOẠI DÒNG ĐỂ IN ĐẬM/IN NGHIÊNG (thay cho highlight_financial_items theo từng dòng)
+# -----------------------------------------------------
+ROW_MAJOR, ROW_TOTAL, ROW_DETAIL, ROW_NORMAL = 'major', 'total', 'detail', 'normal'
+
+ROW_KIND_STYLES = {
+    ROW_MAJOR: 'font-weight: bold',
+    ROW_TOTAL: 'font-weight: bold',
+    ROW_DETAIL: 'font-style: italic',
+    ROW_NORMAL: '',
+}
+
+# Mục chính: 'A.', 'B.', 'C.' và số La Mã 'I.' ... 'X.' ở đầu dòng
+_MAJOR_PREFIX_RE = r'(?:[ABC]|I|II|III|IV|V|VI|VII|VIII|IX|X)\.'
+_MAJOR_KEYWORDS_RE = 'NỢ PHẢI TRẢ|VỐN CHỦ SỞ HỮU'
+# Tiêu đề nhóm trong bảng chỉ tiêu tài chính
+_MAJOR_TITLES = ['Khả năng thanh toán', 'Chỉ tiêu hoạt động', 'Chỉ tiêu cân nợ', 'Hệ số sinh lời']
+# Mục chi tiết TSCĐ
+_DETAIL_RE = 'Nguyên giá|Giá trị hao mòn lũy kế'
+
+
+def classify_rows(labels):
+    """Loại dòng (ROW_MAJOR/ROW_TOTAL/ROW_DETAIL/ROW_NORMAL) cho cả cột 'Chỉ tiêu' bằng regex vector hóa."""
+    items = pd.Series(labels, dtype=object).astype(str).str.strip()
+    upper = items.str.upper()
+    total = upper.str.contains('TỔNG CỘNG', regex=False).to_numpy()
+    major = (
+        items.str.match(_MAJOR_PREFIX_RE)
+        | upper.str.contains(_MAJOR_KEYWORDS_RE)
+        | items.isin(_MAJOR_TITLES)
+    ).to_numpy()
+    detail = items.str.contains(_DETAIL_RE).to_numpy()
+    return np.select([total, major, detail], [ROW_TOTAL, ROW_MAJOR, ROW_DETAIL], default=ROW_NORMAL).astype(object)
+
+
+def row_styles(row_kinds):
+    """Mảng CSS (một phần tử mỗi dòng) từ cột loại dòng đã tính sẵn."""
+    return np.array([ROW_KIND_STYLES[kind] for kind in row_kinds], dtype=object)
+
+
+# In đậm mục chính (A, I, TỔNG CỘNG), in nghiêng mục chi tiết (Nguyên giá, Hao mòn).
+# Loại dòng được phân loại sẵn một lần trong pipeline (analysis.row_kinds), ở đây chỉ tra CSS.
+def style_financial_table(df, columns, row_kinds):
+    """Chọn/đổi tên cột theo `columns` [(cột nội bộ, tên hiển thị, formatter)] và áp dụng style.
+
+    Các cột số được định dạng sẵn thành chuỗi (mỗi cột một lần gọi formatter) trước khi tạo Styler.
+    """
+    columns = [col for col in columns if col[0] in df.columns]
+    df_display = pd.DataFrame({'Chỉ tiêu': df['Chỉ tiêu']})
+    for internal, display, formatter in columns:
+        df_display[display] = formatter(df[internal])
+    css = np.repeat(row_styles(row_kinds)[:, None], df_display.shape[1], axis=1)
+    return df_display.style.apply(lambda _: css, axis=None).set_properties(
+        subset=[display for _, display, _ in columns], **{'text-align': 'right'}
+    )
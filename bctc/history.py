@@ -0,0 +1,76 @@
+"""Giới hạn lịch sử chat gửi cho Gemini: N lượt gần nhất giữ nguyên văn, các lượt cũ hơn
+được gộp dần vào một bản tóm tắt ngắn (rolling summary).
+
+Tóm tắt được dựng cục bộ (trích câu hỏi và câu đầu của câu trả lời), không tốn thêm
+lượt gọi API, và bị giới hạn độ dài, nên kích thước prompt mỗi lượt gần như không
+đổi dù phiên hỏi đáp dài bao nhiêu.
+"""
+import os
+import re
+from dataclasses import dataclass, field
+
+DEFAULT_MAX_TURNS = int(os.environ.get('BCTC_CHAT_MAX_TURNS', 6))
+DEFAULT_SUMMARY_CHARS = int(os.environ.get('BCTC_CHAT_SUMMARY_CHARS', 2000))
+QUESTION_SNIPPET_CHARS = 200
+ANSWER_SNIPPET_CHARS = 240
+
+_MARKUP_RE = re.compile(r'[*_#`>|]+')
+_SPACES_RE = re.compile(r'\s+')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s')
+
+
+def snippet(text, limit):
+    """Bỏ ký hiệu Markdown, gộp khoảng trắng và cắt tại cuối câu gần nhất trong `limit` ký tự."""
+    text = _SPACES_RE.sub(' ', _MARKUP_RE.sub('', str(text))).strip()
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    ends = [match.start() for match in _SENTENCE_END_RE.finditer(cut)]
+    if ends and ends[-1] > limit // 3:
+        return cut[:ends[-1]]
+    return cut.rstrip() + '…'
+
+
+@dataclass
+class ConversationMemory:
+    """Trạng thái tóm tắt của một phiên chat (lưu trong st.session_state giữa các lượt)."""
+    max_turns: int = DEFAULT_MAX_TURNS
+    summary_max_chars: int = DEFAULT_SUMMARY_CHARS
+    summary_lines: list = field(default_factory=list)
+    folded: int = 0  # Số tin nhắn đầu lịch sử đã được gộp vào tóm tắt
+    dropped_lines: int = 0  # Số dòng tóm tắt cũ nhất đã bị bỏ do vượt summary_max_chars
+
+    def window(self, history):
+        """Gộp các tin nhắn ngoài `max_turns` lượt cuối vào tóm tắt; trả về các tin nhắn giữ nguyên văn.
+
+        `history` là danh sách {"role", "content"} theo thứ tự thời gian (không gồm lời chào
+        và câu hỏi đang gửi).
+        """
+        if self.folded > len(history):
+            # Lịch sử đã bị xóa/làm mới: bắt đầu lại
+            self.reset()
+        keep_from = max(self.folded, len(history) - 2 * self.max_turns)
+        for msg in history[self.folded:keep_from]:
+            if msg["role"] == "user":
+                self.summary_lines.append(f"- Hỏi: {snippet(msg['content'], QUESTION_SNIPPET_CHARS)}")
+            else:
+                self.summary_lines.append(f"  Đáp: {snippet(msg['content'], ANSWER_SNIPPET_CHARS)}")
+        self.folded = keep_from
+        while self.summary_lines and len('\n'.join(self.summary_lines)) > self.summary_max_chars:
+            self.summary_lines.pop(0)
+            self.dropped_lines += 1
+        return history[keep_from:]
+
+    @property
+    def summary(self):
+        if not self.summary_lines:
+            return ""
+        lines = list(self.summary_lines)
+        if self.dropped_lines:
+            lines.insert(0, "- (Các lượt cũ hơn đã được lược bỏ.)")
+        return '\n'.join(lines)
+
+    def reset(self):
+        self.summary_lines = []
+        self.folded = 0
+        self.dropped_lines = 0
@@ -0,0 +1,238 @@
+"""Tính lại từng phần khi người dùng sửa một vài ô số liệu gốc của BĐKT/KQKD.
+
+Sửa chỉ tiêu ở dòng r, kỳ k chỉ tính lại các ô phụ thuộc vào nó:
+
+- cùng bảng: hai cặp so sánh chứa kỳ k, (Yk vs Yk-1) và (Yk+1 vs Yk), của dòng r; với BĐKT
+  thêm tỷ trọng kỳ k của dòng r (cả cột tỷ trọng kỳ k nếu r là Tổng tài sản);
+- Tỷ trọng Chi phí/DT thuần kỳ k của dòng tương ứng (mọi dòng nếu r là DT thuần);
+- các hệ số dùng chỉ tiêu đó theo engine.RATIO_INPUTS, ở kỳ k và cả kỳ k+1 nếu chỉ tiêu
+  được lấy bình quân, cùng các cột so sánh của những hệ số này.
+
+Ví dụ sửa Hàng tồn kho kỳ k chỉ tính lại Quick Ratio, Vòng quay HTK và Số ngày tồn kho.
+Các bảng được giữ ở dạng chưa lọc dòng 0 để vị trí dòng khớp LineItemIndex; result()
+mới lọc dòng, tính lại phần LCTT (một lần tra ma trận, xem engine.process_cash_flow) và
+dựng lại context Chatbot.
+"""
+import pandas as pd
+
+from .context import build_compact_context
+from .engine import (
+    COST_RATIO_ITEMS,
+    METRIC_SOURCES,
+    RATIO_DEFINITIONS,
+    RATIO_FORMULAS,
+    RATIO_INPUTS,
+    build_metric_matrix,
+    build_statement_indexes,
+    filter_zero_rows,
+    period_changes,
+    process_cash_flow,
+    process_financial_data,
+)
+from .formatting import classify_rows
+from .ingest import ParsedStatements, period_columns
+from .pipeline import AnalysisResult
+from .telemetry import span
+
+FRAME_NAMES = ['df_bs_processed', 'df_is_processed', 'df_ratios_processed', 'df_financial_ratios_processed']
+# Bảng số liệu gốc được phép sửa -> bảng đã xử lý chứa nó
+STATEMENT_FRAMES = {'bs': 'df_bs_processed', 'is': 'df_is_processed'}
+
+
+class IncrementalAnalysis:
+    """Trạng thái phân tích có thể sửa từng ô; mỗi lần sửa chỉ tính lại các ô phụ thuộc.
+
+    Khởi tạo chạy process_financial_data một lần trên BĐKT/KQKD của `result.parsed`.
+    """
+
+    def __init__(self, result):
+        parsed = result.parsed
+        self.period_labels = list(result.period_labels)
+        self.period_cols = list(parsed.period_cols)
+        self.notes = list(result.notes)
+        self.timings = list(result.timings)
+        self.with_context = result.chat_context is not None
+        self._chat_context = result.chat_context
+        self.df_cf = parsed.df_cf
+        self.indexes = build_statement_indexes(parsed.df_bs, parsed.df_is, self.df_cf)
+        self.frames = dict(zip(FRAME_NAMES, process_financial_data(parsed.df_bs, parsed.df_is, self.indexes)))
+        df_bs, df_is = self.frames['df_bs_processed'], self.frames['df_is_processed']
+        self.years = period_columns(df_bs) or period_columns(df_is)
+        for df in self.frames.values():
+            # Số liệu gốc (và các cột so sánh tính từ nó) có thể là int64; ô sửa nhận số thực
+            numeric = df.select_dtypes('number').columns
+            df[numeric] = df[numeric].astype(float)
+        self.metrics = build_metric_matrix(df_bs, df_is, self.years, self.indexes)
+        self.edits = {}  # (bảng, dòng, cột kỳ) -> giá trị mới
+        self._originals = {}  # (bảng, dòng, cột kỳ) -> giá trị trước lần sửa đầu tiên
+        self._result = None
+
+        # (bảng, vị trí dòng) -> các khóa chỉ tiêu mà dòng đó cung cấp cho hệ số
+        self._metric_keys = {}
+        for key, statement in METRIC_SOURCES.items():
+            pos = self.indexes[statement].position(key)
+            if pos is not None:
+                self._metric_keys.setdefault((statement, pos), []).append(key)
+        # Vị trí dòng KQKD -> dòng trong bảng Tỷ trọng Chi phí (cùng thứ tự như process_financial_data)
+        self._dt_thuan_pos = self.indexes['is'].position('DT_THUAN')
+        cost_positions = [self.indexes['is'].position(key) for key in COST_RATIO_ITEMS.values()]
+        cost_positions = [pos for pos in cost_positions if pos is not None]
+        self._cost_rows = {pos: row for row, pos in enumerate(cost_positions)} if self._dt_thuan_pos is not None else {}
+        self._ratio_rows = {key: row for row, (key, _, _) in enumerate(RATIO_DEFINITIONS)}
+
+    def value(self, statement, row, year):
+        df = self.frames[STATEMENT_FRAMES[statement]]
+        return df.iat[row, df.columns.get_loc(year)]
+
+    def set_value(self, statement, row, year, value):
+        """Sửa ô (bảng 'bs'/'is', vị trí dòng, cột 'Năm k'); trả về [(bảng, dòng, cột)] các ô đã tính lại.
+
+        Đặt lại đúng giá trị gốc thì ô không còn được tính là đã sửa (xem reset_value).
+        """
+        value = 0.0 if value is None or pd.isna(value) else float(value)
+        current = self.value(statement, row, year)
+        if current == value:
+            return []
+        cell = (statement, row, year)
+        original = self._originals.setdefault(cell, current)
+        with span('incremental_update', statement=statement) as s:
+            frame = STATEMENT_FRAMES[statement]
+            df = self.frames[frame]
+            df.iat[row, df.columns.get_loc(year)] = value
+            k = self.years.index(year)
+            dirty = [(frame, row, year)]
+            if statement == 'bs':
+                dirty += self._update_changes(frame, [row], k, 'Delta', 'Growth')
+                tts_pos = self.indexes['bs'].position('TTS')
+                dirty += self._update_shares(range(len(df)) if row == tts_pos else [row], k)
+            else:
+                dirty += self._update_changes(frame, [row], k, 'S.S Tuyệt đối', 'S.S Tương đối (%)')
+                dirty += self._update_cost_ratios(row, k)
+            ratio_periods = {}
+            for key in self._metric_keys.get((statement, row), []):
+                self.metrics[key][k] = value
+                for ratio_key, (direct, averaged) in RATIO_INPUTS.items():
+                    if key in direct or key in averaged:
+                        periods = ratio_periods.setdefault(ratio_key, set())
+                        periods.update([k, k + 1] if key in averaged and k + 1 < len(self.years) else [k])
+            dirty += self._update_ratios(ratio_periods)
+            if value == original:
+                self.edits.pop(cell, None)
+                self._originals.pop(cell, None)
+            else:
+                self.edits[cell] = value
+            self._chat_context = None
+            self._result = None
+            s.attrs['dirty_cells'] = len(dirty)
+        return dirty
+
+    def reset_value(self, statement, row, year):
+        """Trả ô đã sửa về số liệu gốc; trả về các ô đã tính lại ([] nếu ô chưa bị sửa)."""
+        cell = (statement, row, year)
+        if cell not in self._originals:
+            return []
+        return self.set_value(statement, row, year, self._originals[cell])
+
+    def _pairs(self, periods):
+        """Các cặp so sánh (m, tên hậu tố) chứa một trong các kỳ `periods` (chỉ số 0)."""
+        pairs = sorted({m for k in periods for m in (k + 1, k + 2) if 2 <= m <= len(self.years)})
+        return [(m, f'(Y{m} vs Y{m - 1})') for m in pairs]
+
+    def _update_changes(self, frame, rows, k, delta_name, growth_name=None, periods=None):
+        """Tính lại các cột so sánh chứa kỳ k (hoặc các kỳ `periods`) cho `rows`."""
+        df = self.frames[frame]
+        rows = list(rows)
+        values = df[self.years].to_numpy(dtype=float)[rows]
+        dirty = []
+        for m, suffix in self._pairs([k] if periods is None else periods):
+            # period_changes trên đúng hai kỳ (m-1, m): thứ tự Delta, Growth
+            pair = list(period_changes(values[:, m - 2:m], delta_name, growth_name).values())
+            names = [f'{delta_name} {suffix}'] + ([f'{growth_name} {suffix}'] if growth_name else [])
+            for name, column in zip(names, pair):
+                df.iloc[rows, df.columns.get_loc(name)] = column
+                dirty += [(frame, row, name) for row in rows]
+        return dirty
+
+    def _update_shares(self, rows, k):
+        df = self.frames['df_bs_processed']
+        year = self.years[k]
+        tts_pos = self.indexes['bs'].position('TTS')
+        total = float(df.iat[tts_pos, df.columns.get_loc(year)]) if tts_pos is not None else 1e-9
+        rows = list(rows)
+        name = f'Tỷ trọng {year} (%)'
+        df.iloc[rows, df.columns.get_loc(name)] = df[year].to_numpy(dtype=float)[rows] / (total or 1e-9) * 100
+        return [('df_bs_processed', row, name) for row in rows]
+
+    def _update_cost_ratios(self, is_row, k):
+        if is_row == self._dt_thuan_pos:
+            cost_rows = self._cost_rows
+        elif is_row in self._cost_rows:
+            cost_rows = {is_row: self._cost_rows[is_row]}
+        else:
+            return []
+        df_is = self.frames['df_is_processed']
+        df = self.frames['df_ratios_processed']
+        year = self.years[k]
+        revenue = float(df_is.iat[self._dt_thuan_pos, df_is.columns.get_loc(year)])
+        is_values = df_is[year].to_numpy(dtype=float)
+        rows = list(cost_rows.values())
+        df.iloc[rows, df.columns.get_loc(year)] = is_values[list(cost_rows)] / (revenue or 1e-9) * 100
+        dirty = [('df_ratios_processed', row, year) for row in rows]
+        return dirty + self._update_changes('df_ratios_processed', rows, k, 'S.S Tương đối (%)')
+
+    def _update_ratios(self, ratio_periods):
+        """Tính lại các hệ số {khóa: các kỳ bị ảnh hưởng} và cột so sánh của chúng."""
+        df = self.frames['df_financial_ratios_processed']
+        dirty = []
+        for key, periods in ratio_periods.items():
+            row = self._ratio_rows[key]
+            values = RATIO_FORMULAS[key](self.metrics)
+            for k in sorted(periods):
+                df.iat[row, df.columns.get_loc(self.years[k])] = values[k]
+                dirty.append(('df_financial_ratios_processed', row, self.years[k]))
+            dirty += self._update_changes('df_financial_ratios_processed', [row], None, 'S.S Tuyệt đối', periods=periods)
+        return dirty
+
+    def result(self):
+        """AnalysisResult hiện tại (lọc dòng 0; dựng lại context Chatbot nếu đã có ô bị sửa)."""
+        if self._result is not None:
+            return self._result
+        cash_frames = process_cash_flow(self.df_cf, self.frames['df_bs_processed'], self.frames['df_is_processed'], self.indexes)
+        frames = {name: filter_zero_rows(df) for name, df in self.frames.items()}
+        frames['df_cf_processed'], frames['df_cash_ratios_processed'] = (filter_zero_rows(df) for df in cash_frames)
+        if self.with_context and self._chat_context is None and not frames['df_bs_processed'].empty:
+            self._chat_context = build_compact_context(
+                *(frames[name] for name in FRAME_NAMES), self.period_labels,
+                df_cf_processed=frames['df_cf_processed'], df_cash_ratios_processed=frames['df_cash_ratios_processed'],
+            )
+        statement_columns = ['Chỉ tiêu'] + self.years
+        parsed = ParsedStatements(
+            df_bs=self.frames['df_bs_processed'][statement_columns].copy(),
+            df_is=self.frames['df_is_processed'].reindex(columns=statement_columns).copy(),
+            period_cols=self.period_cols,
+            notes=[],
+            df_cf=self.df_cf,
+        )
+        notes = list(self.notes)
+        if self.edits:
+            notes.append(('info', f"Đã sửa {len(self.edits)} ô số liệu gốc; các bảng và chỉ số được tính lại theo số liệu đã sửa."))
+        self._result = AnalysisResult(
+            **frames,
+            period_labels=self.period_labels,
+            chat_context=self._chat_context,
+            notes=notes,
+            parsed=parsed,
+            row_kinds={name: list(classify_rows(df['Chỉ tiêu'])) if 'Chỉ tiêu' in df.columns else [] for name, df in frames.items()},
+            timings=self.timings,
+        )
+        return self._result
+
+
+def apply_edits(result, edits):
+    """AnalysisResult sau khi sửa `edits` [(bảng 'bs'/'is', vị trí dòng, cột 'Năm k', giá trị)]."""
+    if not edits:
+        return result
+    incremental = IncrementalAnalysis(result)
+    for statement, row, year, value in edits:
+        incremental.set_value(statement, row, year, value)
+    return incremental.result()
@@ -0,0 +1,107 @@
+"""Chỉ mục dòng 'Chỉ tiêu' đã chuẩn hóa, dựng một lần cho mỗi bảng báo cáo.
+
+Nhãn được gấp chữ hoa/thường và bỏ dấu tiếng Việt, bỏ số thứ tự đầu dòng
+('I.', 'A.', '1.', '-') rồi ánh xạ các khóa chuẩn (TSNH, HTK, TTS...) sang vị
+trí dòng. Sau khi dựng, mọi tra cứu theo khóa chỉ là một lần truy cập dict.
+"""
+import re
+import unicodedata
+
+# Khóa chuẩn -> danh sách từ khóa theo thứ tự ưu tiên (giữ nguyên từ khóa của get_value cũ)
+LINE_ITEM_ALIASES = {
+    'TSNH': ['Tài sản ngắn hạn', 'TS ngắn hạn'],
+    'NO_NGAN_HAN': ['Nợ ngắn hạn'],
+    'HTK': ['Hàng tồn kho', 'HTK'],
+    'VCSH': ['Vốn chủ sở hữu'],
+    'NPT': ['Nợ phải trả'],
+    'TTS': ['TỔNG CỘNG TÀI SẢN', 'TỔNG CỘNG NGUỒN VỐN', 'TỔNG CỘNG'],
+    'PHAI_THU': ['Các khoản phải thu ngắn hạn', 'Phải thu khách hàng'],
+    'DT_THUAN': ['Doanh thu thuần về bán hàng'],
+    'GVHB': ['Giá vốn hàng bán'],
+    'CP_LAI_VAY': ['Trong đó: Chi phí lãi vay'],
+    'CP_BAN_HANG': ['Chi phí bán hàng'],
+    'CP_QLDN': ['Chi phí quản lý doanh nghiệp'],
+    'LNST': ['Lợi nhuận sau thuế TNDN'],
+}
+
+# Khóa chuẩn của Báo cáo Lưu chuyển tiền tệ, chỉ tra trên bảng LCTT (không khớp nhầm BĐKT/KQKD)
+CASH_FLOW_ALIASES = {
+    'CFO': ['Lưu chuyển tiền thuần từ hoạt động kinh doanh'],
+    'CFI': ['Lưu chuyển tiền thuần từ hoạt động đầu tư'],
+    'CFF': ['Lưu chuyển tiền thuần từ hoạt động tài chính'],
+    'LC_THUAN': ['Lưu chuyển tiền thuần trong năm', 'Lưu chuyển tiền thuần trong kỳ'],
+    'CAPEX': ['Tiền chi để mua sắm, xây dựng TSCĐ', 'Tiền chi mua sắm, xây dựng TSCĐ'],
+    'LAI_VAY_DA_TRA': ['Tiền lãi vay đã trả', 'Lãi vay đã trả'],
+    'CO_TUC_DA_TRA': ['Cổ tức, lợi nhuận đã trả cho chủ sở hữu'],
+}
+
+# Số thứ tự đầu dòng: 'I.', 'IV.', 'A.', '1.', '1.1.', 'a)' ... và gạch đầu dòng '-', '+', '*'
+_NUMBERING_RE = re.compile(r'^\s*(?:(?:[ivxlc]+|[a-z]|\d+(?:\.\d+)*)\s*[.)]\s*|[-+*–]\s*)+')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_label(label):
+    """'IV. Hàng tồn kho ' -> 'hang ton kho'."""
+    text = unicodedata.normalize('NFD', str(label).lower().replace('đ', 'd'))
+    text = ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+    text = _NUMBERING_RE.sub('', text)
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+class LineItemIndex:
+    """Ánh xạ khóa chuẩn -> vị trí dòng (iloc) của một bảng BĐKT/KQKD.
+
+    Mỗi khóa được phân giải theo thứ tự từ khóa trong LINE_ITEM_ALIASES: trùng
+    khớp chính xác nhãn đã chuẩn hóa trước, sau đó mới tới chứa chuỗi con. Nếu
+    trùng khớp chuỗi con rơi vào nhiều nhãn khác nhau (vd. 'TỔNG CỘNG' khớp cả
+    Tổng tài sản lẫn Tổng nguồn vốn) thì dòng đầu tiên vẫn được dùng nhưng khóa
+    đó được ghi vào `ambiguities` để báo lại cho người dùng.
+    """
+
+    def __init__(self, labels, aliases=LINE_ITEM_ALIASES):
+        self.labels = [normalize_label(label) for label in labels]
+        self.raw_labels = [str(label) for label in labels]
+        self._by_label = {}
+        for pos, label in enumerate(self.labels):
+            self._by_label.setdefault(label, []).append(pos)
+
+        self.positions = {}
+        self.ambiguities = {}
+        for key, keywords in aliases.items():
+            pos, candidates = self._resolve(keywords)
+            if pos is None:
+                continue
+            self.positions[key] = pos
+            if len({self.labels[p] for p in candidates}) > 1:
+                self.ambiguities[key] = [self.raw_labels[p] for p in candidates]
+
+    def _resolve(self, keywords):
+        normalized = [normalize_label(keyword) for keyword in keywords]
+        for keyword in normalized:
+            exact = self._by_label.get(keyword)
+            if exact:
+                return exact[0], exact[:1]
+        for keyword in normalized:
+            candidates = [pos for pos, label in enumerate(self.labels) if keyword and keyword in label]
+            if candidates:
+                return candidates[0], candidates
+        return None, []
+
+    def position(self, key):
+        """Vị trí dòng của khóa chuẩn, hoặc None nếu báo cáo không có chỉ tiêu này."""
+        return self.positions.get(key)
+
+    def find(self, keyword):
+        """Tra cứu một nhãn bất kỳ (không nằm trong LINE_ITEM_ALIASES)."""
+        return self._resolve([keyword])[0]
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def ambiguity_notes(self, statement_name):
+        """Danh sách (level, message) cho các khóa khớp nhiều dòng khác nhau."""
+        notes = []
+        for key, labels in self.ambiguities.items():
+            listed = "; ".join(f"'{label.strip()}'" for label in labels)
+            notes.append(('warning', f"Chỉ tiêu {key} trong {statement_name} khớp nhiều dòng ({listed}). Đang dùng dòng đầu tiên."))
+        return notes
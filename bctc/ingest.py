@@ -0,0 +1,415 @@
+"""Đọc file Excel BCTC và tách Bảng CĐKT / KQKD / LCTT (không phụ thuộc Streamlit).
+
+Các thông báo cho người dùng (st.info / st.warning trong bản cũ) được gom vào
+danh sách ``notes`` dạng ``(level, message)`` để lớp giao diện tự hiển thị.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from .telemetry import span
+
+SPLIT_KEYWORD = "KẾT QUẢ HOẠT ĐỘNG KINH DOANH"
+CASH_FLOW_KEYWORD = "LƯU CHUYỂN TIỀN TỆ"
+HEADER_KEYWORD = "CHỈ TIÊU"
+MIN_PERIODS = 3
+
+
+def period_names(count):
+    """Tên cột kỳ nội bộ theo thứ tự cũ -> mới: ['Năm 1', ..., 'Năm N']."""
+    return [f'Năm {k}' for k in range(1, count + 1)]
+
+
+def period_columns(df):
+    """Các cột 'Năm k' có trong DataFrame, theo thứ tự k tăng dần."""
+    return [col for col in period_names(len(df.columns)) if col in df.columns]
+
+
+# Cửa sổ 3 kỳ mặc định (giữ cho mã cũ); engine dùng period_columns() cho N kỳ.
+YEARS = period_names(MIN_PERIODS)
+
+
+class InsufficientPeriodsError(ValueError):
+    """Sheet không có đủ MIN_PERIODS cột năm/kỳ để so sánh."""
+
+
+@dataclass
+class ParsedStatements:
+    """Kết quả đọc file: BĐKT, KQKD (và LCTT nếu có) đã chuẩn hóa về 'Chỉ tiêu', 'Năm 1..N'."""
+    df_bs: pd.DataFrame
+    df_is: pd.DataFrame
+    period_cols: list  # Tên cột gốc theo thứ tự cũ -> mới [Năm 1, ..., Năm N]
+    notes: list = field(default_factory=list)  # [(level, message), ...]
+    df_cf: pd.DataFrame = field(default_factory=pd.DataFrame)  # Rỗng nếu file không có LCTT
+
+
+# -----------------------------------------------------------------
+# HÀM CHUẨN HÓA TÊN CỘT ĐỂ DÙNG LỌC DF (LOẠI BỎ DATETIME OBJECT)
+# -----------------------------------------------------------------
+def clean_column_names(df):
+    new_columns = []
+    for col in df.columns:
+        col_str = str(col)
+        if isinstance(col, pd.Timestamp) or (isinstance(col, str) and ' ' in col_str and col_str.endswith('00:00:00')):
+            new_columns.append(col_str)
+        else:
+            new_columns.append(col_str)
+    df.columns = new_columns
+    return df
+
+
+# === ĐỌC EXCEL NHANH: MỘT LƯỢT ĐỌC (CALAMINE), CHỈ GIỮ CÁC CỘT CẦN THIẾT ===
+
+# Cột 0 ('Chỉ tiêu') và các cột 1-3 (tên chỉ tiêu KQKD bị dịch chuyển, từ khóa tách KQKD)
+LABEL_COLUMN_COUNT = 4
+
+
+def default_excel_engine():
+    """'calamine' (python-calamine, nhanh hơn nhiều) nếu có, None để pandas tự chọn (openpyxl)."""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    major, minor = (int(part) for part in pd.__version__.split('.')[:2])
+    return 'calamine' if (major, minor) >= (2, 2) else None
+
+
+def project_columns(header, max_periods=None):
+    """Vị trí các cột cần giữ: LABEL_COLUMN_COUNT cột đầu và các cột năm/kỳ trong dòng header."""
+    names = [str(col) for col in header]
+    period_cols = detect_period_columns(names)
+    if max_periods is not None:
+        period_cols = period_cols[:max(max_periods, MIN_PERIODS)]
+    keep = set(range(min(LABEL_COLUMN_COUNT, len(names))))
+    keep.update(names.index(col) for col in period_cols)
+    return sorted(keep)
+
+
+def parse_sheet(xls, sheet_name, header_row=0, max_periods=None, project=True):
+    """Đọc một sheet của workbook đã mở (pd.ExcelFile), dòng `header_row` (chỉ số 0) làm header.
+
+    Sheet được đọc trong một lượt (không đọc riêng dòng header trước); `project` chỉ giữ
+    lại các cột cần dùng (xem project_columns) cho các bước sau.
+    """
+    df_raw = xls.parse(sheet_name, header=header_row)
+    if project:
+        df_raw = df_raw.iloc[:, project_columns(df_raw.columns, max_periods)]
+    return clean_column_names(df_raw)
+
+
+def read_first_sheet(source, max_periods=None, engine=None, project=True):
+    """Đọc Sheet 1 (BĐKT và KQKD chung sheet) của file Excel.
+
+    Mở workbook một lần bằng calamine (python-calamine, có trong requirements.txt;
+    openpyxl nếu thiếu) và đọc sheet trong một lượt, sau đó chỉ giữ các cột cần dùng.
+    Giả định KQKD dùng chung bố cục cột với header của sheet (như logic tách KQKD
+    đang giả định). `project=False` giữ toàn bộ các cột.
+    """
+    engine = engine or default_excel_engine()
+    xls = pd.ExcelFile(source, engine=engine)
+    try:
+        return parse_sheet(xls, xls.sheet_names[0], max_periods=max_periods, project=project)  # CHUẨN HÓA CỘT BĐKT
+    except Exception:
+        raise Exception("Không thể đọc Sheet 1 (Bảng CĐKT). Vui lòng kiểm tra định dạng sheet.")
+    finally:
+        xls.close()
+
+
+# === LOGIC ĐỌC FILE CHUNG SHEET VÀ TÁCH KQKD (V12) ===
+def split_statements(df_raw, notes, split_keyword=SPLIT_KEYWORD):
+    """Tách sheet chung thành (df_raw_bs, df_raw_is) tại dòng chứa `split_keyword`."""
+    # 1. Đặt tên cột đầu tiên là 'Chỉ tiêu'
+    df_raw_full = df_raw.rename(columns={df_raw.columns[0]: 'Chỉ tiêu'})
+
+    # 2. Tìm điểm chia (index của hàng chứa 'KẾT QUẢ HOẠT ĐỘNG KINH DOANH')
+    # (tìm riêng cột 0 và cột 1: pandas 3 giữ NaN khi astype(str) nên không ghép chuỗi hai cột được)
+    df_raw_full['Chỉ tiêu'] = df_raw_full['Chỉ tiêu'].astype(str)
+    split_rows = df_raw_full[contains_any_column(df_raw_full.iloc[:, :2], split_keyword)]
+
+    if split_rows.empty:
+        notes.append(('warning', f"Không tìm thấy từ khóa '{split_keyword}' trong Sheet 1. Chỉ phân tích Bảng CĐKT."))
+        return df_raw_full.copy(), pd.DataFrame()
+
+    split_index = split_rows.index[0]
+
+    # Tách DataFrame
+    if split_index > 0:
+        df_raw_bs = df_raw_full.loc[:split_index-1].copy()
+    else:
+        df_raw_bs = pd.DataFrame(columns=df_raw_full.columns)  # BĐKT rỗng
+
+    df_raw_is = df_raw_full.loc[split_index:].copy()
+
+    # Reset lại header cho Báo cáo KQKD (tìm theo từng cột, không apply theo dòng)
+    header_mask = contains_any_column(df_raw_is, HEADER_KEYWORD)
+
+    if not header_mask.any():
+        notes.append(('warning', "Không tìm thấy dòng header 'CHỈ TIÊU' trong phần KQKD. Bỏ qua phân tích KQKD."))
+        return df_raw_bs, pd.DataFrame()
+
+    header_row_index = df_raw_is.index[header_mask.argmax()]
+    new_header = df_raw_is.loc[header_row_index]
+    df_raw_is = df_raw_is.loc[header_row_index+1:]  # Bỏ hàng header
+
+    if df_raw_is.empty:
+        notes.append(('warning', "Phần KQKD chỉ có duy nhất dòng header 'CHỈ TIÊU' và không có dữ liệu. Bỏ qua phân tích KQKD."))
+        return df_raw_bs, pd.DataFrame()
+
+    df_raw_is.columns = new_header
+    col_to_rename = df_raw_is.columns[0]
+    if pd.isna(col_to_rename) or str(col_to_rename).strip() == '':
+        df_raw_is.rename(columns={col_to_rename: 'Chỉ tiêu'}, inplace=True)
+    else:
+        df_raw_is = df_raw_is.rename(columns={df_raw_is.columns[0]: 'Chỉ tiêu'})
+    return df_raw_bs, df_raw_is
+
+
+def split_cash_flow(df_raw_is, notes, keyword=CASH_FLOW_KEYWORD):
+    """Tách phần LCTT nằm sau KQKD (cùng sheet) tại dòng chứa `keyword`: (df_raw_is, df_raw_cf).
+
+    Như khi tách KQKD khỏi BĐKT: nếu sau dòng tách có dòng header 'CHỈ TIÊU' riêng thì LCTT
+    dùng header đó, nếu không thì dùng chung cột với KQKD. Không có `keyword`: LCTT rỗng.
+    """
+    split_rows = contains_any_column(df_raw_is.iloc[:, :2], keyword).nonzero()[0]
+    if not len(split_rows):
+        return df_raw_is, pd.DataFrame()
+
+    split = split_rows[0]
+    df_raw_cf = df_raw_is.iloc[split + 1:]
+    header_mask = contains_any_column(df_raw_cf, HEADER_KEYWORD)
+    if header_mask.any():
+        header_pos = header_mask.argmax()
+        new_header = ['Chỉ tiêu'] + list(df_raw_cf.iloc[header_pos, 1:])
+        df_raw_cf = df_raw_cf.iloc[header_pos + 1:].copy()
+        df_raw_cf.columns = new_header
+
+    if df_raw_cf.empty:
+        notes.append(('warning', "Phần LCTT không có dữ liệu sau dòng tiêu đề. Bỏ qua phân tích LCTT."))
+        return df_raw_is.iloc[:split].copy(), pd.DataFrame()
+    return df_raw_is.iloc[:split].copy(), df_raw_cf.copy()
+
+
+def header_name(col):
+    """Tên cột dạng chuỗi; năm gõ dạng số trong dòng header KQKD (đọc ra 2022.0) -> '2022'."""
+    if isinstance(col, float) and col.is_integer():
+        return str(int(col))
+    return str(col)
+
+
+def normalize_date_col(name):
+    if ' ' in name:
+        name = name.split(' ')[0]
+    return name
+
+
+def detect_period_columns(columns):
+    """Trả về tên cột gốc của các cột năm/kỳ, sắp xếp từ mới nhất đến cũ nhất."""
+    value_cols_unique = {}
+    col_name_map = {}
+    for col in columns:
+        col_str = str(col)
+        normalized_name = normalize_date_col(col_str)
+
+        if len(normalized_name) >= 10 and normalized_name[4] == '-' and normalized_name[7] == '-' and normalized_name[:4].isdigit():
+            if normalized_name not in value_cols_unique:
+                value_cols_unique[normalized_name] = col
+                col_name_map[normalized_name] = col_str
+        elif normalized_name.isdigit() and len(normalized_name) == 4 and normalized_name.startswith('20'):
+            if normalized_name not in value_cols_unique:
+                value_cols_unique[normalized_name] = col
+                col_name_map[normalized_name] = col_str
+
+    normalized_names = list(value_cols_unique.keys())
+    normalized_names.sort(key=lambda x: str(x), reverse=True)
+    return [col_name_map[name] for name in normalized_names]
+
+
+def contains_any_column(df, keyword):
+    """Mảng bool: dòng có ít nhất một ô chứa `keyword` (không phân biệt hoa/thường)."""
+    mask = np.zeros(len(df), dtype=bool)
+    for i in range(df.shape[1]):
+        mask |= df.iloc[:, i].astype(str).str.contains(keyword, case=False, na=False, regex=False).to_numpy()
+    return mask
+
+
+# Giá trị coi như ô tên chỉ tiêu bị trống (NaN đã bị astype(str) thành 'nan' khi tách sheet)
+EMPTY_LABELS = ['', 'nan', 'None', 'NaT']
+
+
+def coalesce_labels(df, label_col, candidate_cols):
+    """Tên chỉ tiêu = ô đầu tiên không trống trong [label_col] + candidate_cols (kiểu bfill theo cột)."""
+    candidates = df[[label_col] + list(candidate_cols)].astype(str).apply(lambda col: col.str.strip())
+    candidates = candidates.mask(candidates.isin(EMPTY_LABELS))
+    return candidates.bfill(axis=1).iloc[:, 0]
+
+
+# --- LOGIC LÀM SẠCH VÀ ĐIỀN CHỈ TIÊU KQKD (V12, VECTOR HÓA) ---
+def clean_income_statement(df_raw_is, first_data_col, notes, statement_name='KQKD'):
+    # BƯỚC 1: HỢP NHẤT TÊN CHỈ TIÊU BỊ DỊCH CHUYỂN (cột 1-3 điền vào 'Chỉ tiêu' còn trống)
+    if 'Chỉ tiêu' in df_raw_is.columns:
+        potential_name_cols = [col for i, col in enumerate(df_raw_is.columns) if i > 0 and i < 4]
+        df_raw_is['Chỉ tiêu'] = coalesce_labels(df_raw_is, 'Chỉ tiêu', potential_name_cols).fillna('')
+
+    # BƯỚC 2: CHUẨN HÓA VÀ LOẠI BỎ HÀNG KHÔNG CÓ TÊN CHỈ TIÊU HỢP LỆ
+    df_raw_is['Chỉ tiêu'] = df_raw_is['Chỉ tiêu'].astype(str).str.strip()
+    df_raw_is = df_raw_is[df_raw_is['Chỉ tiêu'].str.len() > 0].copy()
+    df_raw_is = df_raw_is[df_raw_is['Chỉ tiêu'].astype(str) != '0'].copy()
+
+    # BƯỚC 3: LOẠI BỎ CÁC HÀNG CHÚ THÍCH/RỖNG BẰNG CÁCH KIỂM TRA GIÁ TRỊ SỐ
+    if first_data_col in df_raw_is.columns:
+        df_raw_is[first_data_col] = pd.to_numeric(df_raw_is[first_data_col], errors='coerce')
+        return df_raw_is[df_raw_is[first_data_col].notnull()].copy()
+
+    notes.append(('warning', f"Lỗi: Không tìm thấy cột dữ liệu đầu tiên '{first_data_col}' trong {statement_name} để làm sạch. Bỏ qua phân tích {statement_name}."))
+    return pd.DataFrame()
+
+
+def parse_statements(df_raw, max_periods=None, df_raw_is=None, df_raw_cf=None):
+    """Từ DataFrame Sheet 1 thô, trả về ParsedStatements (BĐKT, KQKD, LCTT).
+
+    Giữ toàn bộ các cột năm/kỳ tìm thấy (hoặc `max_periods` kỳ gần nhất), đặt tên
+    'Năm 1' (cũ nhất) ... 'Năm N' (mới nhất). `df_raw_is` là sheet KQKD riêng (cùng
+    bố cục cột với BĐKT); khi có, `df_raw` chỉ chứa BĐKT và không cần tách. LCTT nằm
+    sau KQKD được tách tại CASH_FLOW_KEYWORD; `df_raw_cf` là sheet LCTT riêng (nếu có).
+    """
+    if df_raw_is is None:
+        notes = [('info', "Đang xử lý file... Giả định BĐKT và KQKD nằm chung 1 sheet.")]
+        with span('split') as s:
+            df_raw_bs, df_raw_is = split_statements(df_raw, notes)
+            s.set_shape(df_raw_bs, df_raw_is)
+    else:
+        notes = [('info', "Đang xử lý file... BĐKT và KQKD nằm ở hai sheet riêng.")]
+        df_raw_bs = df_raw.rename(columns={df_raw.columns[0]: 'Chỉ tiêu'})
+        df_raw_is = df_raw_is.rename(columns={df_raw_is.columns[0]: 'Chỉ tiêu'})
+
+    if not df_raw_is.empty:
+        df_raw_is, df_raw_cf_inline = split_cash_flow(df_raw_is, notes)
+        if df_raw_cf is None:
+            df_raw_cf = df_raw_cf_inline
+    if df_raw_cf is None:
+        df_raw_cf = pd.DataFrame()
+    elif not df_raw_cf.empty and df_raw_cf.columns[0] != 'Chỉ tiêu':
+        df_raw_cf = df_raw_cf.rename(columns={df_raw_cf.columns[0]: 'Chỉ tiêu'})
+
+    # --- TIỀN XỬ LÝ (PRE-PROCESSING) DỮ LIỆU ---
+
+    # 1. Đặt tên cột đầu tiên là 'Chỉ tiêu'
+    if not df_raw_bs.empty and df_raw_bs.columns[0] != 'Chỉ tiêu':
+        df_raw_bs = df_raw_bs.rename(columns={df_raw_bs.columns[0]: 'Chỉ tiêu'})
+
+    if not df_raw_is.empty:
+        df_raw_is.columns = [header_name(col) for col in df_raw_is.columns]
+    if not df_raw_cf.empty:
+        df_raw_cf.columns = [header_name(col) for col in df_raw_cf.columns]
+
+    # 2. Xác định các cột năm/kỳ ('Năm N' là kỳ gần nhất)
+    period_cols = detect_period_columns(df_raw_bs.columns)
+    if len(period_cols) < MIN_PERIODS:
+        raise InsufficientPeriodsError(
+            f"Chỉ tìm thấy {len(period_cols)} cột năm trong Sheet 1 (Bảng CĐKT). Ứng dụng cần ít nhất {MIN_PERIODS} năm/kỳ để so sánh."
+        )
+    if max_periods is not None:
+        period_cols = period_cols[:max(max_periods, MIN_PERIODS)]
+    period_cols = period_cols[::-1]
+    col_nam_1 = period_cols[0]
+
+    # 3. Lọc bỏ hàng đầu tiên chứa các chỉ số so sánh (SS) không cần thiết (chỉ BĐKT)
+    if not df_raw_bs.empty and len(df_raw_bs) > 1:
+        df_raw_bs = df_raw_bs.drop(df_raw_bs.index[0])
+
+    if not df_raw_is.empty:
+        with span('kqkd_clean') as s:
+            df_raw_is = clean_income_statement(df_raw_is, col_nam_1, notes)
+            s.set_shape(df_raw_is)
+
+    # LCTT cùng bố cục với KQKD (tên chỉ tiêu có thể bị dịch sang cột 1-3)
+    if not df_raw_cf.empty:
+        with span('lctt_clean') as s:
+            df_raw_cf = clean_income_statement(df_raw_cf, col_nam_1, notes, 'LCTT')
+            s.set_shape(df_raw_cf)
+
+    # 4. Tạo DataFrame Bảng CĐKT và KQKD đã lọc (chỉ giữ 'Chỉ tiêu' và các cột kỳ)
+    cols_to_keep = ['Chỉ tiêu'] + period_cols
+    statement_columns = ['Chỉ tiêu'] + period_names(len(period_cols))
+
+    # Bảng CĐKT
+    try:
+        df_bs_final = df_raw_bs[cols_to_keep].copy()
+        df_bs_final.columns = statement_columns
+        df_bs_final = df_bs_final.dropna(subset=['Chỉ tiêu'])
+    except KeyError as ke:
+        notes.append(('warning', f"Lỗi truy cập cột: {ke}. BĐKT có thể rỗng hoặc bị mất cột 'Chỉ tiêu'. Khởi tạo BĐKT rỗng."))
+        df_bs_final = pd.DataFrame(columns=statement_columns)
+
+    # Báo cáo KQKD
+    if not df_raw_is.empty:
+        try:
+            df_is_final = df_raw_is[cols_to_keep].copy()
+            df_is_final.columns = statement_columns
+            df_is_final = df_is_final.dropna(subset=['Chỉ tiêu'])
+        except KeyError as ke:
+            notes.append(('warning', f"Các cột năm trong phần KQKD không khớp với BĐKT. Bỏ qua phân tích KQKD. Lỗi chi tiết: Cột {ke} bị thiếu."))
+            df_is_final = pd.DataFrame(columns=statement_columns)
+        except Exception:
+            df_is_final = pd.DataFrame(columns=statement_columns)
+    else:
+        notes.append(('info', "Không tìm thấy dữ liệu KQKD để phân tích."))
+        df_is_final = pd.DataFrame(columns=statement_columns)
+
+    # Báo cáo LCTT (không bắt buộc: không có thì chỉ bỏ qua phần phân tích dòng tiền)
+    df_cf_final = pd.DataFrame(columns=statement_columns)
+    if not df_raw_cf.empty:
+        try:
+            df_cf_final = df_raw_cf[cols_to_keep].copy()
+            df_cf_final.columns = statement_columns
+            df_cf_final = df_cf_final.dropna(subset=['Chỉ tiêu'])
+            notes.append(('info', "Đã tách Báo cáo Lưu chuyển tiền tệ (LCTT) để phân tích dòng tiền."))
+        except KeyError as ke:
+            notes.append(('warning', f"Các cột năm trong phần LCTT không khớp với BĐKT. Bỏ qua phân tích LCTT. Lỗi chi tiết: Cột {ke} bị thiếu."))
+        except Exception:
+            notes.append(('warning', "Không đọc được các cột năm trong phần LCTT. Bỏ qua phân tích LCTT."))
+            df_cf_final = pd.DataFrame(columns=statement_columns)
+
+    return ParsedStatements(
+        df_bs=df_bs_final,
+        df_is=df_is_final,
+        period_cols=period_cols,
+        notes=notes,
+        df_cf=df_cf_final,
+    )
+
+
+def parse_workbook(source, max_periods=None, engine=None, sheets=None):
+    """Đọc file Excel (đường dẫn, bytes buffer hoặc file upload) và tách BĐKT/KQKD/LCTT.
+
+    `sheets` (bctc.sheets.EntitySheets) chọn sheet BĐKT và sheet KQKD/LCTT riêng (nếu có) của
+    một đơn vị; mặc định đọc Sheet 1. `source` có thể là pd.ExcelFile đang mở (không bị đóng).
+    """
+    if sheets is None:
+        with span('excel_parse') as s:
+            df_raw = read_first_sheet(source, max_periods=max_periods, engine=engine)
+            s.set_shape(df_raw)
+        df_raw_is = df_raw_cf = None
+    else:
+        xls = source if isinstance(source, pd.ExcelFile) else pd.ExcelFile(source, engine=engine or default_excel_engine())
+        try:
+            with span('excel_parse', sheet=sheets.balance_sheet.name) as s:
+                df_raw = parse_sheet(xls, sheets.balance_sheet.name, sheets.balance_sheet.header_row, max_periods)
+                df_raw_is = df_raw_cf = None
+                if sheets.income_sheet is not None:
+                    df_raw_is = parse_sheet(xls, sheets.income_sheet.name, sheets.income_sheet.header_row, max_periods)
+                if sheets.cash_flow_sheet is not None:
+                    df_raw_cf = parse_sheet(xls, sheets.cash_flow_sheet.name, sheets.cash_flow_sheet.header_row, max_periods)
+                s.set_shape(df_raw, df_raw_is, df_raw_cf)
+        except Exception:
+            raise Exception(f"Không thể đọc các sheet của đơn vị '{sheets.name}'. Vui lòng kiểm tra định dạng sheet.")
+        finally:
+            if xls is not source:
+                xls.close()
+    with span('parse_statements') as s:
+        parsed = parse_statements(df_raw, max_periods=max_periods, df_raw_is=df_raw_is, df_raw_cf=df_raw_cf)
+        s.set_shape(parsed.df_bs, parsed.df_is, parsed.df_cf)
+    if sheets is not None:
+        parsed.notes.insert(1, ('info', f"Đơn vị: {sheets.name} ({sheets.describe()})."))
+    return parsed
@@ -0,0 +1,246 @@
+"""Nhận xét tự động theo quy tắc (không gọi AI): bản nháp tức thì và phương án dự phòng khi Gemini lỗi.
+
+Đọc trực tiếp các bảng số đã xử lý của AnalysisResult (chưa định dạng) và sinh câu
+tiếng Việt cho: xu hướng qua các kỳ, hệ số vượt/xuống dưới ngưỡng tham chiếu, và các
+khoản mục biến động lớn nhất kỳ gần nhất. Các phần trùng khóa/tiêu đề với
+bctc.sections để có thể thay thế từng phần nhận xét của AI. Kết quả chỉ phụ thuộc
+dữ liệu (cùng đầu vào -> cùng câu chữ).
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from .engine import RATIO_DEFINITIONS
+from .formatting import (
+    ROW_MAJOR,
+    ROW_TOTAL,
+    classify_rows,
+    format_vn_delta_currency,
+    format_vn_delta_ratio,
+    format_vn_percentage,
+)
+from .index import _NUMBERING_RE, LineItemIndex
+from .ingest import period_columns
+from .sections import SECTION_DEFINITIONS
+
+TOP_MOVERS = 3
+# Bỏ qua biến động của khoản mục nhỏ hơn tỷ lệ này x giá trị lớn nhất của bảng (kỳ gần nhất)
+MIN_MOVER_SHARE = 0.02
+
+# Khóa hệ số -> (ngưỡng, 'below'/'above' = phía bất lợi, ý nghĩa khi ở phía bất lợi)
+RATIO_THRESHOLDS = {
+    'current_ratio': (1.0, 'below', "tài sản ngắn hạn không đủ bù đắp nợ ngắn hạn"),
+    'quick_ratio': (0.5, 'below', "khả năng thanh toán nhanh yếu nếu không tính hàng tồn kho"),
+    'equity_ratio': (0.3, 'below', "doanh nghiệp phụ thuộc nhiều vào vốn vay"),
+    'd_to_e_ratio': (2.0, 'above', "đòn bẩy tài chính cao, rủi ro trả nợ lớn"),
+    'ros_ratio': (0.0, 'below', "hoạt động kinh doanh bị lỗ"),
+    'roa_ratio': (0.0, 'below', "tài sản không tạo ra lợi nhuận"),
+    'roe_ratio': (0.0, 'below', "vốn chủ sở hữu không tạo ra lợi nhuận"),
+}
+
+# Số thứ tự đầu dòng như bctc.index, nhưng giữ nguyên chữ hoa/dấu của nhãn
+_LABEL_NUMBERING_RE = re.compile(_NUMBERING_RE.pattern, re.IGNORECASE)
+
+_RATIO_KEYS = {name: key for key, name, _ in RATIO_DEFINITIONS}
+_RATIO_GROUPS = {name: group for _, name, group in RATIO_DEFINITIONS}
+
+
+def _values(df):
+    return df[period_columns(df)].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+
+def short_label(label):
+    """'III. Hàng tồn kho' -> 'Hàng tồn kho'."""
+    label = str(label).strip()
+    return _LABEL_NUMBERING_RE.sub('', label).strip() or label
+
+
+def trend_phrase(values):
+    """'tăng liên tục', 'giảm liên tục', 'không đổi' hoặc 'biến động (nhìn chung tăng/giảm)' qua các kỳ."""
+    values = values[np.isfinite(values)]
+    if len(values) < 2:
+        return "chưa đủ dữ liệu để đánh giá xu hướng"
+    steps = np.diff(values)
+    if np.all(steps > 0):
+        return "tăng liên tục"
+    if np.all(steps < 0):
+        return "giảm liên tục"
+    if np.all(steps == 0):
+        return "không đổi"
+    overall = "tăng" if values[-1] > values[0] else "giảm" if values[-1] < values[0] else "đi ngang"
+    return f"biến động, nhìn chung {overall}"
+
+
+def _ratio_text(name, value):
+    """Giá trị hệ số kèm đơn vị: '1,25 lần', '45,3 ngày', '12,5%'."""
+    if not np.isfinite(value):
+        return "không xác định"
+    if name.endswith('(%)'):
+        return format_vn_percentage(value) or "0%"
+    text = format_vn_delta_ratio(value) or "0"
+    if '(Ngày)' in name:
+        return f"{text} ngày"
+    if '(Lần)' in name:
+        return f"{text} lần"
+    return text
+
+
+def threshold_sentence(key, name, previous, latest):
+    """Câu nhận xét khi hệ số vượt/xuống dưới ngưỡng kỳ gần nhất, hoặc vẫn ở phía bất lợi; None nếu không có gì đáng nói."""
+    if key not in RATIO_THRESHOLDS or not np.isfinite(latest):
+        return None
+    threshold, bad_side, meaning = RATIO_THRESHOLDS[key]
+    is_bad = (lambda value: value < threshold) if bad_side == 'below' else (lambda value: value > threshold)
+    bound = format_vn_delta_ratio(threshold) or "0"
+    label = short_label(name)
+    if np.isfinite(previous) and is_bad(latest) != is_bad(previous):
+        if is_bad(latest):
+            direction = "giảm xuống dưới" if bad_side == 'below' else "vượt lên trên"
+            return f"Đáng chú ý, {label} đã {direction} ngưỡng {bound} trong kỳ gần nhất: {meaning}."
+        direction = "vượt lên trên" if bad_side == 'below' else "giảm xuống dưới"
+        return f"{label} đã cải thiện, {direction} ngưỡng {bound} trong kỳ gần nhất."
+    if is_bad(latest):
+        side = "dưới" if bad_side == 'below' else "trên"
+        return f"{label} vẫn ở {side} ngưỡng {bound}: {meaning}."
+    return None
+
+
+def describe_ratio_group(df_ratios, group, period_labels):
+    """Đoạn nhận xét cho một nhóm hệ số ('Liquidity', 'Activity', 'Solvency', 'Profitability')."""
+    rows = df_ratios[df_ratios['Chỉ tiêu'].map(_RATIO_GROUPS).eq(group)]
+    if rows.empty:
+        return None
+    values = _values(rows)
+    first_label, last_label = period_labels[0], period_labels[-1]
+    sentences = []
+    for name, row in zip(rows['Chỉ tiêu'], values):
+        key = _RATIO_KEYS.get(name)
+        latest = row[-1]
+        previous = row[-2] if len(row) > 1 else np.nan
+        sentence = (
+            f"{short_label(name)} {trend_phrase(row)}, từ {_ratio_text(name, row[0])} ({first_label}) "
+            f"đến {_ratio_text(name, latest)} ({last_label})."
+        )
+        sentences.append(sentence)
+        warning = threshold_sentence(key, name, previous, latest)
+        if warning:
+            sentences.append(warning)
+    return ' '.join(sentences)
+
+
+def largest_movers(df, delta_col, growth_col=None, top=TOP_MOVERS):
+    """[(nhãn, chênh lệch, tăng trưởng %)] của các khoản mục thường (không phải mục chính/tổng) biến động mạnh nhất."""
+    if delta_col not in df.columns or df.empty:
+        return []
+    kinds = classify_rows(df['Chỉ tiêu'])
+    values = _values(df)
+    delta = pd.to_numeric(df[delta_col], errors='coerce').to_numpy(dtype=float)
+    scale = np.nanmax(np.abs(values[:, -1])) if values.size else 0
+    eligible = ~np.isin(kinds, [ROW_MAJOR, ROW_TOTAL]) & np.isfinite(delta) & (delta != 0)
+    eligible &= np.abs(values[:, -1]) >= MIN_MOVER_SHARE * scale
+    order = [pos for pos in np.argsort(-np.abs(np.where(eligible, delta, 0)), kind='stable') if eligible[pos]][:top]
+    growth = pd.to_numeric(df[growth_col], errors='coerce').to_numpy(dtype=float) if growth_col else None
+    return [
+        (short_label(df['Chỉ tiêu'].iloc[pos]), delta[pos], growth[pos] if growth is not None else np.nan)
+        for pos in order
+    ]
+
+
+def _mover_text(label, delta, growth):
+    sign = "tăng" if delta > 0 else "giảm"
+    text = f"{label} {sign} {format_vn_delta_currency(abs(delta))} triệu đồng"
+    if np.isfinite(growth) and abs(growth) < 1e6:  # bỏ tăng trưởng từ kỳ trước bằng 0
+        text += f" ({format_vn_percentage(abs(growth)) or '0%'})"
+    return text
+
+
+def _last_change_columns(df, delta_prefix, growth_prefix):
+    """(cột chênh lệch, cột tăng trưởng) của cặp kỳ gần nhất, vd. 'Delta (Y3 vs Y2)'."""
+    delta_cols = [col for col in df.columns if str(col).startswith(delta_prefix)]
+    growth_cols = [col for col in df.columns if growth_prefix and str(col).startswith(growth_prefix)]
+    return (delta_cols[-1] if delta_cols else None), (growth_cols[-1] if growth_cols else None)
+
+
+def _item_sentence(df, index, key, label, period_labels):
+    pos = index.position(key)
+    if pos is None:
+        return None
+    row = _values(df)[pos]
+    return (
+        f"{label} {trend_phrase(row)}, từ {format_vn_delta_currency(row[0])} triệu đồng ({period_labels[0]}) "
+        f"{'lên' if row[-1] >= row[0] else 'xuống'} {format_vn_delta_currency(row[-1])} triệu đồng ({period_labels[-1]})."
+    )
+
+
+def describe_balance_sheet(df_bs, period_labels):
+    if df_bs.empty:
+        return None
+    index = LineItemIndex(df_bs['Chỉ tiêu'])
+    sentences = [sentence for sentence in [
+        _item_sentence(df_bs, index, 'TTS', "Tổng tài sản", period_labels),
+        _item_sentence(df_bs, index, 'NPT', "Nợ phải trả", period_labels),
+        _item_sentence(df_bs, index, 'VCSH', "Vốn chủ sở hữu", period_labels),
+    ] if sentence]
+    tsnh = index.position('TSNH')
+    share_cols = [col for col in df_bs.columns if str(col).startswith('Tỷ trọng')]
+    if tsnh is not None and len(share_cols) >= 2:
+        first, last = (pd.to_numeric(df_bs[col], errors='coerce').iloc[tsnh] for col in (share_cols[0], share_cols[-1]))
+        sentences.append(
+            f"Tỷ trọng tài sản ngắn hạn trên tổng tài sản chuyển từ {format_vn_percentage(first) or '0%'} "
+            f"sang {format_vn_percentage(last) or '0%'}."
+        )
+    movers = largest_movers(df_bs, *_last_change_columns(df_bs, 'Delta', 'Growth'))
+    if movers:
+        sentences.append(f"Biến động lớn nhất kỳ gần nhất: {'; '.join(_mover_text(*mover) for mover in movers)}.")
+    return ' '.join(sentences) or None
+
+
+def describe_income_statement(df_is, period_labels):
+    if df_is.empty:
+        return None
+    index = LineItemIndex(df_is['Chỉ tiêu'])
+    sentences = [sentence for sentence in [
+        _item_sentence(df_is, index, 'DT_THUAN', "Doanh thu thuần", period_labels),
+        _item_sentence(df_is, index, 'LNST', "Lợi nhuận sau thuế", period_labels),
+    ] if sentence]
+    movers = largest_movers(df_is, *_last_change_columns(df_is, 'S.S Tuyệt đối', 'S.S Tương đối'))
+    if movers:
+        sentences.append(f"Biến động lớn nhất kỳ gần nhất: {'; '.join(_mover_text(*mover) for mover in movers)}.")
+    return ' '.join(sentences) or None
+
+
+def describe_cost_ratios(df_ratios, period_labels):
+    if df_ratios.empty:
+        return None
+    values = _values(df_ratios)
+    sentences = []
+    for name, row in zip(df_ratios['Chỉ tiêu'], values):
+        change = row[-1] - row[-2] if len(row) > 1 else np.nan
+        text = f"{name} chiếm {format_vn_percentage(row[-1]) or '0%'} doanh thu thuần ({period_labels[-1]})"
+        if np.isfinite(change) and change != 0:
+            text += f", {'tăng' if change > 0 else 'giảm'} {format_vn_delta_ratio(abs(change))} điểm % so với kỳ trước"
+        sentences.append(text + '.')
+    return ' '.join(sentences)
+
+
+def describe_sections(result):
+    """{khóa phần (bctc.sections): đoạn nhận xét} cho các phần có dữ liệu."""
+    labels = list(result.period_labels)
+    texts = {
+        'bs_structure': describe_balance_sheet(result.df_bs_processed, labels),
+        'is_trend': describe_income_statement(result.df_is_processed, labels),
+        'cost_ratios': describe_cost_ratios(result.df_ratios_processed, labels),
+    }
+    for key, _, _, _, group, _ in SECTION_DEFINITIONS:
+        if group is not None:
+            texts[key] = describe_ratio_group(result.df_financial_ratios_processed, group, labels)
+    return {key: text for key, text in texts.items() if text}
+
+
+def offline_analysis(result):
+    """Bản nhận xét Markdown đầy đủ sinh cục bộ, cùng bố cục với bctc.ai.get_sectioned_analysis."""
+    texts = describe_sections(result)
+    return '\n\n'.join(
+        f"#### {title}\n{texts[key]}" for key, title, *_ in SECTION_DEFINITIONS if key in texts
+    )
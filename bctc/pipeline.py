@@ -0,0 +1,117 @@
+"""Chuỗi xử lý đầy đủ: file Excel -> bảng đã phân tích -> bối cảnh Chatbot."""
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from .context import build_compact_context, format_col_name
+from .engine import build_statement_indexes, filter_zero_rows, process_cash_flow, process_financial_data
+from .formatting import classify_rows
+from .ingest import ParsedStatements, parse_workbook
+from .telemetry import Recorder, span
+
+
+# Tăng mỗi khi logic đọc/tính toán/dựng bối cảnh thay đổi kết quả, để vô hiệu hóa cache cũ (bctc.cache)
+ENGINE_VERSION = "7"
+
+
+@dataclass
+class AnalysisResult:
+    """Toàn bộ kết quả phân tích của một báo cáo tài chính."""
+    df_bs_processed: pd.DataFrame
+    df_is_processed: pd.DataFrame
+    df_ratios_processed: pd.DataFrame
+    df_financial_ratios_processed: pd.DataFrame
+    period_labels: list  # Nhãn hiển thị [Năm 1, ..., Năm N], vd. '31/12/2024'
+    chat_context: str = None  # None nếu BĐKT rỗng
+    notes: list = field(default_factory=list)
+    parsed: ParsedStatements = None  # BĐKT/KQKD/LCTT trước khi tính toán
+    # Tên bảng (RESULT_FRAMES) -> loại dòng ('major', 'total', 'detail', 'normal') để in đậm/nghiêng
+    row_kinds: dict = field(default_factory=dict)
+    # Các bước của lần phân tích đã tạo ra kết quả này (bctc.telemetry, Recorder.records())
+    timings: list = field(default_factory=list)
+    # LCTT (so sánh như KQKD, thêm dòng FCF) và Hệ số dòng tiền; rỗng nếu file không có LCTT
+    df_cf_processed: pd.DataFrame = field(default_factory=pd.DataFrame)
+    df_cash_ratios_processed: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+
+def analyze_statements(parsed: ParsedStatements, with_context=True, token_budget=None):
+    """Chạy process_financial_data (và process_cash_flow nếu có LCTT), lọc dòng 0 và dựng context.
+
+    `with_context=False` bỏ qua bước dựng context cho Chatbot (dùng cho batch job).
+    `token_budget` giới hạn độ dài context (mặc định context.DEFAULT_TOKEN_BUDGET).
+    """
+    with span('build_indexes'):
+        indexes = build_statement_indexes(parsed.df_bs, parsed.df_is, parsed.df_cf)
+    notes = list(parsed.notes)
+    notes += indexes['bs'].ambiguity_notes('Bảng CĐKT')
+    notes += indexes['is'].ambiguity_notes('KQKD')
+    notes += indexes['cf'].ambiguity_notes('LCTT')
+    if not parsed.df_cf.empty and 'CFO' not in indexes['cf']:
+        notes.append(('warning', "Không tìm thấy dòng 'Lưu chuyển tiền thuần từ hoạt động kinh doanh' trong LCTT. Bỏ qua phân tích dòng tiền."))
+
+    with span('process_financial_data') as s:
+        df_bs_processed, df_is_processed, df_ratios_processed, df_financial_ratios_processed = process_financial_data(
+            parsed.df_bs.copy(), parsed.df_is.copy(), indexes
+        )
+        s.set_shape(df_bs_processed, df_is_processed, df_ratios_processed, df_financial_ratios_processed)
+
+    with span('process_cash_flow') as s:
+        df_cf_processed, df_cash_ratios_processed = process_cash_flow(parsed.df_cf, df_bs_processed, df_is_processed, indexes)
+        s.set_shape(df_cf_processed, df_cash_ratios_processed)
+
+    with span('filter_zero_rows') as s:
+        df_bs_processed = filter_zero_rows(df_bs_processed)
+        df_is_processed = filter_zero_rows(df_is_processed)
+        df_ratios_processed = filter_zero_rows(df_ratios_processed)
+        df_financial_ratios_processed = filter_zero_rows(df_financial_ratios_processed)
+        df_cf_processed = filter_zero_rows(df_cf_processed)
+        df_cash_ratios_processed = filter_zero_rows(df_cash_ratios_processed)
+        s.set_shape(df_bs_processed, df_is_processed, df_ratios_processed, df_financial_ratios_processed)
+
+    period_labels = [format_col_name(col) for col in parsed.period_cols]
+
+    chat_context = None
+    if with_context and not df_bs_processed.empty:
+        with span('chat_context') as s:
+            chat_context = build_compact_context(
+                df_bs_processed, df_is_processed, df_ratios_processed, df_financial_ratios_processed, period_labels,
+                token_budget=token_budget, df_cf_processed=df_cf_processed, df_cash_ratios_processed=df_cash_ratios_processed,
+            )
+            s.attrs['chars'] = len(chat_context)
+
+    frames = {
+        'df_bs_processed': df_bs_processed,
+        'df_is_processed': df_is_processed,
+        'df_ratios_processed': df_ratios_processed,
+        'df_financial_ratios_processed': df_financial_ratios_processed,
+        'df_cf_processed': df_cf_processed,
+        'df_cash_ratios_processed': df_cash_ratios_processed,
+    }
+    # Phân loại dòng một lần cho mỗi bảng; mọi bảng hiển thị dùng lại, không tính lại theo từng dòng
+    with span('classify_rows'):
+        row_kinds = {name: list(classify_rows(df['Chỉ tiêu'])) if 'Chỉ tiêu' in df.columns else [] for name, df in frames.items()}
+
+    return AnalysisResult(
+        **frames,
+        period_labels=period_labels,
+        chat_context=chat_context,
+        notes=notes,
+        parsed=parsed,
+        row_kinds=row_kinds,
+    )
+
+
+def analyze_workbook(source, max_periods=None, with_context=True, token_budget=None, sheets=None):
+    """Đọc file Excel và trả về AnalysisResult (dùng cho UI, batch job, benchmark).
+
+    `sheets` (bctc.sheets.EntitySheets) chọn các sheet của một đơn vị; mặc định Sheet 1.
+    Thời gian/bộ nhớ từng bước được ghi vào `AnalysisResult.timings`.
+    """
+    with Recorder() as recorder:
+        with span('analyze_workbook'):
+            result = analyze_statements(
+                parse_workbook(source, max_periods=max_periods, sheets=sheets),
+                with_context=with_context, token_budget=token_budget,
+            )
+    result.timings = recorder.records()
+    return result
@@ -0,0 +1,305 @@
+"""Xuất báo cáo thẩm định (.docx) từ Mau_BCTC_Template.docx bằng docxtpl.
+
+Các biến ``{{TTS_Y2}}``, ``{{TSNH_DELTA_Y2_Y1}}``... được điền từ BĐKT/KQKD đã xử lý
+(Y2 = kỳ gần nhất, Y1 = kỳ liền trước); các biến diễn giải cần người thẩm định
+tự viết (lý do biến động, lĩnh vực hoạt động...) được để ``[...]``. Phần "Nhận xét
+chung" nhận bản nhận xét AI (nếu có) hoặc nhận xét tự động (bctc.narrative), và
+bảng hệ số tài chính chủ chốt được thêm vào cuối văn bản.
+
+Nội dung file mẫu được đọc một lần và mẫu Jinja đã biên dịch được giữ lại trong
+process, nên mỗi lần xuất chỉ còn một lượt render. Xuất hàng loạt:
+    python -m bctc.report du_lieu/ -o bao_cao/ --workers 8
+
+Cần ``docxtpl`` (không được import sẵn trong ``bctc``).
+"""
+import argparse
+import hashlib
+import io
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+
+from .batch import iter_workbooks, open_source
+from .formatting import format_table, format_vn_currency, format_vn_delta_currency, format_vn_percentage
+from .index import LineItemIndex
+from .ingest import period_columns
+from .narrative import offline_analysis, short_label
+from .pipeline import analyze_workbook
+
+DEFAULT_TEMPLATE = str(Path(__file__).resolve().parent.parent / 'Mau_BCTC_Template.docx')
+MISSING_TEXT = "[...]"
+COMMENTARY_MARKER = "(Nội dung nhận xét chung)"
+REPORT_COLUMNS = ['source_file', 'status', 'output', 'error']
+
+# Mã biến trong file mẫu -> (bảng, từ khóa nhãn 'Chỉ tiêu' theo thứ tự ưu tiên như LINE_ITEM_ALIASES)
+REPORT_ITEMS = {
+    'TTS': ('bs', ['TỔNG CỘNG TÀI SẢN']),
+    'TSNH': ('bs', ['Tài sản ngắn hạn', 'TS ngắn hạn']),
+    'TIEN': ('bs', ['Tiền và các khoản tương đương tiền']),
+    'DTTCNH': ('bs', ['Đầu tư tài chính ngắn hạn']),
+    'PTNH': ('bs', ['Các khoản phải thu ngắn hạn']),
+    'PTNH_KH': ('bs', ['Phải thu ngắn hạn của khách hàng', 'Phải thu khách hàng']),
+    'PTNH_TRA_TRUOC': ('bs', ['Trả trước cho người bán ngắn hạn']),
+    'PTNH_CHO_VAY': ('bs', ['Phải thu về cho vay ngắn hạn']),
+    'PTNH_KHAC': ('bs', ['Phải thu ngắn hạn khác']),
+    'HTK': ('bs', ['Hàng tồn kho']),
+    'TSNH_KHAC': ('bs', ['Tài sản ngắn hạn khác']),
+    'TSDH': ('bs', ['Tài sản dài hạn']),
+    'PTDH': ('bs', ['Các khoản phải thu dài hạn']),
+    'TSCD': ('bs', ['Tài sản cố định']),
+    'BDSDT': ('bs', ['Bất động sản đầu tư']),
+    'TSDDDH': ('bs', ['Tài sản dở dang dài hạn']),
+    'DTTCDH': ('bs', ['Đầu tư tài chính dài hạn']),
+    'DT_CONGTYCON': ('bs', ['Đầu tư vào công ty con']),
+    'TSDH_KHAC': ('bs', ['Tài sản dài hạn khác']),
+    'TNV': ('bs', ['TỔNG CỘNG NGUỒN VỐN']),
+    'NPT': ('bs', ['Nợ phải trả']),
+    'NNH': ('bs', ['Nợ ngắn hạn']),
+    'PTNB': ('bs', ['Phải trả người bán ngắn hạn']),
+    'NMTTT': ('bs', ['Người mua trả tiền trước ngắn hạn']),
+    'THUE': ('bs', ['Thuế và các khoản phải nộp Nhà nước']),
+    'VAYNH': ('bs', ['Vay và nợ thuê tài chính ngắn hạn']),
+    'NDH': ('bs', ['Nợ dài hạn']),
+    'VAYDH': ('bs', ['Vay và nợ thuê tài chính dài hạn']),
+    'VCSH': ('bs', ['Vốn chủ sở hữu']),
+    'DT': ('is', ['Doanh thu thuần về bán hàng']),
+    'GVHB': ('is', ['Giá vốn hàng bán']),
+    'CP_TAI_CHINH': ('is', ['Chi phí tài chính']),
+    'CP_BAN_HANG': ('is', ['Chi phí bán hàng']),
+    'CP_QLDN': ('is', ['Chi phí quản lý doanh nghiệp']),
+    'LNST': ('is', ['Lợi nhuận sau thuế TNDN']),
+}
+
+# Biến có giá trị kỳ gần nhất / chênh lệch / tăng trưởng (theo tên biến trong file mẫu)
+VALUE_ITEMS = ['TTS', 'TSNH', 'TIEN', 'DTTCNH', 'PTNH', 'PTNH_KH', 'HTK', 'TSDH', 'TSCD', 'TSDDDH', 'DTTCDH',
+               'DT_CONGTYCON', 'TNV', 'NNH', 'VAYNH', 'NDH', 'VCSH', 'DT', 'LNST']
+# (biến, khoản mục, khoản mục gốc) -> tỷ trọng % kỳ gần nhất
+SHARES = [
+    ('TIEN_TY_TRONG_TSNH_Y2', 'TIEN', 'TSNH'),
+    ('DTTCNH_TY_TRONG_TSNH_Y2', 'DTTCNH', 'TSNH'),
+    ('PTNH_TY_TRONG_TSNH_Y2', 'PTNH', 'TSNH'),
+    ('TSCD_TY_TRONG_TSDH_Y2', 'TSCD', 'TSDH'),
+    ('DTTCDH_TY_TRONG_TSDH_Y2', 'DTTCDH', 'TSDH'),
+    ('NDH_TY_TRONG_NPT_Y2', 'NDH', 'NPT'),
+    ('VAYDH_TY_TRONG_NDH_Y2', 'VAYDH', 'NDH'),
+    ('VCSH_TY_TRONG_TNV_Y2', 'VCSH', 'TNV'),
+    ('GVHB_TY_TRONG_DT_Y2', 'GVHB', 'DT'),
+]
+# Tiền tố biến -> các khoản mục con để chọn khoản mục chiếm tỷ trọng lớn nhất
+MAIN_ITEMS = {
+    'TSNH': ['TIEN', 'DTTCNH', 'PTNH', 'HTK', 'TSNH_KHAC'],
+    'TSDH': ['PTDH', 'TSCD', 'BDSDT', 'TSDDDH', 'DTTCDH', 'TSDH_KHAC'],
+    'PTNH': ['PTNH_KH', 'PTNH_TRA_TRUOC', 'PTNH_CHO_VAY', 'PTNH_KHAC'],
+    'NNH': ['PTNB', 'NMTTT', 'THUE', 'VAYNH'],
+}
+
+
+class CompiledTemplateEnvironment(Environment):
+    """Environment Jinja nhớ mẫu đã biên dịch theo nội dung nguồn (XML đã vá của file .docx)."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._compiled = {}
+        self._compiled_lock = threading.Lock()
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class:
+            return super().from_string(source, globals, template_class)
+        key = hashlib.sha256(source.encode()).digest()
+        with self._compiled_lock:
+            template = self._compiled.get(key)
+            if template is None:
+                template = self._compiled[key] = super().from_string(source)
+            return template
+
+
+# autoescape: nhãn có '&', '<' không làm hỏng XML của văn bản
+_jinja_env = CompiledTemplateEnvironment(autoescape=True)
+
+
+@lru_cache(maxsize=8)
+def template_bytes(path=DEFAULT_TEMPLATE):
+    """Nội dung file mẫu, đọc một lần cho mỗi process."""
+    return Path(path).read_bytes()
+
+
+@lru_cache(maxsize=8)
+def template_variables(path=DEFAULT_TEMPLATE):
+    """Tên các biến {{...}} trong file mẫu."""
+    return DocxTemplate(io.BytesIO(template_bytes(path))).get_undeclared_template_variables(_jinja_env)
+
+
+def _share_text(value):
+    """Tỷ lệ % không kèm ký hiệu (file mẫu đã có '%'): 12.34 -> '12,3'; không tính được (NaN) -> MISSING_TEXT."""
+    if not np.isfinite(value):
+        return MISSING_TEXT
+    return format_vn_percentage(value).rstrip('%') or "0"
+
+
+def _latest_values(result):
+    """({mã khoản mục: (giá trị kỳ gần nhất, kỳ liền trước)}, {mã khoản mục: nhãn}) cho các khoản mục tìm thấy."""
+    frames = {'bs': result.df_bs_processed, 'is': result.df_is_processed}
+    values = {}
+    labels = {}
+    for kind, df in frames.items():
+        if df.empty:
+            continue
+        aliases = {code: keywords for code, (table, keywords) in REPORT_ITEMS.items() if table == kind}
+        index = LineItemIndex(df['Chỉ tiêu'], aliases=aliases)
+        periods = df[period_columns(df)].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+        for code in aliases:
+            pos = index.position(code)
+            if pos is not None:
+                row = periods[pos]
+                values[code] = (row[-1], row[-2] if len(row) > 1 else np.nan)
+                labels[code] = short_label(index.raw_labels[pos])
+    return values, labels
+
+
+def build_report_context(result):
+    """Biến cho file mẫu từ AnalysisResult: số liệu định dạng VN, biến diễn giải = MISSING_TEXT."""
+    values, labels = _latest_values(result)
+    latest = {code: value for code, (value, _) in values.items()}
+    context = {}
+    for code in VALUE_ITEMS:
+        value, previous = values.get(code, (0.0, 0.0))
+        delta = value - previous if np.isfinite(previous) else np.nan
+        context[f'{code}_Y2'] = format_vn_currency(value) or "0"
+        context[f'{code}_DELTA_Y2_Y1'] = (format_vn_delta_currency(delta) or "0") if np.isfinite(delta) else MISSING_TEXT
+        growth = delta / previous * 100 if np.isfinite(previous) and previous != 0 else np.nan
+        context[f'{code}_GROWTH_Y2_Y1'] = _share_text(growth)
+
+    def share(part, whole):
+        return latest.get(part, 0.0) / latest[whole] * 100 if latest.get(whole) else np.nan
+
+    for name, part, whole in SHARES:
+        context[name] = _share_text(share(part, whole))
+    other_costs = sum(latest.get(code, 0.0) for code in ('CP_TAI_CHINH', 'CP_BAN_HANG', 'CP_QLDN'))
+    context['CHI_PHI_KHAC_TY_TRONG_DT_Y2'] = (
+        _share_text(other_costs / latest['DT'] * 100) + '%' if latest.get('DT') else MISSING_TEXT
+    )
+
+    # Khoản mục con có giá trị kỳ gần nhất lớn nhất
+    for parent, children in MAIN_ITEMS.items():
+        found = [code for code in children if latest.get(code, 0) > 0]
+        main = max(found, key=lambda code: latest[code]) if found else None
+        context[f'{parent}_KHOAN_MUC_CHINH'] = labels[main] if main else MISSING_TEXT
+        if parent == 'PTNH':
+            context['PTNH_KHOAN_MUC_CHINH_TY_TRONG'] = _share_text(share(main, 'PTNH')) if main else MISSING_TEXT
+    return context
+
+
+def _fill_missing(context, path):
+    """Biến có trong file mẫu nhưng không tính được từ số liệu -> MISSING_TEXT (người thẩm định tự viết)."""
+    for name in template_variables(path):
+        context.setdefault(name, MISSING_TEXT)
+    return context
+
+
+def _insert_commentary(document, commentary):
+    """Thay đoạn '(Nội dung nhận xét chung)' bằng bản nhận xét (Markdown đơn giản: '####' -> in đậm)."""
+    for paragraph in document.paragraphs:
+        if COMMENTARY_MARKER not in paragraph.text:
+            continue
+        paragraph.text = paragraph.text.replace(COMMENTARY_MARKER, '').rstrip()
+        anchor = paragraph
+        # Chèn ngay sau đoạn đánh dấu, theo thứ tự ngược để giữ đúng trình tự
+        for line in reversed([line.strip() for line in commentary.splitlines() if line.strip()]):
+            new = document.add_paragraph()
+            anchor._p.addnext(new._p)
+            heading = line.startswith('#')
+            text = re.sub(r'[*_`]+', '', line.lstrip('#').strip())
+            new.add_run(text).bold = heading
+        return True
+    return False
+
+
+def _append_ratio_table(document, result):
+    """Bảng hệ số tài chính chủ chốt (các kỳ, định dạng VN) ở cuối văn bản."""
+    df = result.df_financial_ratios_processed
+    if df.empty:
+        return
+    columns = ['Chỉ tiêu'] + period_columns(df)
+    formatted = format_table(df, 'key_ratios')[columns]
+    document.add_paragraph().add_run("Các hệ số tài chính chủ chốt").bold = True
+    table = document.add_table(rows=1, cols=len(columns))
+    table.style = 'Table Grid' if 'Table Grid' in [style.name for style in document.styles] else None
+    for cell, name in zip(table.rows[0].cells, ['Chỉ tiêu'] + list(result.period_labels)):
+        cell.text = str(name)
+    for row in formatted.itertuples(index=False):
+        for cell, value in zip(table.add_row().cells, row):
+            cell.text = str(value)
+
+
+def render_report(result, output=None, commentary=None, template=DEFAULT_TEMPLATE):
+    """Điền file mẫu cho một AnalysisResult.
+
+    `commentary`: bản nhận xét Markdown (vd. bctc.ai.get_sectioned_analysis); None dùng
+    nhận xét tự động (bctc.narrative). `output`: đường dẫn/file object; None trả về bytes.
+    """
+    context = _fill_missing(build_report_context(result), template)
+    doc = DocxTemplate(io.BytesIO(template_bytes(template)))
+    doc.render(context, jinja_env=_jinja_env)
+    _insert_commentary(doc.docx, offline_analysis(result) if commentary is None else commentary)
+    _append_ratio_table(doc.docx, result)
+    if output is not None:
+        doc.save(output)
+        return None
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def render_job(job):
+    """Worker: phân tích và xuất .docx cho một file, không bao giờ ném lỗi ra ngoài (lỗi ghi vào report)."""
+    name, source, output_dir, template = job
+    output = Path(output_dir) / (Path(name).with_suffix('.docx').as_posix().replace('/', '__'))
+    try:
+        render_report(analyze_workbook(open_source(source), with_context=False), output, template=template)
+    except Exception as e:
+        return {'source_file': name, 'status': 'error', 'output': '', 'error': f"{type(e).__name__}: {e}"}
+    return {'source_file': name, 'status': 'ok', 'output': str(output), 'error': ''}
+
+
+def render_portfolio(source, output_dir, workers=None, template=DEFAULT_TEMPLATE):
+    """Xuất báo cáo .docx cho mọi file trong thư mục/zip `source` trên process pool; trả về DataFrame trạng thái."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(name, workbook, str(output_dir), template) for name, workbook in iter_workbooks(source)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        reports = [render_job(job) for job in jobs]
+    else:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(render_job, jobs, chunksize=chunksize))
+    return pd.DataFrame(reports, columns=REPORT_COLUMNS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xuất báo cáo thẩm định .docx cho các file BCTC trong thư mục hoặc file zip.")
+    parser.add_argument('source', help="Thư mục hoặc file .zip chứa các file Excel BCTC")
+    parser.add_argument('-o', '--output', default='bctc_reports', help="Thư mục ghi file .docx")
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE, help="File mẫu .docx")
+    parser.add_argument('--workers', type=int, default=None, help="Số process (mặc định: số CPU)")
+    args = parser.parse_args(argv)
+
+    df_report = render_portfolio(args.source, args.output, workers=args.workers, template=args.template)
+    df_report.to_csv(Path(args.output) / 'report.csv', index=False, encoding='utf-8-sig')
+
+    n_errors = int((df_report['status'] == 'error').sum())
+    print(f"Đã xuất {len(df_report) - n_errors}/{len(df_report)} báo cáo. Kết quả: {args.output}")
+    return 1 if n_errors and n_errors == len(df_report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
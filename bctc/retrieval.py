@@ -0,0 +1,145 @@
+"""Truy xuất cục bộ các dòng 'Chỉ tiêu' liên quan tới câu hỏi chat (BM25, thuần Python/NumPy).
+
+Mỗi dòng của các bảng đã xử lý (BĐKT, KQKD, tỷ trọng chi phí, hệ số tài chính) là
+một "tài liệu" gồm nhãn đã chuẩn hóa (bỏ dấu, bỏ số thứ tự). Với mỗi câu hỏi, chỉ
+các dòng có điểm BM25 cao nhất, các dòng tổng cộng và toàn bộ bảng hệ số tài chính
+được đưa vào bối cảnh gửi Gemini, thay vì gửi toàn bộ báo cáo. Câu hỏi không khớp
+dòng nào (vd. "đánh giá tổng quan") dùng lại bối cảnh gọn theo ngân sách token.
+
+Không gọi mạng, không cần thư viện ngoài NumPy/pandas.
+"""
+import math
+import re
+
+import numpy as np
+
+from .context import CODE_LEGEND, compact_rows
+from .formatting import ROW_TOTAL, classify_rows
+from .index import normalize_label
+
+DEFAULT_TOP_K = 12
+# Bỏ các dòng chỉ khớp từ phổ biến ('hàng' trong 'bán hàng'...): điểm < tỷ lệ này x điểm cao nhất
+MIN_SCORE_RATIO = 0.35
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+# Từ hỏi/hư từ thường gặp trong câu hỏi, không mang nghĩa chỉ tiêu
+STOPWORDS = {'la', 'cua', 'the', 'nao', 'va', 'cho', 'toi', 'hay', 'gi', 'bao', 'nhieu', 'khong', 'nhu', 've', 'sao'}
+# Cụm từ yêu cầu phân tích trong câu hỏi (đã chuẩn hóa), bỏ khỏi truy vấn trước khi tách từ
+QUERY_PHRASES = re.compile(r'\b(?:danh gia|phan tich|so sanh|thay doi|nhan xet|tang|giam|xu huong)\b')
+
+TABLES = [
+    ('bs', 'df_bs_processed', "BẢNG CÂN ĐỐI KẾ TOÁN"),
+    ('is', 'df_is_processed', "BÁO CÁO KẾT QUẢ KINH DOANH"),
+    ('cost_ratios', 'df_ratios_processed', "TỶ TRỌNG CHI PHÍ/DOANH THU THUẦN (%)"),
+    ('key_ratios', 'df_financial_ratios_processed', "CÁC HỆ SỐ TÀI CHÍNH CHỦ CHỐT (Thanh toán, Hoạt động, Cấu trúc Vốn, Sinh lời)"),
+    ('cf', 'df_cf_processed', "BÁO CÁO LƯU CHUYỂN TIỀN TỆ"),
+    ('cash_ratios', 'df_cash_ratios_processed', "CÁC HỆ SỐ DÒNG TIỀN (Chất lượng dòng tiền, Khả năng trả nợ bằng tiền)"),
+]
+
+
+def tokenize(text):
+    """'IV. Hàng tồn kho' -> ['hang', 'ton', 'kho', 'hang ton', 'ton kho'] (từ đơn + cặp từ liền kề)."""
+    words = [word for word in _TOKEN_RE.findall(normalize_label(text)) if word not in STOPWORDS]
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+class BM25Index:
+    """Chỉ mục BM25 dạng posting list: từ -> (mảng id tài liệu, mảng tần suất)."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(documents)
+        postings = {}
+        lengths = np.zeros(self.size, dtype='float64')
+        for doc_id, text in enumerate(documents):
+            tokens = tokenize(text)
+            lengths[doc_id] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+        avg_length = lengths.mean() if self.size and lengths.mean() > 0 else 1.0
+        self._norm = k1 * (1 - b + b * lengths / avg_length)
+        self._postings = {
+            token: (np.fromiter(counts.keys(), dtype='int64'), np.fromiter(counts.values(), dtype='float64'))
+            for token, counts in postings.items()
+        }
+
+    def idf(self, token):
+        doc_ids, _ = self._postings[token]
+        return math.log(1 + (self.size - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+
+    def scores(self, query):
+        """Điểm BM25 của mọi tài liệu với câu truy vấn (mảng độ dài = số tài liệu)."""
+        scores = np.zeros(self.size, dtype='float64')
+        for token in set(tokenize(QUERY_PHRASES.sub(' ', normalize_label(query)))):
+            if token not in self._postings:
+                continue
+            doc_ids, tf = self._postings[token]
+            scores[doc_ids] += self.idf(token) * tf * (self.k1 + 1) / (tf + self._norm[doc_ids])
+        return scores
+
+    def search(self, query, top_k=DEFAULT_TOP_K, min_score_ratio=MIN_SCORE_RATIO):
+        """[(id tài liệu, điểm)] của tối đa top_k tài liệu đủ điểm, điểm giảm dần."""
+        scores = self.scores(query)
+        hits = np.flatnonzero((scores > 0) & (scores >= min_score_ratio * scores.max(initial=0)))
+        hits = hits[np.argsort(-scores[hits], kind='stable')][:top_k]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in hits]
+
+
+class LineItemRetriever:
+    """Truy xuất dòng liên quan trên các bảng đã xử lý của một AnalysisResult."""
+
+    def __init__(self, frames, period_labels, top_k=DEFAULT_TOP_K, fallback_context=None):
+        """`frames`: {tên bảng trong AnalysisResult: DataFrame} (như TABLES).
+
+        `fallback_context`: bối cảnh dùng khi câu hỏi không khớp dòng nào (None: chỉ dòng tổng cộng + hệ số).
+        """
+        self.period_labels = list(period_labels)
+        self.top_k = top_k
+        self.fallback_context = fallback_context
+        self.tables = {}
+        self.documents = []  # [(loại bảng, vị trí dòng)]
+        texts = []
+        for kind, name, title in TABLES:
+            df = frames.get(name)
+            if df is None or df.empty:
+                continue
+            header, lines = compact_rows(df, kind)
+            kinds = classify_rows(df['Chỉ tiêu'])
+            self.tables[kind] = (title, header, lines, kinds)
+            for pos, label in enumerate(df['Chỉ tiêu'].astype(str)):
+                self.documents.append((kind, pos))
+                texts.append(label)
+        self.index = BM25Index(texts)
+
+    @classmethod
+    def from_result(cls, result, top_k=DEFAULT_TOP_K):
+        frames = {name: getattr(result, name) for _, name, _ in TABLES}
+        return cls(frames, result.period_labels, top_k=top_k, fallback_context=result.chat_context)
+
+    def relevant_rows(self, question):
+        """{loại bảng: tập vị trí dòng} liên quan tới câu hỏi (chưa gồm dòng tổng cộng)."""
+        selected = {}
+        for doc_id, _ in self.index.search(question, self.top_k):
+            kind, pos = self.documents[doc_id]
+            selected.setdefault(kind, set()).add(pos)
+        return selected
+
+    def context_for(self, question):
+        """Bối cảnh CSV gọn chỉ gồm các dòng liên quan + dòng tổng cộng + toàn bộ bảng hệ số tài chính."""
+        selected = self.relevant_rows(question)
+        if not selected and self.fallback_context is not None:
+            return self.fallback_context
+        periods = ', '.join(f"K{k} = {label}" for k, label in enumerate(self.period_labels, start=1))
+        parts = [f"**DỮ LIỆU TÀI CHÍNH LIÊN QUAN ĐẾN CÂU HỎI (Kỳ: {periods})**\n{CODE_LEGEND}"]
+        for kind, (title, header, lines, kinds) in self.tables.items():
+            if kind == 'key_ratios':
+                keep = range(len(lines))
+            else:
+                keep = sorted(selected.get(kind, set()) | {pos for pos, row_kind in enumerate(kinds) if row_kind == ROW_TOTAL})
+                if not keep:
+                    continue
+                title = f"{title} (các dòng liên quan, {len(keep)}/{len(lines)} dòng)"
+            parts.append(f"**{title}:**\n" + '\n'.join([header] + [lines[pos] for pos in keep]))
+        return '\n\n'.join(parts) + '\n'
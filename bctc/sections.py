@@ -0,0 +1,78 @@
+"""Chia báo cáo thành các phần độc lập để nhận xét riêng (BĐKT, KQKD, tỷ trọng chi phí, từng nhóm hệ số).
+
+Mỗi phần chỉ mang bảng dữ liệu của nó (CSV gọn như bctc.context), nên các phần có
+thể được gửi cho Gemini song song (bctc.ai.analyze_sections_async) hoặc diễn giải
+cục bộ. Không gọi mạng.
+"""
+import os
+from dataclasses import dataclass
+
+from .context import CODE_LEGEND, compact_rows, estimate_tokens, materiality
+from .engine import RATIO_DEFINITIONS
+
+# Ngân sách token cho bảng dữ liệu của mỗi phần (BĐKT/KQKD dài được lược theo mức trọng yếu)
+SECTION_TOKEN_BUDGET = int(os.environ.get('BCTC_SECTION_TOKEN_BUDGET', 3000))
+
+
+@dataclass
+class Section:
+    """Một phần của bản nhận xét: khóa, tiêu đề, trọng tâm phân tích và dữ liệu CSV gọn."""
+    key: str
+    title: str
+    focus: str
+    data: str
+
+
+# (khóa, tiêu đề, bảng trong AnalysisResult, loại bảng, nhóm hệ số, trọng tâm phân tích)
+SECTION_DEFINITIONS = [
+    ('bs_structure', "Cơ cấu Tài sản và Nguồn vốn", 'df_bs_processed', 'bs', None,
+     "tốc độ tăng trưởng và sự thay đổi cơ cấu tài sản, nguồn vốn (tỷ trọng trên tổng tài sản/nguồn vốn)"),
+    ('is_trend', "Xu hướng Kết quả Kinh doanh", 'df_is_processed', 'is', None,
+     "xu hướng doanh thu, giá vốn, chi phí và lợi nhuận qua các kỳ"),
+    ('cost_ratios', "Tỷ trọng Chi phí/Doanh thu thuần", 'df_ratios_processed', 'cost_ratios', None,
+     "tỷ trọng các khoản chi phí trên doanh thu thuần và mức độ kiểm soát chi phí"),
+    ('liquidity', "Khả năng Thanh toán", 'df_financial_ratios_processed', 'key_ratios', 'Liquidity',
+     "khả năng thanh toán ngắn hạn và thanh toán nhanh"),
+    ('activity', "Hiệu quả Hoạt động", 'df_financial_ratios_processed', 'key_ratios', 'Activity',
+     "vòng quay tồn kho, phải thu, vốn lưu động và số ngày tương ứng"),
+    ('solvency', "Cấu trúc Vốn", 'df_financial_ratios_processed', 'key_ratios', 'Solvency',
+     "hệ số tự tài trợ và hệ số nợ trên vốn chủ sở hữu"),
+    ('profitability', "Khả năng Sinh lời", 'df_financial_ratios_processed', 'key_ratios', 'Profitability',
+     "ROS, ROA và ROE"),
+]
+
+
+def _budgeted_lines(df, lines, token_budget):
+    """Các dòng CSV theo thứ tự gốc, ưu tiên dòng trọng yếu cho tới khi hết `token_budget`."""
+    scores = materiality(df)
+    used = 0
+    keep = set()
+    for pos in sorted(range(len(lines)), key=lambda pos: -scores[pos]):
+        tokens = estimate_tokens(lines[pos]) + 1
+        if used + tokens > token_budget:
+            continue
+        keep.add(pos)
+        used += tokens
+    return [line for pos, line in enumerate(lines) if pos in keep]
+
+
+def build_sections(result, token_budget=None):
+    """[Section] có dữ liệu của một AnalysisResult, theo thứ tự SECTION_DEFINITIONS."""
+    budget = SECTION_TOKEN_BUDGET if token_budget is None else token_budget
+    periods = ', '.join(f"K{k} = {label}" for k, label in enumerate(result.period_labels, start=1))
+    groups = {name: group for _, name, group in RATIO_DEFINITIONS}
+    sections = []
+    for key, title, frame, kind, group, focus in SECTION_DEFINITIONS:
+        df = getattr(result, frame)
+        if df is None or df.empty:
+            continue
+        if group is not None:
+            df = df[df['Chỉ tiêu'].map(groups).eq(group)].reset_index(drop=True)
+            if df.empty:
+                continue
+        header, lines = compact_rows(df, kind)
+        if kind in ('bs', 'is'):
+            lines = _budgeted_lines(df, lines, budget)
+        data = f"Kỳ: {periods}\n{CODE_LEGEND}\n\n**{title}:**\n" + '\n'.join([header] + lines)
+        sections.append(Section(key=key, title=title, focus=focus, data=data))
+    return sections
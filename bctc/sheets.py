@@ -0,0 +1,209 @@
+"""Nhận diện sheet của workbook nhiều sheet / nhiều đơn vị (BCTC hợp nhất, công ty con).
+
+Mỗi sheet chỉ được đọc PROBE_ROWS dòng đầu (pandas dừng đọc openpyxl read-only sau số dòng
+cần) để phân loại theo từ khóa và tìm dòng header cùng các cột kỳ (dòng đầu nếu có cột kỳ,
+không thì dòng 'CHỈ TIÊU' đầu tiên):
+
+- 'bs': BĐKT (có thể kèm KQKD bên dưới như Sheet 1 hiện nay);
+- 'is': KQKD nằm ở sheet riêng;
+- 'cf': Lưu chuyển tiền tệ; 'notes': Thuyết minh; 'other': còn lại.
+
+Các sheet được gom theo đơn vị từ tên sheet ('CtyA - BĐKT', 'CtyA - KQKD' -> 'CtyA'); chỉ
+sheet của đơn vị được chọn mới được đọc đầy đủ (bctc.ingest.parse_workbook(sheets=...)).
+Workbook 40 sheet tốn 40 lần đọc vài chục dòng thay vì 40 lần đọc cả sheet.
+"""
+import os
+import re
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from .engine import CASH_RATIO_DEFINITIONS, RATIO_DEFINITIONS
+from .ingest import (
+    HEADER_KEYWORD,
+    MIN_PERIODS,
+    default_excel_engine,
+    detect_period_columns,
+    header_name,
+    period_names,
+)
+from .pipeline import analyze_workbook
+from .telemetry import span
+
+PROBE_ROWS = int(os.environ.get('BCTC_PROBE_ROWS', 30))
+
+# Loại sheet -> từ khóa (không phân biệt hoa/thường). Loại có từ khóa xuất hiện sớm nhất
+# (theo dòng) được chọn; bằng nhau thì theo thứ tự khai báo.
+SHEET_KIND_KEYWORDS = {
+    'cf': ['LƯU CHUYỂN TIỀN TỆ', 'LƯU CHUYỂN TIỀN THUẦN'],
+    'is': ['KẾT QUẢ HOẠT ĐỘNG KINH DOANH', 'DOANH THU THUẦN', 'LỢI NHUẬN SAU THUẾ'],
+    'bs': ['CÂN ĐỐI KẾ TOÁN', 'TÀI SẢN NGẮN HẠN', 'TỔNG CỘNG TÀI SẢN', 'TỔNG CỘNG NGUỒN VỐN'],
+    # Không dùng 'Thuyết minh' trơn: đó cũng là tên cột trong header các bảng
+    'notes': ['THUYẾT MINH BÁO CÁO', 'BẢN THUYẾT MINH'],
+}
+
+# Phần tên sheet chỉ loại báo cáo, bỏ đi khi suy ra tên đơn vị
+STATEMENT_TOKENS = re.compile(
+    r'\b(BCTC|BĐKT|BDKT|CĐKT|CDKT|KQKD|KQHĐKD|KQHDKD|LCTT|TM|Thuyết minh|Cân đối kế toán|'
+    r'Kết quả kinh doanh|Lưu chuyển tiền tệ|Sheet\s*\d*)\b',
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class SheetInfo:
+    """Kết quả đọc thử một sheet."""
+    name: str
+    kind: str  # 'bs', 'is', 'cf', 'notes', 'other'
+    index: int = 0  # Vị trí sheet trong workbook
+    header_row: int = 0  # Dòng header (chỉ số 0 trong sheet): dòng đầu, hoặc dòng 'CHỈ TIÊU' nếu dòng đầu không có cột kỳ
+    period_cols: list = field(default_factory=list)  # Cột kỳ ở dòng header, mới -> cũ
+
+
+@dataclass
+class EntitySheets:
+    """Các sheet của một đơn vị; BĐKT bắt buộc, KQKD riêng/LCTT nếu có."""
+    name: str
+    balance_sheet: SheetInfo
+    income_sheet: SheetInfo = None  # None: KQKD nằm dưới BĐKT trong cùng sheet
+    cash_flow_sheet: SheetInfo = None
+
+    def cache_key(self):
+        """Khóa (tên sheet, dòng header) các sheet được đọc, dùng cho bctc.cache."""
+        sheets = (self.balance_sheet, self.income_sheet, self.cash_flow_sheet)
+        return tuple((info.name, info.header_row) for info in sheets if info is not None)
+
+    def is_default(self):
+        """Bố cục mặc định (BĐKT, KQKD, LCTT chung Sheet 1, header ở dòng đầu): đọc như file một đơn vị."""
+        return (
+            self.income_sheet is None and self.cash_flow_sheet is None
+            and self.balance_sheet.index == 0 and self.balance_sheet.header_row == 0
+        )
+
+    def describe(self):
+        if self.income_sheet is None and self.cash_flow_sheet is None:
+            return f"sheet '{self.balance_sheet.name}'"
+        parts = [f"BĐKT: sheet '{self.balance_sheet.name}'"]
+        if self.income_sheet is not None:
+            parts.append(f"KQKD: sheet '{self.income_sheet.name}'")
+        if self.cash_flow_sheet is not None:
+            parts.append(f"LCTT: sheet '{self.cash_flow_sheet.name}'")
+        return ', '.join(parts)
+
+
+def row_texts(df_probe):
+    """Chuỗi (chữ thường) ghép các ô không trống của từng dòng."""
+    return [' '.join(str(value) for value in row if pd.notna(value)).casefold() for row in df_probe.itertuples(index=False)]
+
+
+def classify_sheet(texts):
+    """Loại sheet từ row_texts() của các dòng đầu."""
+    first_rows = {}
+    for kind, keywords in SHEET_KIND_KEYWORDS.items():
+        keywords = [keyword.casefold() for keyword in keywords]
+        row = next((i for i, text in enumerate(texts) if any(keyword in text for keyword in keywords)), None)
+        if row is not None:
+            first_rows[kind] = row
+    if not first_rows:
+        return 'other'
+    order = list(SHEET_KIND_KEYWORDS)
+    return min(first_rows, key=lambda kind: (first_rows[kind], order.index(kind)))
+
+
+def probe_sheet(xls, sheet_name, probe_rows=PROBE_ROWS):
+    """SheetInfo từ `probe_rows` dòng đầu của sheet."""
+    index = xls.sheet_names.index(sheet_name)
+    df_probe = xls.parse(sheet_name, header=None, nrows=probe_rows)
+    if df_probe.empty:
+        return SheetInfo(name=sheet_name, kind='other', index=index)
+    texts = row_texts(df_probe)
+    # Dòng đầu có cột kỳ là header (như parse_sheet mặc định), dù nhãn cột đầu là 'TÀI SẢN' thay vì
+    # 'CHỈ TIÊU'; chỉ khi không có mới tìm dòng 'CHỈ TIÊU' bên dưới (sheet có dòng tiêu đề phía trên)
+    header_row = 0
+    period_cols = detect_period_columns([header_name(value) for value in df_probe.iloc[0]])
+    if not period_cols:
+        header_keyword = HEADER_KEYWORD.casefold()
+        header_row = next((i for i, text in enumerate(texts) if header_keyword in text), 0)
+        period_cols = detect_period_columns([header_name(value) for value in df_probe.iloc[header_row]])
+    return SheetInfo(name=sheet_name, kind=classify_sheet(texts), index=index, header_row=header_row, period_cols=period_cols)
+
+
+def probe_workbook(source, engine=None, probe_rows=PROBE_ROWS):
+    """[SheetInfo] của mọi sheet theo thứ tự trong workbook; `source` có thể là pd.ExcelFile đang mở."""
+    xls = source if isinstance(source, pd.ExcelFile) else pd.ExcelFile(source, engine=engine or default_excel_engine())
+    try:
+        with span('sheet_probe') as s:
+            sheets = [probe_sheet(xls, name, probe_rows) for name in xls.sheet_names]
+            s.attrs['sheets'] = len(sheets)
+        return sheets
+    finally:
+        if xls is not source:
+            xls.close()
+
+
+def entity_name(sheet_name):
+    """Tên đơn vị từ tên sheet: bỏ phần chỉ loại báo cáo ('CtyA - BĐKT' -> 'CtyA'); '' nếu không còn gì."""
+    name = STATEMENT_TOKENS.sub(' ', sheet_name)
+    return re.sub(r'\s+', ' ', name).strip(' -_.,()[]')
+
+
+def group_entities(sheets):
+    """[EntitySheets] theo thứ tự sheet BĐKT; sheet KQKD/LCTT được ghép với BĐKT cùng tên đơn vị.
+
+    Sheet BĐKT không đủ MIN_PERIODS cột kỳ ở dòng header bị bỏ qua. Nếu workbook chỉ có
+    một đơn vị, sheet KQKD/LCTT được ghép với đơn vị đó dù tên sheet khác nhau.
+    """
+    entities = {}
+    for info in sheets:
+        if info.kind == 'bs' and len(info.period_cols) >= MIN_PERIODS:
+            key = entity_name(info.name).casefold()
+            if key in entities:
+                key = info.name.casefold()  # Hai sheet BĐKT cùng tên đơn vị: tách riêng theo tên sheet
+            entities[key] = EntitySheets(name=entity_name(info.name) or info.name, balance_sheet=info)
+    for info in sheets:
+        attribute = {'is': 'income_sheet', 'cf': 'cash_flow_sheet'}.get(info.kind)
+        if attribute is None:
+            continue
+        entity = entities.get(entity_name(info.name).casefold())
+        if entity is None and len(entities) == 1:
+            entity = next(iter(entities.values()))
+        if entity is not None and getattr(entity, attribute) is None:
+            setattr(entity, attribute, info)
+    return list(entities.values())
+
+
+def discover_entities(source, engine=None, probe_rows=PROBE_ROWS):
+    """group_entities(probe_workbook(source)): các đơn vị phân tích được trong workbook."""
+    return group_entities(probe_workbook(source, engine=engine, probe_rows=probe_rows))
+
+
+def analyze_entities(source, entities, engine=None, **options):
+    """{tên đơn vị: AnalysisResult} cho các `entities` đã chọn; workbook chỉ được mở một lần.
+
+    `options` như analyze_workbook (max_periods, with_context, token_budget).
+    """
+    xls = pd.ExcelFile(source, engine=engine or default_excel_engine())
+    try:
+        return {entity.name: analyze_workbook(xls, sheets=entity, **options) for entity in entities}
+    finally:
+        xls.close()
+
+
+def compare_entities(results):
+    """Bảng hệ số chủ chốt (và hệ số dòng tiền) kỳ gần nhất của nhiều đơn vị đặt cạnh nhau.
+
+    `results` là {tên đơn vị: AnalysisResult}; cột '<đơn vị> (<nhãn kỳ>)' theo thứ tự của dict.
+    Hệ số dòng tiền chỉ có dòng khi ít nhất một đơn vị có LCTT.
+    """
+    definitions = RATIO_DEFINITIONS
+    if any(not result.df_cash_ratios_processed.empty for result in results.values()):
+        definitions = RATIO_DEFINITIONS + CASH_RATIO_DEFINITIONS
+    df = pd.DataFrame({'Chỉ tiêu': [name for _, name, _ in definitions]})
+    for name, result in results.items():
+        ratios = pd.concat([result.df_financial_ratios_processed, result.df_cash_ratios_processed], ignore_index=True)
+        if ratios.empty:
+            continue
+        last_period = period_names(len(result.period_labels))[-1]
+        values = ratios.set_index('Chỉ tiêu')[last_period]
+        df[f'{name} ({result.period_labels[-1]})'] = df['Chỉ tiêu'].map(values)
+    return df
@@ -0,0 +1,265 @@
+"""Đo thời gian, bộ nhớ và kích thước dữ liệu của từng bước (pipeline, định dạng bảng, gọi Gemini).
+
+    with Recorder() as recorder:          # gom các span của một lượt chạy
+        with span('excel_parse') as s:    # span lồng nhau được, không cần truyền recorder
+            df = read_first_sheet(...)
+            s.set_shape(df)
+    recorder.records()                    # [dict] để hiển thị/ghi log
+
+Recorder đang hoạt động nằm trong một ContextVar nên các module trong ``bctc`` chỉ cần
+gọi ``span()``; ngoài Recorder, span vẫn đo thời gian và cộng vào bộ đếm. Mỗi span kết
+thúc được:
+
+- ghi một dòng JSON vào logger ``bctc.telemetry`` (mức INFO, xem configure_logging);
+- cộng vào bộ đếm kiểu Prometheus (METRICS), đọc qua start_metrics_server ('/metrics').
+
+Bộ nhớ đỉnh (tracemalloc) chỉ đo khi tracemalloc đang bật: Recorder(trace_memory=True)
+hoặc BCTC_TRACE_MEMORY=1. tracemalloc làm chậm các bước pandas đáng kể nên mặc định tắt.
+Đỉnh bộ nhớ của span đo từ lúc vào span; span chạy song song (asyncio) dùng chung số đo.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACE_MEMORY = os.environ.get('BCTC_TRACE_MEMORY', '0') == '1'
+# Cổng HTTP cho '/metrics' (0 = không mở)
+METRICS_PORT = int(os.environ.get('BCTC_METRICS_PORT', 0))
+METRICS_HOST = os.environ.get('BCTC_METRICS_HOST', '127.0.0.1')
+
+logger = logging.getLogger('bctc.telemetry')
+
+_active_recorder = contextvars.ContextVar('bctc_recorder', default=None)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+@dataclass
+class Span:
+    """Một bước đã đo: thời gian (ms), bộ nhớ đỉnh (KB, None nếu không đo) và số dòng/cột dữ liệu."""
+    name: str
+    depth: int = 0
+    start_ms: float = 0.0  # tính từ lúc Recorder bắt đầu
+    wall_ms: float = 0.0
+    peak_kb: float = None
+    rows: int = None
+    cols: int = None
+    error: str = None
+    attrs: dict = field(default_factory=dict)
+
+    def set_shape(self, *frames):
+        """Tổng số dòng và số cột của các DataFrame mà bước này tạo ra (bỏ qua None)."""
+        frames = [df for df in frames if df is not None]
+        self.rows = sum(df.shape[0] for df in frames)
+        self.cols = sum(df.shape[1] for df in frames)
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_users = 1
+        elif _tracing_users:
+            _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users:
+            _tracing_users -= 1
+            if _tracing_users == 0:
+                tracemalloc.stop()
+
+
+class Recorder:
+    """Gom các span của một lượt chạy (một lần phân tích, một lần rerun của app)."""
+
+    def __init__(self, trace_memory=None):
+        self.trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+        self.run_id = uuid.uuid4().hex[:12]
+        self.spans = []
+        self._stack = []  # [[span, bộ nhớ lúc vào, đỉnh lớn nhất thấy được], ...]
+        self._start = time.perf_counter()
+        self._token = None
+
+    def open(self):
+        """Bắt đầu gom span (như `with`, dùng khi không bọc được cả đoạn mã, vd. script Streamlit)."""
+        if self._token is not None:
+            return self
+        if self.trace_memory:
+            _start_tracing()
+        self._start = time.perf_counter()
+        self._token = _active_recorder.set(self)
+        return self
+
+    def close(self):
+        """Ngừng gom span; gọi nhiều lần không sao (lượt chạy bị dừng giữa chừng được đóng ở lượt sau)."""
+        if self._token is None:
+            return
+        try:
+            _active_recorder.reset(self._token)
+        except ValueError:
+            # Token thuộc ngữ cảnh khác (đóng từ lượt chạy sau)
+            if _active_recorder.get() is self:
+                _active_recorder.set(None)
+        self._token = None
+        if self.trace_memory:
+            _stop_tracing()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def records(self):
+        """[dict] các span theo thứ tự bắt đầu."""
+        return [asdict(s) for s in sorted(self.spans, key=lambda s: s.start_ms)]
+
+    def _enter_span(self, s):
+        s.depth = len(self._stack)
+        s.start_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                parent[2] = max(parent[2], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([s, current, current])
+        else:
+            self._stack.append([s, None, None])
+
+    def _exit_span(self, s):
+        entry = next(entry for entry in reversed(self._stack) if entry[0] is s)
+        self._stack.remove(entry)
+        if entry[1] is not None and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], entry[2])
+            s.peak_kb = round((peak - entry[1]) / 1024, 1)
+            if self._stack and self._stack[-1][2] is not None:
+                self._stack[-1][2] = max(self._stack[-1][2], peak)
+        self.spans.append(s)
+
+
+def current_recorder():
+    """Recorder đang hoạt động trong ngữ cảnh hiện tại, hoặc None."""
+    return _active_recorder.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Đo một bước; `attrs` (vd. model=...) được ghi kèm. Lỗi được ghi tên lớp rồi ném tiếp."""
+    recorder = _active_recorder.get()
+    s = Span(name=name, attrs=attrs)
+    if recorder is not None:
+        recorder._enter_span(s)
+    start = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.wall_ms = round((time.perf_counter() - start) * 1000, 3)
+        if recorder is not None:
+            recorder._exit_span(s)
+        METRICS.observe(s)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'event': 'bctc.span',
+                'ts': round(time.time(), 3),
+                'run_id': recorder.run_id if recorder is not None else None,
+                **asdict(s),
+            }, ensure_ascii=False, default=str))
+
+
+class StageMetrics:
+    """Bộ đếm cộng dồn theo tên bước, xuất ở định dạng văn bản của Prometheus."""
+
+    # (tên metric, kiểu, mô tả)
+    SERIES = [
+        ('bctc_stage_calls_total', 'counter', "Số lần chạy bước"),
+        ('bctc_stage_errors_total', 'counter', "Số lần bước kết thúc bằng lỗi"),
+        ('bctc_stage_seconds_total', 'counter', "Tổng thời gian chạy bước (giây)"),
+        ('bctc_stage_rows_total', 'counter', "Tổng số dòng dữ liệu bước tạo ra"),
+        ('bctc_stage_peak_bytes_max', 'gauge', "Bộ nhớ đỉnh lớn nhất của bước (byte, khi bật tracemalloc)"),
+    ]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # tên bước -> [calls, errors, seconds, rows, peak_bytes]
+
+    def observe(self, s):
+        with self._lock:
+            stats = self._stats.setdefault(s.name, [0, 0, 0.0, 0, 0])
+            stats[0] += 1
+            stats[1] += s.error is not None
+            stats[2] += s.wall_ms / 1000
+            stats[3] += s.rows or 0
+            if s.peak_kb is not None:
+                stats[4] = max(stats[4], int(s.peak_kb * 1024))
+
+    def snapshot(self):
+        with self._lock:
+            return {name: list(stats) for name, stats in self._stats.items()}
+
+    def render(self):
+        """Văn bản định dạng Prometheus (text exposition 0.0.4)."""
+        snapshot = self.snapshot()
+        lines = []
+        for pos, (metric, kind, help_text) in enumerate(self.SERIES):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name in sorted(snapshot):
+                value = snapshot[name][pos]
+                lines.append(f'{metric}{{stage="{name}"}} {round(value, 6) if isinstance(value, float) else value}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = StageMetrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = METRICS.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Mở 'http://host:port/metrics' trên thread nền; trả về server (None nếu `port` = 0)."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='bctc-metrics', daemon=True).start()
+    return server
+
+
+def configure_logging(level=logging.INFO, stream=None):
+    """Ghi log span (mỗi dòng một JSON) ra `stream` (mặc định stderr); gọi một lần khi khởi động."""
+    if any(getattr(handler, '_bctc_telemetry', False) for handler in logger.handlers):
+        return logger
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler._bctc_telemetry = True
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
@@ -0,0 +1,60 @@
+"""Đo độ trễ mỗi lượt chat với client Gemini dùng chung (pool) và client tạo mới mỗi lượt.
+
+Dùng mock server local (benchmarks/mock_gemini_server.py), nên con số phản ánh chi phí
+tạo client + thiết lập kết nối, không phải thời gian sinh câu trả lời của Gemini.
+
+Chạy:
+    python benchmarks/bench_gemini_client.py --turns 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bctc.ai import get_client, new_client, stream_chat_response  # noqa: E402
+from mock_gemini_server import start_server  # noqa: E402
+
+CONTEXT = "| Chỉ tiêu | 31/12/2024 |\n|:--|:--|\n| TỔNG CỘNG TÀI SẢN | 31.286 |"
+HISTORY = [{"role": "assistant", "content": "Xin chào!"}]
+
+
+def run_turns(turns, make_client):
+    latencies = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        text = "".join(stream_chat_response("Tổng tài sản?", HISTORY, CONTEXT, 'mock-key', client=make_client()))
+        latencies.append(time.perf_counter() - start)
+        assert "triệu đồng" in text, text
+    return latencies
+
+
+def summary(name, latencies):
+    ms = sorted(x * 1000 for x in latencies)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    return f"{name:<22} trung bình {statistics.mean(ms):7.2f} ms | trung vị {statistics.median(ms):7.2f} ms | p95 {p95:7.2f} ms"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=50)
+    parser.add_argument('--first-token-delay', type=float, default=0.0, help="Giây, giả lập thời gian chờ token đầu")
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(first_token_delay=args.first_token_delay)
+    try:
+        fresh = run_turns(args.turns, lambda: new_client('mock-key', base_url=base_url))
+        pooled = run_turns(args.turns, lambda: get_client('mock-key', base_url=base_url))
+    finally:
+        server.shutdown()
+
+    print(f"Số lượt: {args.turns}")
+    print(summary("Client mới mỗi lượt:", fresh))
+    print(summary("Client dùng chung:", pooled))
+
+
+if __name__ == '__main__':
+    main()
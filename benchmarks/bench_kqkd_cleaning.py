@@ -0,0 +1,117 @@
+"""So sánh tốc độ bước tách/làm sạch KQKD: bản apply theo dòng (cũ) và bản vector hóa.
+
+Chạy:
+    python benchmarks/bench_kqkd_cleaning.py --rows 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bctc.ingest import HEADER_KEYWORD, SPLIT_KEYWORD, clean_income_statement, split_statements  # noqa: E402
+
+PERIODS = ['2024-12-31 00:00:00', '2023-12-31 00:00:00', '2022-12-31 00:00:00']
+
+
+def make_raw_sheet(rows, seed=0):
+    """Sheet chung BĐKT + KQKD với `rows` dòng KQKD; ~1/3 tên chỉ tiêu bị dịch sang cột 'Mã số'."""
+    rng = np.random.default_rng(seed)
+    columns = ['Chỉ tiêu', 'Mã số', 'Thuyết minh'] + PERIODS
+    bs = pd.DataFrame({
+        'Chỉ tiêu': [f'Khoản mục BĐKT {i}' for i in range(50)],
+        'Mã số': '100', 'Thuyết minh': None,
+        **{p: rng.uniform(1e3, 1e6, 50).round() for p in PERIODS},
+    })
+    labels = np.array([f'{i}. Chỉ tiêu KQKD {i}' for i in range(rows)], dtype=object)
+    shifted = rng.random(rows) < 1 / 3
+    is_rows = pd.DataFrame({
+        'Chỉ tiêu': np.where(shifted, None, labels),
+        'Mã số': np.where(shifted, labels, '01'),
+        'Thuyết minh': None,
+        **{p: rng.uniform(1e3, 1e6, rows).round() for p in PERIODS},
+    })
+    marker = pd.DataFrame([[None, SPLIT_KEYWORD, None] + [None] * 3, ['CHỈ TIÊU', 'Mã số', 'Thuyết minh'] + PERIODS],
+                          columns=columns)
+    return pd.concat([bs, marker, is_rows], ignore_index=True)
+
+
+# --- Bản cũ (trước khi vector hóa), giữ lại để đo so sánh ---
+def legacy_split_and_clean(df_raw):
+    df_raw_full = df_raw.rename(columns={df_raw.columns[0]: 'Chỉ tiêu'})
+    # fillna('') trước khi nối chuỗi: từ pandas 3, astype(str) giữ nguyên NaN nên phép nối ra NaN
+    df_raw_full['Chỉ tiêu'] = df_raw_full['Chỉ tiêu'].fillna('').astype(str)
+    search_col = df_raw_full['Chỉ tiêu'] + ' ' + df_raw_full[df_raw_full.columns[1]].fillna('').astype(str)
+    split_index = df_raw_full[search_col.str.contains(SPLIT_KEYWORD, case=False, na=False)].index[0]
+    df_raw_is = df_raw_full.loc[split_index:].copy()
+
+    df_is_str = df_raw_is.apply(lambda col: col.astype(str))
+    header_mask = df_is_str.apply(lambda row: row.str.contains(HEADER_KEYWORD, case=False, na=False).any(), axis=1)
+    header_row_index = df_raw_is[header_mask].index[0]
+    new_header = df_raw_is.loc[header_row_index]
+    df_raw_is = df_raw_is.loc[header_row_index+1:]
+    df_raw_is.columns = new_header
+    df_raw_is = df_raw_is.rename(columns={df_raw_is.columns[0]: 'Chỉ tiêu'})
+    df_raw_is.columns = [str(col) for col in df_raw_is.columns]
+
+    potential_name_cols = [col for i, col in enumerate(df_raw_is.columns) if i > 0 and i < 4]
+    for name_col in potential_name_cols:
+        df_raw_is[name_col] = df_raw_is[name_col].fillna('').astype(str).str.strip()
+        df_raw_is['Chỉ tiêu'] = df_raw_is.apply(
+            lambda row: row[name_col] if pd.isna(row['Chỉ tiêu']) or str(row['Chỉ tiêu']).strip() == '' else row['Chỉ tiêu'],
+            axis=1
+        )
+    df_raw_is['Chỉ tiêu'] = df_raw_is['Chỉ tiêu'].fillna('').astype(str).str.strip()
+    df_raw_is = df_raw_is[df_raw_is['Chỉ tiêu'].str.len() > 0].copy()
+    df_raw_is = df_raw_is[df_raw_is['Chỉ tiêu'].astype(str) != '0'].copy()
+    df_raw_is[PERIODS[-1]] = pd.to_numeric(df_raw_is[PERIODS[-1]], errors='coerce')
+    return df_raw_is[df_raw_is[PERIODS[-1]].notnull()].copy()
+
+
+def vectorized_split_and_clean(df_raw):
+    notes = []
+    _, df_raw_is = split_statements(df_raw, notes)
+    df_raw_is.columns = [str(col) for col in df_raw_is.columns]
+    return clean_income_statement(df_raw_is, PERIODS[-1], notes)
+
+
+def assert_same_output(legacy, new):
+    """So các dòng giữ lại, tên chỉ tiêu và cột năm dùng để lọc của hai bản."""
+    pd.testing.assert_index_equal(legacy.index, new.index)
+    pd.testing.assert_series_equal(legacy['Chỉ tiêu'], new['Chỉ tiêu'], check_dtype=False)
+    pd.testing.assert_series_equal(legacy[PERIODS[-1]], new[PERIODS[-1]], check_dtype=False)
+
+
+def best_of(func, df_raw, repeat):
+    timings = []
+    for _ in range(repeat):
+        df = df_raw.copy()
+        start = time.perf_counter()
+        result = func(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000, help="Số dòng KQKD")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    df_raw = make_raw_sheet(args.rows)
+    # Hai bản phải cho cùng kết quả thì so tốc độ mới có nghĩa
+    assert_same_output(legacy_split_and_clean(df_raw.copy()), vectorized_split_and_clean(df_raw.copy()))
+    legacy_time, _ = best_of(legacy_split_and_clean, df_raw, args.repeat)
+    new_time, _ = best_of(vectorized_split_and_clean, df_raw, args.repeat)
+
+    print(f"Số dòng KQKD: {args.rows:,}")
+    print(f"apply theo dòng (cũ): {legacy_time * 1000:9.1f} ms")
+    print(f"vector hóa (mới):     {new_time * 1000:9.1f} ms")
+    print(f"Tăng tốc: x{legacy_time / new_time:.1f}")
+
+if __name__ == '__main__':
+    main()
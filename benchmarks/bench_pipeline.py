@@ -0,0 +1,275 @@
+"""Đo thời gian từng bước của pipeline trên workbook giả lập và ghi kết quả ra JSON.
+
+Các bước: đọc Excel, tách BĐKT/KQKD, làm sạch KQKD, process_financial_data,
+filter_zero_rows, định dạng Styler (như bảng hiển thị trên app), dựng context
+Markdown (to_markdown) và context CSV gọn cho Chatbot; thêm analyze_workbook trọn gói.
+File được sinh bởi benchmarks/synthetic_workbook.py theo lưới (số dòng x số kỳ x bố cục).
+
+Mỗi lần chạy ghi một file JSON (phiên bản engine, commit, thư viện, cấu hình, thời
+gian min/trung vị/trung bình mỗi bước). `--baseline` so với file JSON của lần chạy
+trước và trả mã lỗi 1 nếu có bước chậm hơn ngưỡng, để theo dõi hồi quy giữa các phiên bản.
+
+Trước khi đo, mỗi file (và một BĐKT ngắn với header 'TÀI SẢN' theo mẫu cũ) được kiểm tra:
+đọc qua nhận diện sheet (bctc.sheets) phải cho cùng kết quả với đọc mặc định Sheet 1.
+
+Chạy:
+    python benchmarks/bench_pipeline.py --sizes 60:30 2000:800 --periods 3 8 --output v6.json
+    python benchmarks/bench_pipeline.py --output v7.json --baseline v6.json
+"""
+import argparse
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bctc.context import build_chat_context, build_compact_context, format_col_name  # noqa: E402
+from bctc.engine import filter_zero_rows, process_financial_data  # noqa: E402
+from bctc.formatting import classify_rows, column_formatters, style_financial_table  # noqa: E402
+from bctc.ingest import (  # noqa: E402
+    clean_income_statement,
+    default_excel_engine,
+    detect_period_columns,
+    header_name,
+    parse_statements,
+    read_first_sheet,
+    split_statements,
+)
+from bctc.pipeline import ENGINE_VERSION, analyze_workbook  # noqa: E402
+from bctc.sheets import discover_entities  # noqa: E402
+from synthetic_workbook import workbook_bytes  # noqa: E402
+
+# Tăng khi đổi cấu trúc file JSON kết quả
+BENCH_SCHEMA_VERSION = 1
+
+STAGES = [
+    'excel_parse',
+    'split',
+    'kqkd_clean',
+    'process_financial_data',
+    'filter_zero_rows',
+    'styler_format',
+    'markdown_context',
+    'compact_context',
+    'analyze_workbook',
+]
+
+# Thứ tự bảng như trong process_financial_data, với loại bảng của bctc.formatting
+TABLE_KINDS = ['bs', 'is', 'cost_ratios', 'key_ratios']
+PROCESSED_TABLES = ['df_bs_processed', 'df_is_processed', 'df_financial_ratios_processed', 'df_cf_processed']
+
+
+class StageTimer:
+    """Cộng dồn thời gian (giây) theo tên bước: `with timer('split'): ...`."""
+
+    def __init__(self):
+        self.timings = {}
+        self._stage = None
+
+    def __call__(self, stage):
+        self._stage = stage
+        return self
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings.setdefault(self._stage, []).append(time.perf_counter() - self._start)
+
+
+def run_once(data, timer):
+    """Chạy từng bước một lần trên nội dung file `data`; dữ liệu đầu vào của mỗi bước được chuẩn bị ngoài vùng đo."""
+    with timer('excel_parse'):
+        df_raw = read_first_sheet(io.BytesIO(data))
+
+    notes = []
+    with timer('split'):
+        df_raw_bs, df_raw_is = split_statements(df_raw, notes)
+
+    df_raw_is = df_raw_is.copy()
+    df_raw_is.columns = [header_name(col) for col in df_raw_is.columns]
+    first_period = detect_period_columns(df_raw_bs.columns)[-1]
+    with timer('kqkd_clean'):
+        clean_income_statement(df_raw_is, first_period, notes)
+
+    parsed = parse_statements(df_raw)
+    df_bs, df_is = parsed.df_bs.copy(), parsed.df_is.copy()
+    with timer('process_financial_data'):
+        frames = process_financial_data(df_bs, df_is)
+
+    with timer('filter_zero_rows'):
+        frames = [filter_zero_rows(df) for df in frames]
+
+    styles = []
+    for df, kind in zip(frames, TABLE_KINDS):
+        columns = [(col, col, formatter) for col, formatter in column_formatters(df, kind).items()]
+        styles.append((df, columns, classify_rows(df['Chỉ tiêu'])))
+    with timer('styler_format'):
+        # to_html() buộc Styler tính CSS/định dạng như khi Streamlit gửi bảng đi
+        for df, columns, row_kinds in styles:
+            style_financial_table(df, columns, row_kinds).to_html()
+
+    period_labels = [format_col_name(col) for col in parsed.period_cols]
+    with timer('markdown_context'):
+        build_chat_context(*frames, period_labels)
+    with timer('compact_context'):
+        build_compact_context(*frames, period_labels)
+
+    with timer('analyze_workbook'):
+        analyze_workbook(io.BytesIO(data))
+
+
+def check_sheet_probe(data):
+    """File một sheet: analyze_workbook(sheets=đơn vị nhận diện được) phải giống analyze_workbook mặc định."""
+    entities = discover_entities(io.BytesIO(data))
+    assert len(entities) == 1, [entity.describe() for entity in entities]
+    default = analyze_workbook(io.BytesIO(data), with_context=False)
+    probed = analyze_workbook(io.BytesIO(data), with_context=False, sheets=entities[0])
+    for name in PROCESSED_TABLES:
+        pd.testing.assert_frame_equal(getattr(probed, name), getattr(default, name), obj=name)
+
+
+def summarize(seconds):
+    ms = [s * 1000 for s in seconds]
+    return {
+        'min_ms': round(min(ms), 3),
+        'median_ms': round(statistics.median(ms), 3),
+        'mean_ms': round(statistics.mean(ms), 3),
+        'runs': len(ms),
+    }
+
+
+def case_key(bs_rows, is_rows, periods, layout):
+    return f"bs{bs_rows}-is{is_rows}-p{periods}-{layout}"
+
+
+def run_case(bs_rows, is_rows, periods, layout, repeat, warmup=1):
+    data = workbook_bytes(bs_rows=bs_rows, is_rows=is_rows, periods=periods, messy=layout == 'messy')
+    check_sheet_probe(data)
+    for _ in range(warmup):
+        run_once(data, StageTimer())
+    timer = StageTimer()
+    for _ in range(repeat):
+        run_once(data, timer)
+    return {
+        'case': case_key(bs_rows, is_rows, periods, layout),
+        'bs_rows': bs_rows,
+        'is_rows': is_rows,
+        'periods': periods,
+        'layout': layout,
+        'file_bytes': len(data),
+        'stages': {stage: summarize(timer.timings[stage]) for stage in STAGES},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    try:
+        import openpyxl
+        openpyxl_version = openpyxl.__version__
+    except ImportError:
+        openpyxl_version = None
+    return {
+        'engine_version': ENGINE_VERSION,
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'openpyxl': openpyxl_version,
+        'excel_engine': default_excel_engine() or 'openpyxl',
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """[(case, stage, ms cũ, ms mới, tỷ lệ)] của các bước có trung vị chậm hơn `threshold` lần so với baseline."""
+    previous = {case['case']: case['stages'] for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old_stages = previous.get(case['case'], {})
+        for stage, stats in case['stages'].items():
+            old = old_stages.get(stage)
+            if not old or old['median_ms'] <= 0:
+                continue
+            ratio = stats['median_ms'] / old['median_ms']
+            if ratio > threshold:
+                regressions.append((case['case'], stage, old['median_ms'], stats['median_ms'], ratio))
+    return regressions
+
+
+def print_case(case):
+    print(f"\n{case['case']} ({case['file_bytes'] / 1024:.0f} KB)")
+    for stage, stats in case['stages'].items():
+        print(f"  {stage:<24} trung vị {stats['median_ms']:9.2f} ms | min {stats['min_ms']:9.2f} ms")
+
+
+def parse_size(text):
+    bs_rows, is_rows = text.split(':')
+    return int(bs_rows), int(is_rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=[(60, 30), (500, 200), (2000, 800)],
+                        metavar='BS:IS', help="Số dòng BĐKT:KQKD của mỗi file giả lập")
+    parser.add_argument('--periods', nargs='+', type=int, default=[3, 5])
+    parser.add_argument('--layout', choices=['clean', 'messy', 'both'], default='both')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='bench_pipeline.json', help="File JSON kết quả")
+    parser.add_argument('--baseline', help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument('--threshold', type=float, default=1.2, help="Tỷ lệ trung vị mới/cũ bị coi là hồi quy")
+    args = parser.parse_args(argv)
+
+    layouts = ['clean', 'messy'] if args.layout == 'both' else [args.layout]
+    # BĐKT ngắn, header 'TÀI SẢN': header KQKD 'CHỈ TIÊU' nằm trong các dòng đọc thử của bctc.sheets
+    for messy in (False, True):
+        check_sheet_probe(workbook_bytes(bs_rows=10, is_rows=3, messy=messy, asset_header=True))
+    results = {
+        'schema_version': BENCH_SCHEMA_VERSION,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'config': {'repeat': args.repeat, 'stages': STAGES},
+        'cases': [],
+    }
+    for (bs_rows, is_rows), periods, layout in itertools.product(args.sizes, args.periods, layouts):
+        case = run_case(bs_rows, is_rows, periods, layout, args.repeat)
+        results['cases'].append(case)
+        print_case(case)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nĐã ghi {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for case, stage, old_ms, new_ms, ratio in regressions:
+            print(f"CHẬM HƠN  {case:<28} {stage:<24} {old_ms:9.2f} -> {new_ms:9.2f} ms (x{ratio:.2f})")
+        if regressions:
+            sys.exit(1)
+        print(f"Không có bước nào chậm hơn x{args.threshold} so với {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
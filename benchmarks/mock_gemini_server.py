@@ -0,0 +1,90 @@
+"""Mock server Gemini API chạy local để đo độ trễ mỗi lượt chat (không cần API key, không tốn quota).
+
+Trả lời `models/<model>:generateContent` (JSON) và `:streamGenerateContent?alt=sse` (SSE)
+với độ trễ giả lập cho token đầu tiên và giữa các đoạn.
+
+Chạy riêng:
+    python benchmarks/mock_gemini_server.py --port 8765
+    BCTC_GEMINI_BASE_URL=http://127.0.0.1:8765/ streamlit run python.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNKS = ["Tổng tài sản ", "tăng trưởng ổn định ", "qua các kỳ ", "(đơn vị: triệu đồng)."]
+
+
+def _response_json(text):
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+    }
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Cho phép keep-alive
+    first_token_delay = 0.0
+    chunk_delay = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        time.sleep(self.first_token_delay)
+
+        if ':streamGenerateContent' in self.path:
+            body = b''
+            for i, chunk in enumerate(CHUNKS):
+                if i:
+                    time.sleep(self.chunk_delay)
+                body += b'data: ' + json.dumps(_response_json(chunk), ensure_ascii=False).encode() + b'\r\n\r\n'
+            content_type = 'text/event-stream'
+        elif ':generateContent' in self.path:
+            body = json.dumps(_response_json(''.join(CHUNKS)), ensure_ascii=False).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(port=0, first_token_delay=0.0, chunk_delay=0.0):
+    """Chạy server trong thread nền; trả về (server, base_url)."""
+    handler = type('Handler', (MockGeminiHandler,), {
+        'first_token_delay': first_token_delay,
+        'chunk_delay': chunk_delay,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--first-token-delay', type=float, default=0.0, help="Giây")
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help="Giây")
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(args.port, args.first_token_delay, args.chunk_delay)
+    print(f"Mock Gemini đang chạy tại {base_url} (Ctrl+C để dừng)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Sinh file Excel BCTC giả lập để đo hiệu năng: BĐKT và 'KẾT QUẢ HOẠT ĐỘNG KINH DOANH' chung Sheet 1.
+
+Bố cục giống file thật mà bctc.ingest đang đọc: header sheet là 'CHỈ TIÊU', 'Mã số',
+'Thuyết minh' và các cột kỳ (mới -> cũ), dòng đầu là dòng so sánh (SS) bị bỏ, dòng
+tách KQKD, rồi dòng header 'CHỈ TIÊU' thứ hai của KQKD. Các chỉ tiêu mà engine cần
+(TSNH, HTK, Nợ ngắn hạn, DT thuần, LNST, ...) luôn có; phần còn lại là dòng chi tiết
+giả lập, khoảng 10% bằng 0 ở mọi kỳ để bước filter_zero_rows có việc làm.
+
+`messy=True` thêm các kiểu lộn xộn hay gặp: header kỳ trộn Timestamp/chuỗi ngày/năm,
+cột kỳ trùng, cột trống và cột ghi chú, header KQKD viết thường có khoảng trắng, từ
+khóa tách nằm ở cột 'Mã số', tên chỉ tiêu KQKD bị dịch sang cột 'Mã số', dòng trống
+và dòng chú thích không có số.
+
+`cash_flow=True` thêm 'BÁO CÁO LƯU CHUYỂN TIỀN TỆ' (phương pháp gián tiếp) sau KQKD, có
+dòng header 'CHỈ TIÊU' riêng như file thật.
+
+`asset_header=True` đặt 'TÀI SẢN' làm nhãn cột đầu của header sheet (mẫu BĐKT cũ, dòng
+đầu không có chữ 'CHỈ TIÊU'; chỉ header KQKD bên dưới mới có).
+
+`group_workbook_bytes` sinh workbook hợp nhất nhiều sheet: mỗi công ty một sheet BCTC chung
+(hoặc hai sheet BĐKT/KQKD riêng, KQKD có dòng tiêu đề phía trên header), một sheet LCTT,
+và các sheet thuyết minh dài để đo chi phí nhận diện sheet (bctc.sheets).
+
+Chạy:
+    python benchmarks/synthetic_workbook.py sample.xlsx --bs-rows 500 --is-rows 200 --periods 5 --messy
+    python benchmarks/synthetic_workbook.py group.xlsx --entities 4 --split-entities 2 --note-sheets 30
+"""
+import argparse
+import io
+
+import numpy as np
+import pandas as pd
+
+# (tên chỉ tiêu, mã số, tỷ lệ trên tổng tài sản)
+BS_CORE = [
+    ('A. TÀI SẢN NGẮN HẠN', '100', 0.55),
+    ('I. Tiền và các khoản tương đương tiền', '110', 0.08),
+    ('III. Các khoản phải thu ngắn hạn', '130', 0.18),
+    ('1. Phải thu ngắn hạn của khách hàng', '131', 0.14),
+    ('IV. Hàng tồn kho', '140', 0.22),
+    ('V. Tài sản ngắn hạn khác', '150', 0.07),
+    ('B. TÀI SẢN DÀI HẠN', '200', 0.45),
+    ('II. Tài sản cố định', '220', 0.35),
+    ('- Nguyên giá', '222', 0.55),
+    ('- Giá trị hao mòn lũy kế', '223', -0.20),
+    ('TỔNG CỘNG TÀI SẢN', '270', 1.0),
+    ('C. NỢ PHẢI TRẢ', '300', 0.50),
+    ('I. Nợ ngắn hạn', '310', 0.35),
+    ('3. Vay và nợ thuê tài chính ngắn hạn', '320', 0.12),
+    ('II. Nợ dài hạn', '330', 0.15),
+    ('D. VỐN CHỦ SỞ HỮU', '400', 0.50),
+    ('TỔNG CỘNG NGUỒN VỐN', '440', 1.0),
+]
+# Dòng chi tiết giả lập được chèn trước dòng này của BĐKT
+BS_FILLER_BEFORE = 'B. TÀI SẢN DÀI HẠN'
+
+# (tên chỉ tiêu, mã số, tỷ lệ trên doanh thu thuần)
+IS_CORE = [
+    ('1. Doanh thu bán hàng và cung cấp dịch vụ', '01', 1.03),
+    ('2. Các khoản giảm trừ doanh thu', '02', 0.03),
+    ('3. Doanh thu thuần về bán hàng và cung cấp dịch vụ', '10', 1.0),
+    ('4. Giá vốn hàng bán', '11', 0.78),
+    ('5. Lợi nhuận gộp về bán hàng và cung cấp dịch vụ', '20', 0.22),
+    ('6. Doanh thu hoạt động tài chính', '21', 0.01),
+    ('7. Chi phí tài chính', '22', 0.02),
+    ('- Trong đó: Chi phí lãi vay', '23', 0.015),
+    ('8. Chi phí bán hàng', '25', 0.05),
+    ('9. Chi phí quản lý doanh nghiệp', '26', 0.04),
+    ('10. Lợi nhuận thuần từ hoạt động kinh doanh', '30', 0.12),
+    ('15. Chi phí thuế TNDN hiện hành', '51', 0.024),
+    ('17. Lợi nhuận sau thuế TNDN', '60', 0.096),
+]
+IS_FILLER_BEFORE = '10. Lợi nhuận thuần từ hoạt động kinh doanh'
+
+# (tên chỉ tiêu, mã số, tỷ lệ trên doanh thu thuần); dòng tiền chi ghi số âm như LCTT thật
+CF_CORE = [
+    ('1. Lợi nhuận trước thuế', '01', 0.12),
+    ('- Khấu hao TSCĐ và BĐSĐT', '02', 0.04),
+    ('- Chi phí lãi vay', '06', 0.015),
+    ('3. Lợi nhuận từ hoạt động kinh doanh trước thay đổi vốn lưu động', '08', 0.175),
+    ('- Tăng, giảm các khoản phải thu', '09', -0.02),
+    ('- Tăng, giảm hàng tồn kho', '10', -0.03),
+    ('- Tiền lãi vay đã trả', '14', -0.015),
+    ('- Thuế thu nhập doanh nghiệp đã nộp', '15', -0.02),
+    ('Lưu chuyển tiền thuần từ hoạt động kinh doanh', '20', 0.09),
+    ('1. Tiền chi để mua sắm, xây dựng TSCĐ và các tài sản dài hạn khác', '21', -0.05),
+    ('2. Tiền thu từ thanh lý, nhượng bán TSCĐ và các tài sản dài hạn khác', '22', 0.005),
+    ('Lưu chuyển tiền thuần từ hoạt động đầu tư', '30', -0.045),
+    ('3. Tiền thu từ đi vay', '33', 0.08),
+    ('4. Tiền trả nợ gốc vay', '34', -0.07),
+    ('6. Cổ tức, lợi nhuận đã trả cho chủ sở hữu', '36', -0.02),
+    ('Lưu chuyển tiền thuần từ hoạt động tài chính', '40', -0.01),
+    ('Lưu chuyển tiền thuần trong năm', '50', 0.035),
+]
+CASH_FLOW_TITLE = 'BÁO CÁO LƯU CHUYỂN TIỀN TỆ'
+
+SPLIT_ROW = 'KẾT QUẢ HOẠT ĐỘNG KINH DOANH'
+LABEL_HEADERS = ['CHỈ TIÊU', 'Mã số', 'Thuyết minh']
+ASSET_HEADER = 'TÀI SẢN'  # Nhãn cột đầu của header BĐKT theo mẫu cũ (asset_header=True)
+LAST_PERIOD_YEAR = 2024
+
+
+def period_headers(periods, messy=False):
+    """Header các cột kỳ (mới -> cũ). Bản lộn xộn trộn Timestamp, chuỗi 'YYYY-MM-DD' và chuỗi năm 'YYYY'."""
+    headers = []
+    for k in range(periods):
+        year = LAST_PERIOD_YEAR - k
+        if not messy or k % 3 == 0:
+            headers.append(pd.Timestamp(f'{year}-12-31'))
+        elif k % 3 == 1:
+            headers.append(f'{year}-12-31')
+        else:
+            headers.append(str(year))
+    return headers
+
+
+def _statement_rows(core, filler_before, n_rows, scale, filler_name, rng):
+    """[(tên, mã số, mảng giá trị theo kỳ)]: các dòng cốt lõi và n_rows - len(core) dòng chi tiết."""
+    n_periods = len(scale)
+    fillers = []
+    for i in range(max(0, n_rows - len(core))):
+        if rng.random() < 0.1:
+            values = np.zeros(n_periods)
+        else:
+            values = scale * rng.uniform(0.0005, 0.01) * rng.normal(1.0, 0.1, n_periods)
+        fillers.append((f'{i % 9 + 1}. {filler_name} {i + 1}', f'{1000 + i}', values))
+    rows = []
+    for label, code, share in core:
+        if label == filler_before:
+            rows.extend(fillers)
+        rows.append((label, code, scale * share * rng.normal(1.0, 0.03, n_periods)))
+    return [(label, code, np.round(values)) for label, code, values in rows]
+
+
+def cash_flow_rows(revenue, rng):
+    """[(tên, mã số, mảng giá trị theo kỳ cũ -> mới)] của LCTT theo doanh thu thuần từng kỳ."""
+    return [(label, code, np.round(revenue * share * rng.normal(1.0, 0.1, len(revenue)))) for label, code, share in CF_CORE]
+
+
+def synthetic_sheet(bs_rows=60, is_rows=30, periods=3, messy=False, seed=0, cash_flow=False, asset_header=False):
+    """DataFrame của Sheet 1 (tên cột = dòng header của sheet), sẵn sàng ghi bằng to_excel(index=False)."""
+    rng = np.random.default_rng(seed)
+    # Quy mô theo kỳ, cũ -> mới; cột trong sheet xếp mới -> cũ
+    growth = np.cumprod(np.r_[1.0, rng.normal(1.08, 0.1, periods - 1)])
+    total_assets = rng.uniform(5e10, 5e12) * growth
+    revenue = total_assets * rng.uniform(0.8, 1.5) * rng.normal(1.0, 0.05, periods)
+    bs = _statement_rows(BS_CORE, BS_FILLER_BEFORE, bs_rows, total_assets, 'Khoản mục chi tiết', rng)
+    is_ = _statement_rows(IS_CORE, IS_FILLER_BEFORE, is_rows, revenue, 'Chỉ tiêu KQKD chi tiết', rng)
+
+    headers = period_headers(periods, messy)
+    n_cols = len(LABEL_HEADERS) + periods
+
+    def row(label, code, values, note=None):
+        return [label, code, note] + list(values[::-1])
+
+    rows = [row('SS', None, np.round(rng.uniform(0.9, 1.2, periods), 4))]
+    rows += [row(label, code, values) for label, code, values in bs]
+    if messy:
+        # Từ khóa tách ở cột 'Mã số', có chữ thừa
+        rows.append([None, 'BÁO CÁO ' + SPLIT_ROW + ' (tiếp theo)'] + [None] * (n_cols - 2))
+        rows.append(['  chỉ tiêu  ', 'mã số', 'thuyết minh'] + headers)
+        rows.append(['(Đơn vị tính: đồng)'] + [None] * (n_cols - 1))
+    else:
+        rows.append([SPLIT_ROW] + [None] * (n_cols - 1))
+        rows.append(LABEL_HEADERS + headers)
+    shifted = rng.random(len(is_)) < (0.25 if messy else 0.0)
+    for (label, code, values), shift in zip(is_, shifted):
+        # Tên chỉ tiêu bị dịch sang cột 'Mã số' (cột 0 trống) như file xuất từ một số phần mềm kế toán
+        rows.append(row(None, label, values) if shift else row(label, code, values))
+    if cash_flow:
+        rows.append([CASH_FLOW_TITLE + ' (Theo phương pháp gián tiếp)'] + [None] * (n_cols - 1))
+        rows.append(LABEL_HEADERS + headers)
+        rows += [row(label, code, values) for label, code, values in cash_flow_rows(revenue, rng)]
+
+    df = pd.DataFrame(rows, columns=LABEL_HEADERS + headers)
+    if asset_header:
+        df = df.rename(columns={LABEL_HEADERS[0]: ASSET_HEADER})
+    if messy:
+        # Dòng trống rải rác, cột trống, cột ghi chú và một cột kỳ bị lặp (cùng ngày, khác kiểu)
+        blank = rng.choice(len(bs), size=max(1, len(bs) // 50), replace=False) + 1
+        df = pd.concat([df, pd.DataFrame([[None] * n_cols] * len(blank), columns=df.columns, index=blank - 0.5)])
+        df = df.sort_index().reset_index(drop=True)
+        df.insert(len(LABEL_HEADERS), 'Unnamed', None)
+        df['Ghi chú'] = np.where(rng.random(len(df)) < 0.05, 'Đã kiểm toán', None)
+        duplicate = f'{LAST_PERIOD_YEAR}-12-31 (lặp)'
+        df[duplicate] = df[headers[0]]
+        df.loc[df['Mã số'].eq('mã số'), duplicate] = duplicate
+    return df
+
+
+def write_workbook(target, **options):
+    """Ghi workbook giả lập ra `target` (đường dẫn hoặc file-like); `options` như synthetic_sheet."""
+    synthetic_sheet(**options).to_excel(target, index=False)
+    return target
+
+
+def workbook_bytes(**options):
+    """Nội dung file .xlsx giả lập (bytes), dùng như file tải lên."""
+    return write_workbook(io.BytesIO(), **options).getvalue()
+
+
+def _write_rows(writer, sheet_name, rows):
+    pd.DataFrame(rows).to_excel(writer, sheet_name=sheet_name, index=False, header=False)
+
+
+def write_group_workbook(target, entities=3, split_entities=1, note_sheets=0, note_rows=500,
+                         bs_rows=60, is_rows=30, periods=3, seed=0):
+    """Workbook nhiều đơn vị: công ty k dùng synthetic_sheet(seed=seed + k).
+
+    `split_entities` công ty đầu có BĐKT và KQKD ở hai sheet riêng ('Cty k - BĐKT', 'Cty k - KQKD');
+    các công ty còn lại một sheet chung ('Cty k - BCTC'). Mỗi công ty thêm sheet 'Cty k - LCTT';
+    cuối workbook là `note_sheets` sheet thuyết minh, mỗi sheet `note_rows` dòng.
+    """
+    rng = np.random.default_rng(seed)
+    with pd.ExcelWriter(target) as writer:
+        for k in range(1, entities + 1):
+            df = synthetic_sheet(bs_rows=bs_rows, is_rows=is_rows, periods=periods, seed=seed + k)
+            period_columns = df.columns[len(LABEL_HEADERS):]
+            name = f'Cty {k}'
+            if k <= split_entities:
+                split = df.index[df['CHỈ TIÊU'].eq(SPLIT_ROW)][0]
+                df.iloc[:split].to_excel(writer, sheet_name=f'{name} - BĐKT', index=False)
+                title = ['BÁO CÁO ' + SPLIT_ROW] + [None] * (df.shape[1] - 1)
+                _write_rows(writer, f'{name} - KQKD', [title] + df.iloc[split + 1:].values.tolist())
+            else:
+                df.to_excel(writer, sheet_name=f'{name} - BCTC', index=False)
+            revenue = df.loc[df['CHỈ TIÊU'].eq(IS_CORE[2][0]), period_columns].iloc[0].to_numpy(dtype=float)[::-1]
+            cash_flow = [[CASH_FLOW_TITLE], LABEL_HEADERS + period_headers(periods)]
+            cash_flow += [[label, code, None] + list(values[::-1]) for label, code, values in cash_flow_rows(revenue, rng)]
+            _write_rows(writer, f'{name} - LCTT', cash_flow)
+        for j in range(1, note_sheets + 1):
+            notes = [['THUYẾT MINH BÁO CÁO TÀI CHÍNH HỢP NHẤT'], ['Nội dung', 'Số cuối năm', 'Số đầu năm']]
+            notes += [[f'Chi tiết thuyết minh {j}.{i}', *np.round(rng.uniform(0, 1e10, 2))] for i in range(note_rows)]
+            _write_rows(writer, f'TM {j}', notes)
+    return target
+
+
+def group_workbook_bytes(**options):
+    """Nội dung workbook nhiều đơn vị (bytes); `options` như write_group_workbook."""
+    return write_group_workbook(io.BytesIO(), **options).getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', help="Đường dẫn file .xlsx")
+    parser.add_argument('--bs-rows', type=int, default=60)
+    parser.add_argument('--is-rows', type=int, default=30)
+    parser.add_argument('--periods', type=int, default=3)
+    parser.add_argument('--messy', action='store_true')
+    parser.add_argument('--cash-flow', action='store_true', help="Thêm LCTT sau KQKD")
+    parser.add_argument('--asset-header', action='store_true', help="Header BĐKT 'TÀI SẢN' thay cho 'CHỈ TIÊU'")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--entities', type=int, default=0, help="Số công ty (>0: workbook nhiều sheet)")
+    parser.add_argument('--split-entities', type=int, default=1, help="Số công ty có BĐKT/KQKD ở hai sheet riêng")
+    parser.add_argument('--note-sheets', type=int, default=0, help="Số sheet thuyết minh thêm vào cuối")
+    args = parser.parse_args(argv)
+    if args.entities:
+        write_group_workbook(args.output, entities=args.entities, split_entities=args.split_entities,
+                             note_sheets=args.note_sheets, bs_rows=args.bs_rows, is_rows=args.is_rows,
+                             periods=args.periods, seed=args.seed)
+    else:
+        write_workbook(args.output, bs_rows=args.bs_rows, is_rows=args.is_rows, periods=args.periods,
+                       messy=args.messy, seed=args.seed, cash_flow=args.cash_flow, asset_header=args.asset_header)
+    print(f"Đã ghi {args.output}")
+
+
+if __name__ == '__main__':
+    main()